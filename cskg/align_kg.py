@@ -1,18 +1,56 @@
 # ======================== IMPORTS ========================
+import argparse
 import os
-import numpy as np
+import json
 import csv
-from tqdm import tqdm
-from py2neo import Graph, NodeMatcher, Relationship
+from datetime import datetime
+from py2neo import Graph
+from embed_search import normalize_rows, topk_cosine
+from ann_index import ANN_INDEX_PATH, DEFAULT_NPROBE, load_or_create
 from fuzzywuzzy import fuzz
-from sentence_transformers import SentenceTransformer
+from fuzzy_index import FUZZY_INDEX_PATH, FuzzyIndex, best_matches as fuzzy_best_matches
+from embedding_store import EmbeddingStore, cve_text
+from same_as_bulk import drop_same_as, same_as_stats, write_same_as
+from impacts import propagate_impacts
+from risk_scores import RiskStore
 
 # ======================== CONFIG NEO4J ========================
 uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
 user = os.getenv("NEO4J_USER", "neo4j")
 password = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
 graph = Graph(uri, auth=(user, password))
-matcher = NodeMatcher(graph)
+
+# ======================== ARGUMENTS / ÉTAT ========================
+# Mode incrémental par défaut dès qu'un état existe : seules les CVE Nessus
+# créées/modifiées depuis le dernier alignement réussi (watermark) sont
+# réalignées, plus celles qu'une CVE NVD modifiée peut affecter.
+ALIGN_STATE_PATH = os.getenv("ALIGN_STATE_PATH", "data/align_state.json")
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--full", action="store_true", help="Réaligne toutes les CVE (ignore le watermark)")
+parser.add_argument("--state", default=ALIGN_STATE_PATH, help="Fichier d'état (watermark + alignements)")
+args = parser.parse_args()
+
+def load_align_state(path):
+    if not os.path.exists(path):
+        return {"watermark": None, "matches": {}, "unmatched": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def save_align_state(path, state):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+# Watermark pris avant toute lecture : une écriture concurrente sera revue au prochain passage
+run_started = datetime.utcnow().isoformat()
+state = load_align_state(args.state)
+incremental = (bool(state["watermark"]) and not args.full
+               and os.path.exists(ANN_INDEX_PATH) and os.path.exists(FUZZY_INDEX_PATH))
+since = state["watermark"] if incremental else None
 
 # ======================== CORRECTION SOURCE NESSUS ========================
 graph.run("""
@@ -22,127 +60,286 @@ SET c.source = 'NESSUS'
 """)
 
 # ======================== CHARGEMENT DES CVEs ========================
-print("🔍 Chargement des CVE KG1 (NVD)...")
-kg1_cves = list(matcher.match("CVE").where("_.source = 'NVD'"))
-
-print("🔍 Chargement des CVE KG2 (NESSUS)...")
-kg2_cves = list(matcher.match("CVE").where("_.source = 'NESSUS'"))
-
-print(f"📦 KG1 (NVD): {len(kg1_cves)} CVEs | KG2 (Nessus): {len(kg2_cves)} CVEs")
+Q_KG1 = """
+MATCH (c:CVE) WHERE c.source = 'NVD' AND ($since IS NULL OR c.updated_at > $since)
+RETURN c.name AS name, c.description AS description
+"""
+Q_KG2 = """
+MATCH (c:CVE) WHERE c.source = 'NESSUS'
+  AND ($since IS NULL OR c.updated_at > $since OR c.aligned_at IS NULL)
+RETURN c.name AS name, c.description AS description
+"""
+Q_KG2_BY_NAME = """
+UNWIND $names AS n
+MATCH (c:CVE {name: n, source: 'NESSUS'})
+RETURN c.name AS name, c.description AS description
+"""
+Q_MARK_ALIGNED = """
+UNWIND $names AS n
+MATCH (c:CVE {name: n, source: 'NESSUS'})
+SET c.aligned_at = $now
+"""
 
 def normalize_cve(name):
     return name.strip().upper()
 
-kg1_map = {normalize_cve(n["name"]): n for n in kg1_cves}
-kg2_map = {normalize_cve(n["name"]): n for n in kg2_cves}
-kg1_names = list(kg1_map.keys())
+def raw_kg2(name2):
+    # Nom tel qu'en base d'une CVE Nessus connue de l'état
+    match = state["matches"].get(name2)
+    return match["kg2"] if match else state["unmatched"][name2]
+
+# Référentiel KG1 = index fuzzy persistant (à côté de l'index ANN) : en mode incrémental
+# il est rechargé et seules les CVE NVD du delta y sont insérées, KG1 n'est pas relu.
+# L'index garde le nom en base de chaque CVE : sans lui (index ancien), passage complet.
+THRESHOLD_FUZZY = 90
+if incremental:
+    kg1_index = FuzzyIndex.load(FUZZY_INDEX_PATH, THRESHOLD_FUZZY)
+    if len(kg1_index.raw) < len(kg1_index):
+        print("⚠️ Index fuzzy sans noms KG1 en base : réalignement complet")
+        incremental, since = False, None
+
+print(f"🔍 Mode {'incrémental depuis ' + since if incremental else 'complet'}")
+print("🔍 Chargement des CVE KG1 (NVD)...")
+kg1_map = {normalize_cve(r["name"]): r for r in graph.run(Q_KG1, since=since).data()}
+kg1_raw = {name: r["name"] for name, r in kg1_map.items()}
+if incremental:
+    if kg1_map:
+        kg1_index.add(kg1_map.keys(), raw=kg1_raw)
+        kg1_index.save(FUZZY_INDEX_PATH)
+else:
+    kg1_index = FuzzyIndex(kg1_map.keys(), THRESHOLD_FUZZY, raw=kg1_raw)
+    kg1_index.save(FUZZY_INDEX_PATH)
+kg1_names = kg1_index.names
+
+print("🔍 Chargement des CVE KG2 (NESSUS)...")
+kg2_map = {normalize_cve(r["name"]): r for r in graph.run(Q_KG2, since=since).data()}
+recheck = {}
+if incremental and kg1_map:
+    # CVE déjà alignées sur une CVE NVD modifiée : réalignement complet
+    stale = [m["kg2"] for k, m in state["matches"].items() if normalize_cve(m["kg1"]) in kg1_map and k not in kg2_map]
+    for r in graph.run(Q_KG2_BY_NAME, names=stale).data():
+        kg2_map[normalize_cve(r["name"])] = r
+    # Alignements non exacts et CVE sans correspondance : comparés aux seules CVE NVD modifiées
+    recheck = {k: m for k, m in state["matches"].items() if m["method"] != "exact" and k not in kg2_map}
+    recheck.update({k: None for k in state["unmatched"] if k not in kg2_map})
 kg2_names = list(kg2_map.keys())
 
+if incremental:
+    print(f"📦 Delta KG1 (NVD): {len(kg1_map)} / {len(kg1_names)} CVEs | "
+          f"Delta KG2 (Nessus): {len(kg2_names)} CVEs | à revérifier : {len(recheck)}")
+else:
+    print(f"📦 KG1 (NVD): {len(kg1_names)} CVEs | KG2 (Nessus): {len(kg2_names)} CVEs")
+
 # ======================== EMBEDDINGS ========================
-print("⚙️ Chargement modèle SentenceTransformer...")
-model = SentenceTransformer("all-mpnet-base-v2")
+# Store persistant : seuls les textes nouveaux/modifiés sont encodés, le modèle
+# n'est chargé que si nécessaire
+store = EmbeddingStore()
 
 def get_cve_text(node):
-    return f"{node['name']} {node.get('description', '')}"
-
-print("⚙️ Encodage KG1...")
-kg1_texts = [get_cve_text(kg1_map[name]) for name in kg1_names]
-kg1_emb = model.encode(kg1_texts, convert_to_numpy=True, show_progress_bar=True)
+    return cve_text(node['name'], node.get('description') or '')
 
-print("⚙️ Encodage KG2...")
-kg2_texts = [get_cve_text(kg2_map[name]) for name in kg2_names]
-kg2_emb = model.encode(kg2_texts, convert_to_numpy=True, show_progress_bar=True)
+print("⚙️ Embeddings KG1...")
+kg1_delta_names = list(kg1_map.keys())
+kg1_emb = store.get([get_cve_text(kg1_map[name]) for name in kg1_delta_names])
 
 # ======================== ALIGNEMENT ========================
-THRESHOLD_FUZZY = 90
 THRESHOLD_EMBED = 0.85
+EMBED_BLOCK_SIZE = int(os.getenv("EMBED_BLOCK_SIZE", "4096"))
+EMBED_TOPK = int(os.getenv("EMBED_TOPK", "5"))
+# Index ANN persistant (IVF) au lieu de la recherche exacte : ALIGN_USE_ANN=1.
+# L'index sert aussi de référentiel KG1 en mode incrémental (recherche exacte sur ses vecteurs).
+USE_ANN = os.getenv("ALIGN_USE_ANN", "0") == "1"
+# Vecteurs des CVE Nessus passées par l'embedding, conservés par nom pour la revérification
+KG2_INDEX_PATH = os.getenv("ALIGN_KG2_INDEX_PATH", "data/index/kg2_mpnet_ivf.npz")
+FUZZY_WORKERS = int(os.getenv("FUZZY_WORKERS", "0")) or None
+METHOD_RANK = {"exact": 3, "fuzzy": 2, "embedding": 1}
 stats = {"exact": 0, "fuzzy": 0, "embedding": 0}
-matches_list = []
 relations_created = 0
 
 print("🚀 Début de l'alignement...")
 
-for i2, name2 in tqdm(enumerate(kg2_names), total=len(kg2_names)):
-    n2 = kg2_map[name2]
-    emb2 = kg2_emb[i2]
+# 1. Exact match ; 2. fuzzy via l'index de q-grammes (candidats seuls scorés, multi-cœurs)
+best_matches = {}
+pending_embed = []
+non_exact = []
+for name2 in kg2_names:
+    if name2 in kg1_index:
+        best_matches[name2] = (name2, "exact", 100.0)
+    else:
+        non_exact.append(name2)
+
+print(f"🔎 Matching fuzzy indexé pour {len(non_exact)} CVE...")
+fuzzy_results = fuzzy_best_matches(kg1_names, non_exact, threshold=THRESHOLD_FUZZY, workers=FUZZY_WORKERS,
+                                   index=kg1_index)
+for name2, (best_fuzzy_name, best_fuzzy_score) in zip(non_exact, fuzzy_results):
+    if best_fuzzy_name is not None and best_fuzzy_score >= THRESHOLD_FUZZY:
+        best_matches[name2] = (best_fuzzy_name, "fuzzy", float(best_fuzzy_score))
+    else:
+        pending_embed.append(name2)
 
-    best_match_name = None
-    best_match_method = None
-    best_match_score = None
+# 3. Embedding : matrices normalisées une fois, similarités par blocs, top-k partiel
+ann = None
+if kg1_delta_names:
+    # L'index ANN suit KG1 à chaque exécution (insertion / remplacement par nom)
+    ann = load_or_create(kg1_emb.shape[1])
+    ann.add(kg1_delta_names, kg1_emb)
+    ann.save(ANN_INDEX_PATH)
+    print(f"📥 {len(kg1_delta_names)} CVE NVD indexées (ANN : {len(ann)} au total)")
 
-    try:
-        # 1. Exact match
-        if name2 in kg1_map:
-            best_match_name = name2
-            best_match_method = "exact"
-            best_match_score = 100.0
+kg2_index = None
+if pending_embed and kg1_names:
+    kg2_emb = store.get([get_cve_text(kg2_map[name]) for name in pending_embed])
+    kg2_index = load_or_create(kg2_emb.shape[1], path=KG2_INDEX_PATH)
+    kg2_index.add(pending_embed, kg2_emb)
+    if USE_ANN:
+        print(f"⚙️ Recherche ANN (nprobe={DEFAULT_NPROBE}) pour {len(pending_embed)} CVE...")
+        if ann is None:
+            ann = load_or_create(kg2_emb.shape[1])
+        top_keys, top_scores = ann.search(kg2_emb, k=EMBED_TOPK)
+        for name2, keys, scores in zip(pending_embed, top_keys, top_scores):
+            # L'index peut contenir des CVE NVD d'exécutions précédentes absentes de KG1
+            candidates = [(key, score) for key, score in zip(keys, scores) if key in kg1_index]
+            if candidates and candidates[0][1] >= THRESHOLD_EMBED:
+                best_matches[name2] = (candidates[0][0], "embedding", float(round(candidates[0][1] * 100, 2)))
+    else:
+        if incremental:
+            # Vecteurs KG1 (normalisés) conservés par l'index, pris tels quels : recherche exacte
+            # en un produit matriciel par bloc, sans relire KG1 ni filtrer ses clés en Python
+            if ann is None:
+                ann = load_or_create(kg2_emb.shape[1])
+            base_names, base = ann.keys, ann.vectors
         else:
-            # 2. Fuzzy matching
-            best_fuzzy_score = 0
-            best_fuzzy_name = None
-            for name1 in kg1_names:
-                score = fuzz.ratio(name1, name2)
-                if score > best_fuzzy_score:
-                    best_fuzzy_score = score
-                    best_fuzzy_name = name1
-                if best_fuzzy_score == 100:
-                    break
-            if best_fuzzy_score >= THRESHOLD_FUZZY:
-                best_match_name = best_fuzzy_name
-                best_match_method = "fuzzy"
-                best_match_score = float(best_fuzzy_score)
-            else:
-                # 3. Embedding
-                best_emb_score = 0.0
-                best_emb_idx = -1
-                for i1, emb1 in enumerate(kg1_emb):
-                    sim = float(np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2)))
-                    if sim > best_emb_score:
-                        best_emb_score = sim
-                        best_emb_idx = i1
+            base_names, base = kg1_delta_names, normalize_rows(kg1_emb)
+        print(f"⚙️ Similarité cosine par blocs pour {len(pending_embed)} CVE ({len(base_names)} CVE NVD)...")
+        if base_names:
+            top_idx, top_sim = topk_cosine(normalize_rows(kg2_emb), base, k=EMBED_TOPK,
+                                           block_size=EMBED_BLOCK_SIZE, normalized=True)
+            for row, name2 in enumerate(pending_embed):
+                best_emb_score = float(top_sim[row, 0])
                 if best_emb_score >= THRESHOLD_EMBED:
-                    best_match_name = kg1_names[best_emb_idx]
-                    best_match_method = "embedding"
-                    best_match_score = float(round(best_emb_score * 100, 2))
-
-        # Insertion dans Neo4j
-        if best_match_name:
-            n1 = kg1_map[best_match_name]
-            rel_exists = graph.run("""
-                MATCH (a:CVE)-[:SAME_AS]-(b:CVE)
-                WHERE a.id = $id1 AND b.id = $id2
-                RETURN count(*) as c
-            """, id1=n1.identity, id2=n2.identity).evaluate()
-
-            if not rel_exists:
-                rel = Relationship(n1, "SAME_AS", n2,
-                                   method=best_match_method,
-                                   score=best_match_score)
-                graph.merge(rel)
-                relations_created += 1
-                matches_list.append([n1["name"], n2["name"], best_match_method, best_match_score])
-                stats[best_match_method] += 1
-                print(f"🔗 SAME_AS ({best_match_method} - {best_match_score}): {n1['name']} ↔ {n2['name']}")
-
-    except Exception as e:
-        print(f"⚠️ Erreur sur {name2} : {e}")
-
-print(f"\n✅ Alignement terminé avec {relations_created} relations SAME_AS créées.")
+                    best_matches[name2] = (base_names[top_idx[row, 0]], "embedding",
+                                           float(round(best_emb_score * 100, 2)))
+
+# 4. Revérification incrémentale : une CVE NVD nouvelle/modifiée bat-elle l'alignement existant ?
+def beats(candidate, current):
+    if current is None:
+        return True
+    rank, cur_rank = METHOD_RANK[candidate[1]], METHOD_RANK[current["method"]]
+    return rank > cur_rank or (rank == cur_rank and candidate[2] > current["score"])
+
+improved = {}
+if recheck:
+    # Seules les CVE NVD modifiées interrogent les CVE à revérifier : coût proportionnel au delta KG1
+    print(f"🔁 Revérification de {len(recheck)} CVE contre {len(kg1_delta_names)} CVE NVD modifiées...")
+    exact = {name2: (name2, "exact", 100.0) for name2 in kg1_map if name2 in recheck}
+    pending = [name2 for name2 in recheck if name2 not in exact]
+    recheck_index = FuzzyIndex(pending, THRESHOLD_FUZZY)
+    fuzzy = {}
+    for name1 in kg1_delta_names:
+        for idx in recheck_index.candidates(name1):
+            name2 = recheck_index.names[idx]
+            score = fuzz.ratio(name1, name2)
+            # Premier meilleur score dans l'ordre KG1, comme FuzzyIndex.best_match
+            if score >= THRESHOLD_FUZZY and score > fuzzy.get(name2, (None, None, 0))[2]:
+                fuzzy[name2] = (name1, "fuzzy", float(score))
+    for name2, candidate in {**fuzzy, **exact}.items():
+        if beats(candidate, recheck[name2]):
+            improved[name2] = candidate
+    embed_recheck = [n for n in pending
+                     if n not in fuzzy and (recheck[n] is None or recheck[n]["method"] == "embedding")]
+
+    if embed_recheck:
+        if kg2_index is None:
+            kg2_index = load_or_create(kg1_emb.shape[1], path=KG2_INDEX_PATH)
+        # CVE sans vecteur stocké (état antérieur à l'index KG2) : relues et encodées une seule fois
+        missing = [n for n in embed_recheck if n not in kg2_index]
+        if missing:
+            rows = {normalize_cve(r["name"]): r
+                    for r in graph.run(Q_KG2_BY_NAME, names=[raw_kg2(n) for n in missing]).data()}
+            missing = [n for n in missing if n in rows]
+            if missing:
+                kg2_index.add(missing, store.get([get_cve_text(rows[n]) for n in missing]))
+        embed_recheck = [n for n in embed_recheck if n in kg2_index]
+    if embed_recheck:
+        vecs = kg2_index.vectors[[kg2_index.key_pos[n] for n in embed_recheck]]
+        top_idx, top_sim = topk_cosine(vecs, normalize_rows(kg1_emb), k=1,
+                                       block_size=EMBED_BLOCK_SIZE, normalized=True)
+        for row, name2 in enumerate(embed_recheck):
+            score = float(top_sim[row, 0])
+            candidate = (kg1_delta_names[top_idx[row, 0]], "embedding", float(round(score * 100, 2)))
+            if score >= THRESHOLD_EMBED and beats(candidate, recheck[name2]):
+                improved[name2] = candidate
+    print(f"   ↳ {len(improved)} alignement(s) amélioré(s)")
+if kg2_index is not None:
+    kg2_index.save(KG2_INDEX_PATH)
+best_matches.update(improved)
+
+# Nom en base de la CVE NVD retenue, via l'index KG1 (jamais le nom normalisé : le MATCH
+# échouerait). Une CVE NVD hors index (index ANN plus ancien) ne peut pas être liée.
+unresolved = [n for n, m in best_matches.items() if m[0] not in kg1_index.raw]
+for name2 in unresolved:
+    del best_matches[name2]
+    improved.pop(name2, None)  # revérification : l'alignement existant est conservé
+if unresolved:
+    print(f"⚠️ {len(unresolved)} alignement(s) ignoré(s) : CVE NVD absente de l'index fuzzy")
+
+# Insertion dans Neo4j : lots UNWIND/MERGE sur les noms (ordre KG2 conservé pour l'export CSV)
+alignments, superseded = [], []
+for name2 in kg2_names + list(improved):
+    previous = state["matches"].get(name2)
+    if name2 not in best_matches:
+        if previous:
+            superseded.append({"kg1": previous["kg1"], "kg2": previous["kg2"]})
+        continue
+    best_match_name, best_match_method, best_match_score = best_matches[name2]
+    if previous and normalize_cve(previous["kg1"]) != best_match_name:
+        superseded.append({"kg1": previous["kg1"], "kg2": previous["kg2"]})
+    name_kg2 = kg2_map[name2]["name"] if name2 in kg2_map else raw_kg2(name2)
+    alignments.append({"kg1": kg1_index.raw[best_match_name], "kg2": name_kg2,
+                       "method": best_match_method, "score": best_match_score})
+
+dropped = drop_same_as(graph, superseded) if superseded else 0
+counts, created = write_same_as(graph, alignments)
+relations_created = counts["created"]
+for m in created:
+    stats[m["method"]] += 1
+
+print(f"\n✅ Alignement terminé avec {relations_created} relations SAME_AS créées "
+      f"({counts['existing']} déjà présentes, {dropped} remplacées).")
 print("\n📊 Statistiques :")
 for k, v in stats.items():
     print(f"   • {k:<9}: {v}")
 
+# ======================== MISE À JOUR DE L'ÉTAT ========================
+if not incremental:
+    state["matches"], state["unmatched"] = {}, {}
+for m in alignments:
+    key = normalize_cve(m["kg2"])
+    state["matches"][key] = m
+    state["unmatched"].pop(key, None)
+for name2 in kg2_names:
+    if name2 not in best_matches:
+        state["matches"].pop(name2, None)
+        state["unmatched"][name2] = kg2_map[name2]["name"]
+
+aligned = [kg2_map[n]["name"] for n in kg2_names]
+for i in range(0, len(aligned), 5000):
+    graph.run(Q_MARK_ALIGNED, names=aligned[i:i + 5000], now=run_started)
+state["watermark"] = run_started
+save_align_state(args.state, state)
+# Export CSV : tous les alignements courants (pas seulement ceux créés par ce passage)
+matches_list = [[m["kg1"], m["kg2"], m["method"], m["score"]] for m in state["matches"].values()]
+print(f"💾 État d'alignement enregistré ({args.state}, watermark {run_started})")
+
 # ======================== PROPAGATION IMPACTS ========================
-def propagate_impacts():
-    graph.run("""
-    MATCH (h:Host)-[:HAS_PLUGIN]->(:Plugin)-[:DETECTS]->(c:CVE)-[:SAME_AS]-(c2:CVE)<-[:IMPACTS]-(s:Service)
-    MERGE (h)-[r:IMPACTS]->(s)
-    ON CREATE SET r.inferred = true, r.weight = c2.cvss_score
-    ON MATCH SET r.weight = coalesce(r.weight, 0) + coalesce(c2.cvss_score, 0)
-    """)
-    print("🔁 Propagation IMPACTS terminée.")
+# Agrégats exacts, recalculés pour les seuls hosts touchés depuis le dernier passage
+propagate_impacts(graph, full=args.full)
 
-propagate_impacts()
+# ======================== SCORES DE RISQUE ========================
+# CVE fusionnées ou re-scorées : seuls les findings ouverts qui les détectent sont re-scorés
+risk = RiskStore.load()
+print(f"📊 Scores de risque : {risk.sync_cves(graph)} findings re-scorés")
+risk.save()
 
 # ======================== EXPORT CSV ========================
 os.makedirs("data/predictions", exist_ok=True)
@@ -155,9 +352,7 @@ with open(csv_filename, "w", newline="", encoding="utf-8") as f:
 print(f"📄 Alignements exportés dans {csv_filename}")
 
 # ======================== STATISTIQUES NEO4J ========================
-total_same_as = graph.run("MATCH ()-[r:SAME_AS]->() RETURN count(r) AS total").evaluate()
-print(f"📈 Relations SAME_AS totales en base : {total_same_as}")
+total_same_as, per_method = same_as_stats(graph)
+print(f"📈 Paires SAME_AS en base : {total_same_as}")
 for m in stats.keys():
-    count_m = graph.run("MATCH ()-[r:SAME_AS]->() WHERE r.method = $m RETURN count(r) AS total", m=m).evaluate()
-    print(f"   • {m:<9}: {count_m}")
-
+    print(f"   • {m:<9}: {per_method.get(m, 0)}")
@@ -0,0 +1,189 @@
+# ======================== INDEX ANN (IVF) DES EMBEDDINGS CVE ========================
+# Index approximatif type IVF, CPU uniquement (numpy) : les vecteurs normalisés
+# sont répartis dans `nlist` listes autour de centroïdes k-means ; une requête ne
+# parcourt que les `nprobe` listes les plus proches (compromis rappel / latence).
+# Insertions incrémentales, mise à jour par clé (nom de CVE), sauvegarde .npz.
+import json
+import os
+
+import numpy as np
+
+from embed_search import normalize_rows
+
+ANN_INDEX_PATH = os.getenv("ANN_INDEX_PATH", "data/index/kg1_mpnet_ivf.npz")
+DEFAULT_NPROBE = int(os.getenv("ANN_NPROBE", "8"))
+
+# ======================== 1. K-MEANS (ENTRAÎNEMENT DES CENTROÏDES) ========================
+def kmeans(vectors, n_clusters, n_iter=20, sample_size=100000, seed=0):
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample_size:
+        vectors = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        # Liste vide : on réamorce sur un point au hasard
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+    return centroids
+
+# ======================== 2. INDEX IVF ========================
+class IVFIndex:
+    def __init__(self, dim, nlist=None, nprobe=DEFAULT_NPROBE):
+        self.dim = dim
+        self.nlist = nlist
+        self.auto_nlist = nlist is None
+        self.nprobe = nprobe
+        self.centroids = None
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.assign = np.empty(0, dtype=np.int32)
+        self.keys = []
+        self.key_pos = {}
+        self._lists = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.key_pos
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, vectors=None):
+        vectors = self.vectors if vectors is None else normalize_rows(vectors)
+        # ~sqrt(N) listes, règle usuelle pour un IVF
+        nlist = max(1, int(np.sqrt(len(vectors)))) if self.auto_nlist else self.nlist
+        nlist = min(nlist, len(vectors))
+        self.centroids = kmeans(vectors, nlist)
+        self.nlist = nlist
+        if len(self.vectors):
+            self.assign = self._nearest_lists(self.vectors, 1)[:, 0].astype(np.int32)
+        self._lists = None
+
+    def _nearest_lists(self, vectors, n):
+        sims = vectors @ self.centroids.T
+        n = min(n, sims.shape[1])
+        part = np.argpartition(-sims, n - 1, axis=1)[:, :n]
+        return part
+
+    def add(self, keys, vectors):
+        # Insère ou remplace (même clé) des vecteurs ; entraîne l'index au premier ajout
+        vectors = normalize_rows(vectors)
+        new_rows, new_keys, updated = [], [], []
+        for key, vec in zip(keys, vectors):
+            pos = self.key_pos.get(key)
+            if pos is not None:
+                self.vectors[pos] = vec
+                updated.append(pos)
+            else:
+                self.key_pos[key] = len(self.keys) + len(new_keys)
+                new_keys.append(key)
+                new_rows.append(vec)
+        if updated and self.is_trained:
+            # Réaffectation des vecteurs remplacés en un seul produit matriciel
+            updated = np.array(updated)
+            self.assign[updated] = self._nearest_lists(self.vectors[updated], 1)[:, 0]
+        if new_rows:
+            block = np.vstack(new_rows).astype(np.float32)
+            self.vectors = np.vstack([self.vectors, block])
+            self.keys.extend(new_keys)
+            if self.is_trained:
+                self.assign = np.concatenate(
+                    [self.assign, self._nearest_lists(block, 1)[:, 0].astype(np.int32)])
+        # Réentraînement quand l'index a fortement grossi depuis le dernier k-means
+        if len(self.vectors) and (not self.is_trained or
+                                  (self.auto_nlist and len(self.vectors) >= 4 * self.nlist ** 2)):
+            self.train()
+        self._lists = None
+        return len(new_keys)
+
+    def _inverted_lists(self):
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(self.nlist + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(self.nlist)]
+        return self._lists
+
+    def search(self, queries, k=10, nprobe=None):
+        # Retourne (clés, scores) : listes de longueur len(queries), k résultats max chacune
+        queries = normalize_rows(np.atleast_2d(queries))
+        if not len(self.keys):
+            return [[] for _ in queries], [[] for _ in queries]
+        lists = self._inverted_lists()
+        probes = self._nearest_lists(queries, nprobe or self.nprobe)
+
+        out_keys, out_scores = [], []
+        for q, probe in zip(queries, probes):
+            rows = np.concatenate([lists[p] for p in probe])
+            if not len(rows):
+                out_keys.append([])
+                out_scores.append([])
+                continue
+            sims = self.vectors[rows] @ q
+            kk = min(k, len(rows))
+            top = np.argpartition(-sims, kk - 1)[:kk]
+            top = top[np.argsort(-sims[top], kind="stable")]
+            out_keys.append([self.keys[rows[i]] for i in top])
+            out_scores.append([float(sims[i]) for i in top])
+        return out_keys, out_scores
+
+    def similar(self, key, k=10, nprobe=None):
+        # "CVE similaires" à une CVE déjà indexée (elle-même exclue)
+        keys, scores = self.search(self.vectors[self.key_pos[key]], k=k + 1, nprobe=nprobe)
+        return [(kk, s) for kk, s in zip(keys[0], scores[0]) if kk != key][:k]
+
+    # ======================== 3. PERSISTANCE ========================
+    def save(self, path=ANN_INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp,
+                 vectors=self.vectors,
+                 assign=self.assign,
+                 centroids=self.centroids if self.is_trained else np.empty((0, self.dim), np.float32),
+                 keys=np.array(self.keys, dtype=str),
+                 meta=json.dumps({"dim": self.dim, "nlist": self.nlist, "nprobe": self.nprobe,
+                                  "auto_nlist": self.auto_nlist}))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=ANN_INDEX_PATH):
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        index = cls(meta["dim"], nlist=meta["nlist"], nprobe=meta["nprobe"])
+        index.auto_nlist = meta.get("auto_nlist", False)
+        index.vectors = data["vectors"]
+        index.assign = data["assign"]
+        index.centroids = data["centroids"] if len(data["centroids"]) else None
+        index.keys = [str(k) for k in data["keys"]]
+        index.key_pos = {key: i for i, key in enumerate(index.keys)}
+        return index
+
+def load_or_create(dim, path=ANN_INDEX_PATH, nprobe=DEFAULT_NPROBE):
+    if os.path.exists(path):
+        index = IVFIndex.load(path)
+        if index.dim == dim:
+            index.nprobe = nprobe
+            return index
+        print(f"⚠️ Index ANN {path} de dimension {index.dim} ≠ {dim} : reconstruction.")
+    return IVFIndex(dim, nprobe=nprobe)
+
+# ======================== 4. CLI : CVE SIMILAIRES ========================
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("cve", help="Nom de la CVE (déjà indexée)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=None)
+    parser.add_argument("--index", default=ANN_INDEX_PATH)
+    args = parser.parse_args()
+
+    index = IVFIndex.load(args.index)
+    for name, score in index.similar(args.cve.strip().upper(), k=args.k, nprobe=args.nprobe):
+        print(f"{score:.4f}  {name}")
@@ -1,17 +1,29 @@
 # === Ajouter au début
-import argparse, json
+import argparse
 
 parser = argparse.ArgumentParser()
-parser.add_argument("--file", help="Fichier JSON contenant les CVEs à injecter")
+parser.add_argument("--file", help="Fichier JSON (ou .json.gz) contenant les CVEs à injecter, lu en flux")
+parser.add_argument("--bulk", action="store_true", help="Ingestion par lots UNWIND (quelques transactions par page)")
+parser.add_argument("--batch-size", type=int, default=500, help="Nombre de CVE par transaction en mode --bulk")
+parser.add_argument("--delta", action="store_true", help="En mode --bulk, n'écrit que les CVE nouvelles ou modifiées (empreinte)")
+parser.add_argument("--backfill", action="store_true", help="Parcourt tout le flux NVD (pages concurrentes, reprise sur curseur)")
+parser.add_argument("--cursor", default="data/nvd_backfill_cursor.json", help="Fichier curseur du backfill")
+parser.add_argument("--max-pages", type=int, default=None, help="Limite le nombre de pages du backfill")
+parser.add_argument("--workers", type=int, default=4, help="Requêtes NVD simultanées")
+parser.add_argument("--per-page", type=int, default=2000, help="CVE par page du backfill (fixée par le curseur)")
+parser.add_argument("--rdf-out", default="kg1.nt", help="Export RDF en flux (.nt, .nq, .gz)")
+parser.add_argument("--turtle", action="store_true", help="Convertit aussi l'export RDF en kg1.ttl")
 args = parser.parse_args()
 
 # ======================== 0. IMPORTS ========================
 from py2neo import Graph, Node, Relationship
-from transformers import pipeline
-from rdflib import Graph as RDFGraph, Namespace, RDF, RDFS, OWL, Literal
-import requests
+from rdf_stream import TripleWriter, iri, literal, to_turtle, RDF_TYPE, RDFS_LABEL, OWL_CLASS, STUCO, CYBER
 import time
 from datetime import datetime
+from nvd_bulk import ingest_cves
+from nvd_fetcher import NVDFetcher, PageCursor, backfill, make_session
+from ner_enrich import EnrichmentStage, NEREnricher
+from nvd_stream import iter_vulnerabilities
 
 # ======================== 1. CONNEXION NEO4J ========================
 uri = "neo4j+s://8d5fbce8.databases.neo4j.io"
@@ -20,35 +32,30 @@ password = "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM"
 graph = Graph(uri, auth=(user, password))
 
 # ======================== 2. RDF ONTOLOGY INITIALIZATION ========================
-rdf_graph = RDFGraph()
-UCO = Namespace("https://ontology.unifiedcyberontology.org/uco#")
-STUCO = Namespace("http://w3id.org/sepses/vocab/ref/stuco#")
-CYBER = Namespace("http://example.org/cyber#")
-
-rdf_graph.bind("uco", UCO)
-rdf_graph.bind("stuco", STUCO)
-rdf_graph.bind("cyber", CYBER)
-
-# RDF Classes declaration
-for label, uri_ in [
-    ("CVE", STUCO.Vulnerability),
-    ("CWE", STUCO.Weakness),
-    ("CPE", STUCO.Platform),
-    ("Entity", CYBER.Entity)
-]:
-    rdf_graph.add((uri_, RDF.type, OWL.Class))
-    rdf_graph.add((uri_, RDFS.label, Literal(label)))
-
-rdf_graph.serialize(destination="kg1.ttl", format="turtle")
+# RDF Classes declaration (N-Triples en flux ; Turtle en option)
+with TripleWriter(args.rdf_out) as rdf_out:
+    for label, uri_ in [
+        ("CVE", iri(STUCO, "Vulnerability")),
+        ("CWE", iri(STUCO, "Weakness")),
+        ("CPE", iri(STUCO, "Platform")),
+        ("Entity", iri(CYBER, "Entity"))
+    ]:
+        rdf_out.add(uri_, RDF_TYPE, OWL_CLASS)
+        rdf_out.add(uri_, RDFS_LABEL, literal(label))
+
+if args.turtle:
+    to_turtle(args.rdf_out, "kg1.ttl")
 
 # ======================== 3. NER WITH BERT ========================
-ner = pipeline("ner", model="dslim/bert-base-NER", aggregation_strategy="simple")
+# Modèle chargé à la première inférence ; résultats en cache par hash de description
+enricher = NEREnricher()
 
 # ======================== 4. FETCH DATA FROM NVD ========================
+session = make_session()
+
 def fetch_cve_nvd(start=0, results_per_page=20):
-    url = f"https://services.nvd.nist.gov/rest/json/cves/2.0?startIndex={start}&resultsPerPage={results_per_page}"
-    response = requests.get(url)
-    return response.json()
+    fetcher = NVDFetcher(per_page=results_per_page, session=session)
+    return fetcher.fetch_page(start)
 
 # ======================== 5. INSERTION LOGIC ========================
 def insert_cve_neo4j(item):
@@ -56,7 +63,8 @@ def insert_cve_neo4j(item):
     description = item["cve"]["descriptions"][0]["value"]
     published = item["cve"].get("published")
 
-    cve_node = Node("CVE", name=cve_id, description=description, source="NVD")
+    cve_node = Node("CVE", name=cve_id, description=description, source="NVD",
+                    updated_at=datetime.utcnow().isoformat())
     if published:
         cve_node["published"] = published
 
@@ -100,38 +108,73 @@ def insert_cve_neo4j(item):
 
     # --- NER sur description ---
     try:
-        entities = ner(description)
+        entities = enricher.entities_for([description])[0]
+        if entities is None:
+            # Échec du modèle sur cette seule description : CVE écrite sans MENTIONS
+            print(f"⚠️ NER impossible sur {cve_id} : MENTIONS non écrites")
+            return
         for ent in entities:
-            word = ent["word"]
-            ent_type = ent["entity_group"]
+            word = ent["name"]
+            ent_type = ent["type"]
             ent_node = Node("Entity", name=word, type=ent_type)
             graph.merge(ent_node, "Entity", "name")
             graph.merge(Relationship(cve_node, "MENTIONS", ent_node))
     except Exception as e:
         print(f"⚠️ NER erreur sur {cve_id}: {e}")
 
+def ingest_bulk(items, batch_size=500, delta=False):
+    # Données structurées d'abord ; le NER suit dans sa propre étape
+    stage = EnrichmentStage(graph, enricher).start()
+    try:
+        return ingest_cves(graph, items, batch_size=batch_size, enrichment=stage, delta=delta)
+    finally:
+        stage.close()
+
 # ======================== 6. PIPELINE EXECUTION ========================
-def pipeline_kg1(start=0, results_per_page=10):
+def pipeline_kg1(start=0, results_per_page=10, bulk=False, batch_size=500, delta=False):
     print("🚀 Extraction des CVEs depuis NVD...")
     data = fetch_cve_nvd(start=start, results_per_page=results_per_page)
+    if bulk:
+        totals = ingest_bulk(data.get("vulnerabilities", []), batch_size=batch_size, delta=delta)
+        print(f"✅ Insertion bulk terminée dans Neo4j : {totals['cve']} CVE.")
+        return
     for item in data.get("vulnerabilities", []):
         try:
             insert_cve_neo4j(item)
-            time.sleep(0.2)
         except Exception as e:
             print(f"[!] Erreur pour {item['cve']['id']}: {e}")
     print("✅ Insertion terminée dans Neo4j.")
 
+def backfill_kg1(cursor_path, batch_size=500, max_pages=None, workers=4, delta=False, per_page=2000):
+    print(f"🚀 Backfill NVD complet (curseur : {cursor_path})...")
+    cursor = PageCursor(cursor_path)
+    fetcher = NVDFetcher(per_page=per_page, workers=workers, session=make_session(pool_size=workers), cursor=cursor)
+    stage = EnrichmentStage(graph, enricher).start()
+    # strict : une page dont l'écriture échoue arrête le backfill avant mark_done
+    consume = lambda vulns: ingest_cves(graph, vulns, batch_size=batch_size, enrichment=stage, delta=delta,
+                                        strict=True)
+    try:
+        total = backfill(consume, fetcher, max_pages=max_pages)
+    finally:
+        stage.close()
+    print(f"✅ Backfill terminé : {total} CVE ingérées, curseur à {cursor.next_start}.")
+
 # ======================== 7. MAIN ========================
 if __name__ == "__main__":
     if args.file:
-        with open(args.file, "r") as f:
-            data = json.load(f)
-        for item in data.get("vulnerabilities", []):
-            try:
-                insert_cve_neo4j(item)
-            except Exception as e:
-                print(f"[!] Erreur pour {item['cve']['id']}: {e}")
+        items = iter_vulnerabilities(args.file)
+        if args.bulk:
+            ingest_bulk(items, batch_size=args.batch_size, delta=args.delta)
+        else:
+            for item in items:
+                try:
+                    insert_cve_neo4j(item)
+                except Exception as e:
+                    print(f"[!] Erreur pour {item['cve']['id']}: {e}")
+    elif args.backfill:
+        backfill_kg1(args.cursor, batch_size=args.batch_size, max_pages=args.max_pages,
+                     workers=args.workers, delta=args.delta, per_page=args.per_page)
     else:
-        pipeline_kg1(start=0, results_per_page=20)
+        pipeline_kg1(start=0, results_per_page=20, bulk=args.bulk,
+                     batch_size=args.batch_size, delta=args.delta)
 
@@ -0,0 +1,59 @@
+# ======================== RECHERCHE PAR SIMILARITÉ COSINUS (MATRICIELLE) ========================
+# Les matrices d'embeddings sont normalisées une seule fois ; les similarités sont
+# calculées par produits matriciels par blocs (mémoire bornée par block_size²)
+# et les k meilleurs candidats extraits par tri partiel (argpartition).
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 4096
+
+def normalize_rows(mat):
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+def _select_topk(idx, sim, k):
+    # Garde les k meilleurs candidats par ligne ; les ex-aequo au seuil sont départagés
+    # par indice croissant (argpartition seul en garderait un au hasard)
+    if sim.shape[1] <= k:
+        return idx, sim
+    part = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+    kept = np.take_along_axis(sim, part, axis=1)
+    thr = kept.min(axis=1, keepdims=True)
+    ties = (sim == thr).sum(axis=1) > (kept == thr).sum(axis=1)
+    for r in np.flatnonzero(ties):
+        above = np.flatnonzero(sim[r] > thr[r])
+        tied = np.flatnonzero(sim[r] == thr[r])
+        tied = tied[np.argsort(idx[r, tied], kind="stable")][:k - len(above)]
+        part[r] = np.concatenate([above, tied])
+    return np.take_along_axis(idx, part, axis=1), np.take_along_axis(sim, part, axis=1)
+
+def _merge_topk(best_idx, best_sim, idx, sim, k):
+    # Fusionne deux listes de candidats (lignes) et garde les k meilleurs
+    return _select_topk(np.concatenate([best_idx, idx], axis=1),
+                        np.concatenate([best_sim, sim], axis=1), k)
+
+def topk_cosine(queries, base, k=1, block_size=DEFAULT_BLOCK_SIZE, normalized=False):
+    # Retourne (indices, similarités) de forme (len(queries), k), triés par score décroissant
+    if not normalized:
+        queries, base = normalize_rows(queries), normalize_rows(base)
+    n_q, n_b = len(queries), len(base)
+    k = min(k, n_b)
+    out_idx = np.zeros((n_q, k), dtype=np.int64)
+    out_sim = np.zeros((n_q, k), dtype=np.float32)
+    if n_q == 0 or k == 0:
+        return out_idx, out_sim
+
+    for q0 in range(0, n_q, block_size):
+        q_block = queries[q0:q0 + block_size]
+        best_idx = np.empty((len(q_block), 0), dtype=np.int64)
+        best_sim = np.empty((len(q_block), 0), dtype=np.float32)
+        for b0 in range(0, n_b, block_size):
+            sims = q_block @ base[b0:b0 + block_size].T
+            ids = np.broadcast_to(np.arange(b0, b0 + sims.shape[1], dtype=np.int64), sims.shape)
+            best_idx, best_sim = _merge_topk(best_idx, best_sim, *_select_topk(ids, sims, k), k)
+        # Tri final : score décroissant, puis indice croissant (comme une boucle `>` stricte)
+        order = np.lexsort((best_idx, -best_sim), axis=1)
+        out_idx[q0:q0 + len(q_block)] = np.take_along_axis(best_idx, order, axis=1)
+        out_sim[q0:q0 + len(q_block)] = np.take_along_axis(best_sim, order, axis=1)
+    return out_idx, out_sim
@@ -0,0 +1,157 @@
+# ======================== STOCKAGE PERSISTANT DES EMBEDDINGS (MEMMAP) ========================
+# Un répertoire par modèle : matrice float32/float16 mappée en mémoire
+# (vectors.bin), clés = hash du texte « nom + description » (keys.npy) et
+# méta-données (meta.json). Seuls les textes nouveaux ou modifiés sont encodés,
+# par lots ; le modèle n'est chargé que s'il reste quelque chose à encoder.
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-mpnet-base-v2")
+EMBED_STORE_DIR = os.getenv("EMBED_STORE_DIR", "data/embeddings")
+EMBED_STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+KEY_DTYPE = "S32"
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32].encode("ascii")
+
+def cve_text(name, description=""):
+    # Texte encodé pour une CVE (identique à l'ancien get_cve_text d'align_kg)
+    return f"{name} {description or ''}"
+
+class EmbeddingStore:
+    def __init__(self, model_name=EMBED_MODEL, root=EMBED_STORE_DIR, dtype=EMBED_STORE_DTYPE,
+                 batch_size=EMBED_BATCH_SIZE):
+        self.model_name = model_name
+        self.dir = os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+        self.batch_size = batch_size
+        self._model = None
+        self.dim = None
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.capacity = 0
+        self.keys = np.empty(0, dtype=KEY_DTYPE)
+        self.key_pos = {}
+        self._mmap = None
+        self._load()
+
+    # ======================== 1. PERSISTANCE ========================
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.dir, "vectors.bin")
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.dir, "meta.json")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.dir, "keys.npy")
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        # Le type stocké prime sur celui demandé (pas de conversion silencieuse)
+        self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        self.count, self.capacity = meta["count"], meta["capacity"]
+        self.keys = np.load(self._keys_path)[:self.count]
+        self.key_pos = {k: i for i, k in enumerate(self.keys.tolist())}
+        self._open("r")
+
+    def _open(self, mode):
+        self._mmap = np.memmap(self._vectors_path, dtype=self.dtype, mode=mode,
+                               shape=(self.capacity, self.dim)) if self.capacity else None
+
+    def _grow(self, needed):
+        # Capacité doublée : les ajouts successifs restent amortis en O(1)
+        capacity = max(needed, 2 * self.capacity, 1024)
+        os.makedirs(self.dir, exist_ok=True)
+        self._mmap = None
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        self.capacity = capacity
+
+    def _save_index(self):
+        tmp = f"{self._keys_path}.tmp.npy"
+        np.save(tmp, self.keys)
+        os.replace(tmp, self._keys_path)
+        tmp = f"{self._meta_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"model": self.model_name, "dim": self.dim, "dtype": self.dtype.name,
+                       "count": self.count, "capacity": self.capacity}, f)
+        os.replace(tmp, self._meta_path)
+
+    # ======================== 2. LECTURE ========================
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, text):
+        return text_key(text) in self.key_pos
+
+    @property
+    def vectors(self):
+        # Vue mappée (sans copie) des lignes valides
+        if self._mmap is None:
+            return np.empty((0, self.dim or 0), dtype=self.dtype)
+        return self._mmap[:self.count]
+
+    def rows(self, texts):
+        # Lignes de la matrice pour chaque texte (-1 si absent)
+        return np.array([self.key_pos.get(text_key(t), -1) for t in texts], dtype=np.int64)
+
+    # ======================== 3. ENCODAGE INCRÉMENTAL ========================
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            print(f"⚙️ Chargement modèle SentenceTransformer ({self.model_name})...")
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def add(self, texts, vectors):
+        vectors = np.asarray(vectors)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        if self.count + len(vectors) > self.capacity:
+            self._grow(self.count + len(vectors))
+        self._open("r+")
+        self._mmap[self.count:self.count + len(vectors)] = vectors.astype(self.dtype)
+        self._mmap.flush()
+        new_keys = np.array([text_key(t) for t in texts], dtype=KEY_DTYPE)
+        for i, k in enumerate(new_keys.tolist()):
+            self.key_pos[k] = self.count + i
+        self.keys = np.concatenate([self.keys, new_keys])
+        self.count += len(vectors)
+        # Index écrit après les vecteurs : un arrêt brutal ne laisse que des lignes orphelines
+        self._save_index()
+        self._open("r")
+
+    def ensure(self, texts, show_progress_bar=True):
+        # Encode les textes absents du store (dédoublonnés), par lots
+        missing, seen = [], set()
+        for t in texts:
+            k = text_key(t)
+            if k not in self.key_pos and k not in seen:
+                seen.add(k)
+                missing.append(t)
+        if not missing:
+            return 0
+        print(f"⚙️ Encodage de {len(missing)} texte(s) nouveau(x) ou modifié(s)...")
+        chunk = self.batch_size * 64
+        for i in range(0, len(missing), chunk):
+            part = missing[i:i + chunk]
+            emb = self.model.encode(part, batch_size=self.batch_size, convert_to_numpy=True,
+                                    show_progress_bar=show_progress_bar)
+            self.add(part, emb)
+        return len(missing)
+
+    def get(self, texts, show_progress_bar=True):
+        # Matrice (len(texts), dim) en float32 ; n'encode que le manquant
+        self.ensure(texts, show_progress_bar=show_progress_bar)
+        return np.asarray(self.vectors[self.rows(texts)], dtype=np.float32)
@@ -1,15 +1,19 @@
 # ======================== 0. IMPORTS ========================
-import pandas as pd
-from py2neo import Graph, Node, Relationship, NodeMatcher
-from rdflib import Graph as RDFGraph, Namespace, RDF, RDFS, OWL, Literal
-from urllib.parse import quote_plus
+from py2neo import Graph
 from datetime import datetime
-import sys
+import argparse
 import os
+from nessus_bulk import build_entities, write_entities
+from nessus_diff import collect_findings, diff_scans, empty_findings, load_state, save_state, scan_scope, write_resolved
+from nessus_reader import DEFAULT_CHUNKSIZE, iter_scan_chunks
+from risk_scores import RISK_STORE_PATH, RiskStore
+from rdf_stream import (TripleWriter, iri, literal, to_turtle,
+                        RDF_TYPE, RDFS_LABEL, OWL_CLASS, OWL_OBJECT_PROPERTY, STUCO, CYBER)
 
 # ======================== 1. UTILS ========================
-def iri_fragment(txt: str) -> str:
-    return quote_plus(txt.strip().replace("/", "_"))
+# IRI cyber:<Type>/<fragment>, construites une seule fois (cache de rdf_stream.iri)
+def res(kind: str, txt: str) -> str:
+    return iri(CYBER, txt, kind)
 
 # ======================== 2. CONFIG ========================
 # Connexion Neo4j (à remplacer par des variables d'environnement en production)
@@ -17,119 +21,95 @@ uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
 user = os.getenv("NEO4J_USER", "neo4j")
 pwd  = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
 graph   = Graph(uri, auth=(user, pwd))
-matcher = NodeMatcher(graph)
 
-# Fichier CSV (par défaut)
-csv_path = "data/nessuss-scan1.csv"
+# Export Nessus (CSV ou .nessus XML), lu par morceaux
+parser = argparse.ArgumentParser()
+parser.add_argument("scan", nargs="?", default="data/nessuss-scan1.csv", help="Export Nessus (.csv ou .nessus)")
+parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Lignes (ou ReportItem) par morceau")
+parser.add_argument("--rdf-out", default="kg2.nt", help="Export RDF en flux (.nt, .nq, .gz)")
+parser.add_argument("--turtle", action="store_true", help="Convertit aussi l'export RDF en kg2.ttl")
+parser.add_argument("--risk-store", default=RISK_STORE_PATH, help="Agrégats de risque host / service / CVE (.npz)")
+parser.add_argument("--scope", default=None, help="Périmètre de l'export (sinon déduit du nom de fichier)")
+args = parser.parse_args()
+
+csv_path = args.scan
 if not os.path.exists(csv_path):
     raise FileNotFoundError(f"🚫 Fichier introuvable : {csv_path}")
 
 # ======================== 3. ONTOLOGIE STUCO ========================
-kg = RDFGraph()
-STUCO = Namespace("http://w3id.org/sepses/vocab/ref/stuco#")
-CYBER = Namespace("http://example.org/cyber#")
-kg.bind("stuco", STUCO)
-kg.bind("cyber", CYBER)
+kg = TripleWriter(args.rdf_out)
 
 for lbl, uri_cls in [
-    ("Host", CYBER.Host),
-    ("Plugin", CYBER.Plugin),
-    ("Service", CYBER.Service),
-    ("CVE", STUCO.Vulnerability),
-    ("Source", CYBER.Source)
+    ("Host", iri(CYBER, "Host")),
+    ("Plugin", iri(CYBER, "Plugin")),
+    ("Service", iri(CYBER, "Service")),
+    ("CVE", iri(STUCO, "Vulnerability")),
+    ("Source", iri(CYBER, "Source"))
 ]:
-    kg.add((uri_cls, RDF.type, OWL.Class))
-    kg.add((uri_cls, RDFS.label, Literal(lbl)))
+    kg.add(uri_cls, RDF_TYPE, OWL_CLASS)
+    kg.add(uri_cls, RDFS_LABEL, literal(lbl))
+
+HAS_PLUGIN, DETECTS, RUNS_SERVICE, IS_VULNERABLE_TO, COMES_FROM = (
+    iri(CYBER, p) for p in ("hasPlugin", "detects", "runsService", "isVulnerableTo", "comesFrom"))
 
 for lbl, prop in [
-    ("hasPlugin", CYBER.hasPlugin),
-    ("detects", CYBER.detects),
-    ("runsService", CYBER.runsService),
-    ("isVulnerableTo", CYBER.isVulnerableTo),
-    ("comesFrom", CYBER.comesFrom)
+    ("hasPlugin", HAS_PLUGIN),
+    ("detects", DETECTS),
+    ("runsService", RUNS_SERVICE),
+    ("isVulnerableTo", IS_VULNERABLE_TO),
+    ("comesFrom", COMES_FROM)
 ]:
-    kg.add((prop, RDF.type, OWL.ObjectProperty))
-    kg.add((prop, RDFS.label, Literal(lbl)))
-
-kg.add((CYBER["NVD"], RDF.type, CYBER.Source))
-kg.add((CYBER["NESSUS"], RDF.type, CYBER.Source))
-kg.add((CYBER["NESSUS"], RDFS.label, Literal("NESSUS")))
-
-# ======================== 4. LECTURE + NORMALISATION CSV ========================
-df = pd.read_csv(csv_path)
-
-df.columns = (df.columns.str.strip()
-                        .str.lower()
-                        .str.replace(" ", "_"))
-
-alias = {
-    "pluginid":        "plugin_id",
-    "plugin_id_":      "plugin_id",
-    "id":              "plugin_id",
-    "plugin_name":     "plugin_name",
-    "name":            "plugin_name",
-    "risk_factor":     "risk",
-}
-df = df.rename(columns=alias)
-
-required = {"host", "plugin_name", "plugin_id", "port"}
-missing = required - set(df.columns)
-if missing:
-    raise ValueError(f"🚨 Colonnes manquantes dans le CSV : {missing}")
-
-# ======================== 5. INSERTION NEO4J + RDF ========================
-now_iso = datetime.utcnow().isoformat()
+    kg.add(prop, RDF_TYPE, OWL_OBJECT_PROPERTY)
+    kg.add(prop, RDFS_LABEL, literal(lbl))
 
-for _, r in df.iterrows():
-    host_ip   = str(r["host"]).strip()
-    plug_id   = str(r["plugin_id"]).strip()
-    plug_name = str(r["plugin_name"]).strip()
-    port      = str(r["port"]).strip()
-    service   = str(r.get("service", "unknown")).strip()
-    cves      = [c.strip() for c in str(r.get("cve", "")).split(",") if c.startswith("CVE")]
-
-    tx = graph.begin()
-
-    n_host = Node("Host", name=host_ip, last_seen=now_iso)
-    tx.merge(n_host, "Host", "name")
-
-    n_plugin = Node("Plugin", plugin_id=plug_id, plugin_name=plug_name)
-    tx.merge(n_plugin, "Plugin", "plugin_id")
-    tx.merge(Relationship(n_host, "HAS_PLUGIN", n_plugin))
-
-    if port and port != "nan":
-        n_port = Node("Port", port=port)
-        tx.merge(n_port, "Port", "port")
-        tx.merge(Relationship(n_host, "CONNECTED_TO", n_port))
-
-    if service:
-        n_serv = Node("Service", name=service)
-        tx.merge(n_serv, "Service", "name")
-        tx.merge(Relationship(n_host, "RUNS_SERVICE", n_serv))
-
-    for cve in cves:
-        n_cve = matcher.match("CVE", name=cve).first() or Node("CVE", name=cve, source="NESSUS")
-        tx.merge(n_cve, "CVE", "name")
-        tx.merge(Relationship(n_plugin, "DETECTS", n_cve))
-        tx.merge(Relationship(n_host, "IS_VULNERABLE_TO", n_cve))
-
-        # RDF
-        resCVE = CYBER[f"CVE/{iri_fragment(cve)}"]
-        kg.add((CYBER[f"Plugin/{iri_fragment(plug_id)}"], CYBER.detects, resCVE))
-        kg.add((CYBER[f"Host/{iri_fragment(host_ip)}"], CYBER.isVulnerableTo, resCVE))
-        kg.add((resCVE, CYBER.comesFrom, CYBER["NESSUS"]))
-
-    tx.commit()
-
-    resH = CYBER[f"Host/{iri_fragment(host_ip)}"]
-    resP = CYBER[f"Plugin/{iri_fragment(plug_id)}"]
-    kg.add((resH, CYBER.hasPlugin, resP))
-    if service:
-        kg.add((resH, CYBER.runsService, CYBER[f"Service/{iri_fragment(service)}"]))
+NESSUS = iri(CYBER, "NESSUS")
+kg.add(iri(CYBER, "NVD"), RDF_TYPE, iri(CYBER, "Source"))
+kg.add(NESSUS, RDF_TYPE, iri(CYBER, "Source"))
+kg.add(NESSUS, RDFS_LABEL, literal("NESSUS"))
+
+# ======================== 4. LECTURE PAR MORCEAUX + INSERTION NEO4J (UNWIND) + RDF ========================
+now_iso = datetime.utcnow().isoformat()
+totals = {}
+# Export complet = état courant de son périmètre : comparé à l'état précédent du même
+# périmètre (comme nessus_diff.py), les findings absents sont résolus dans Neo4j et dans
+# le store de risque ; les autres périmètres du store partagé ne sont pas touchés
+scope = args.scope or scan_scope(csv_path)
+previous = load_state(scope)
+scan = {"path": csv_path, "findings": empty_findings(), "plugins": {}}
+risk = RiskStore.load(args.risk_store)
+
+for findings in iter_scan_chunks(csv_path, chunksize=args.chunksize):
+    entities = build_entities(findings)
+    counts = write_entities(graph, entities, now_iso)
+    collect_findings(findings, scan["findings"], scan["plugins"])
+    for k, v in counts.items():
+        totals[k] = totals.get(k, 0) + v
+    print(f"📦 Morceau de {len(findings)} lignes : {counts['hosts']} hosts, {counts['cves']} CVE")
+
+    # Triplets écrits au fil des morceaux : rien n'est gardé en mémoire
+    kg.add_many((res("Plugin", r["plugin_id"]), DETECTS, res("CVE", r["cve"])) for r in entities["detects"])
+    kg.add_many((res("Host", r["host"]), IS_VULNERABLE_TO, res("CVE", r["cve"])) for r in entities["vulnerable"])
+    kg.add_many((res("CVE", r["cve"]), COMES_FROM, NESSUS) for r in entities["cves"])
+    kg.add_many((res("Host", r["host"]), HAS_PLUGIN, res("Plugin", r["plugin_id"])) for r in entities["has_plugin"])
+    kg.add_many((res("Host", r["host"]), RUNS_SERVICE, res("Service", r["service"])) for r in entities["runs"])
+
+diff = diff_scans(previous, scan)
+resolved = write_resolved(graph, diff, now_iso)
+save_state(scope, scan, now_iso)
+print(f"📦 Neo4j : {totals.get('has_plugin', 0)} liens HAS_PLUGIN, "
+      f"{totals.get('vulnerable', 0)} liens IS_VULNERABLE_TO écrits, "
+      f"{resolved['has_plugin_resolved']} plugins et {resolved['vulnerable_resolved']} CVE résolus [{scope}]")
+risk.apply_diff(diff, scan["plugins"])
+risk.sync_cves(graph)
+risk.save()
+print(f"📊 Scores de risque : {len(risk.hosts)} hosts, {len(risk.services)} services, "
+      f"{len(risk.cves)} CVE ({args.risk_store})")
 
 # ======================== 6. EXPORT RDF ========================
-kg.serialize("kg2.ttl", format="turtle")
-print("✅ kg2.ttl généré (ontologie STUCO) et Neo4j mis à jour.")
+kg.close()
+if args.turtle:
+    to_turtle(args.rdf_out, "kg2.ttl")
+print(f"✅ {args.rdf_out} généré ({kg.count} triplets, ontologie STUCO) et Neo4j mis à jour.")
 
 # ======================== 7. FIX CVE sources ========================
 graph.run("""
@@ -0,0 +1,180 @@
+# ======================== FUSION CVE PAR LOTS (REPRISE + IDEMPOTENCE) ========================
+# Les paires SAME_AS (NVD ↔ Nessus) sont lues par un seul curseur trié sur
+# (c1.name, c2.name), consommé au fil de l'eau, et fusionnées par lots bornés,
+# chaque lot dans sa propre transaction. Les arêtes sont recopiées avec apoc.merge.relationship : une
+# réexécution ne crée aucun doublon, et les arêtes de la CVE unifiée qui n'ont
+# plus d'équivalent sur les sources sont supprimées. Une signature des deux CVE
+# sources (updated_at, degrés, derniers last_seen / changed_at / resolved_at)
+# est stockée sur la relation SAME_AS : seules les paires dont les sources ont
+# changé sont refusionnées.
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+FUSION_BATCH_SIZE = int(os.getenv("FUSION_BATCH_SIZE", "500"))
+FUSION_CHECKPOINT = os.getenv("FUSION_CHECKPOINT", "data/fusion_checkpoint.json")
+
+# Une seule requête triée (reprise après la paire $after1 / $after2) : paginer par
+# LIMIT refaisait le MATCH et le tri de toutes les paires restantes à chaque page
+Q_PAIRS = """
+MATCH (c1:CVE)-[:SAME_AS]-(c2:CVE)
+WHERE c1.source = 'NVD' AND c2.source = 'NESSUS'
+  AND ($after1 IS NULL OR c1.name > $after1 OR (c1.name = $after1 AND c2.name > $after2))
+RETURN DISTINCT c1.name AS c1, c2.name AS c2
+ORDER BY c1, c2
+"""
+
+Q_FUSE = """
+UNWIND $pairs AS p
+MATCH (c1:CVE {name: p.c1, source: 'NVD'})-[s:SAME_AS]-(c2:CVE {name: p.c2, source: 'NESSUS'})
+WITH c1, c2, collect(s) AS links
+WITH c1, c2, links,
+     coalesce(c1.updated_at, '') + '|' + coalesce(c2.updated_at, '') + '|' +
+     toString(size([(c1)--() | 1])) + '|' + toString(size([(c2)--() | 1])) + '|' +
+     coalesce(apoc.coll.max([(c2)-[r]-() WHERE r.last_seen IS NOT NULL | r.last_seen]), '') + '|' +
+     coalesce(apoc.coll.max([(c1)-[r]-() WHERE r.changed_at IS NOT NULL | r.changed_at] +
+                            [(c2)-[r]-() WHERE r.changed_at IS NOT NULL | r.changed_at]), '') + '|' +
+     coalesce(apoc.coll.max([(c2)-[r]-() WHERE r.resolved_at IS NOT NULL | r.resolved_at]), '') AS sig
+WHERE $force OR any(l IN links WHERE l.fused_sig IS NULL OR l.fused_sig <> sig)
+
+MERGE (u:CVE_UNIFIED {name: c1.name})
+SET u.cvss         = coalesce(c1.cvss_score, c2.cvss_score),
+    u.severity     = coalesce(c1.severity, c2.severity),
+    u.attackVector = coalesce(c1.attackVector, c2.attackVector),
+    u.description  = coalesce(c1.description, c2.description),
+    u.fused_at     = $now
+
+WITH c1, c2, u, links, sig
+// Propriétés remplacées (SET rel = ...) : un resolved_at effacé à la source disparaît aussi de u
+CALL {
+  WITH c1, c2, u
+  UNWIND [c1, c2] AS c
+  MATCH (c)-[r]->(x)
+  WHERE type(r) <> 'SAME_AS' AND NOT x IN [c1, c2, u]
+  CALL apoc.merge.relationship(u, type(r), {}, properties(r), x, properties(r)) YIELD rel
+  SET rel = properties(r)
+  RETURN count(rel) AS outgoing
+}
+CALL {
+  WITH c1, c2, u
+  UNWIND [c1, c2] AS c
+  MATCH (x)-[r]->(c)
+  WHERE type(r) <> 'SAME_AS' AND NOT x IN [c1, c2, u]
+  CALL apoc.merge.relationship(x, type(r), {}, properties(r), u, properties(r)) YIELD rel
+  SET rel = properties(r)
+  RETURN count(rel) AS incoming
+}
+// Arêtes de u qui n'existent plus sur c1 ni sur aucun de ses jumeaux Nessus
+CALL {
+  WITH c1, u
+  OPTIONAL MATCH (c1)-[:SAME_AS]-(t:CVE {source: 'NESSUS'})
+  WITH c1, u, [c1] + collect(t) AS sources
+  OPTIONAL MATCH (u)-[r]-(x)
+  WHERE NOT EXISTS {
+    MATCH (c)-[s]-(x)
+    WHERE c IN sources AND type(s) = type(r) AND (startNode(s) = c) = (startNode(r) = u)
+  }
+  DELETE r
+  RETURN count(r) AS pruned
+}
+FOREACH (l IN links | SET l.fused_sig = sig)
+RETURN count(*) AS fused, sum(outgoing + incoming) AS edges, sum(pruned) AS pruned
+"""
+
+Q_UNIFIED_NAMES = """
+MATCH (u:CVE_UNIFIED)
+WHERE u.name > $after
+RETURN u.name AS name
+ORDER BY name
+LIMIT $limit
+"""
+
+Q_TOTAL = """
+MATCH (c:CVE)-[:SAME_AS]-(n:CVE)
+WHERE c.source = 'NVD' AND n.source = 'NESSUS'
+RETURN count(DISTINCT c) AS total_fusionnees
+"""
+
+# ======================== 1. POINT DE REPRISE ========================
+class FusionCheckpoint:
+    # `last` : dernière paire (c1, c2) dont le lot est validé ; None = pas de run en cours
+    def __init__(self, path=FUSION_CHECKPOINT):
+        self.path = Path(path) if path else None
+        self.last = None
+        self.counts = {"pairs": 0, "fused": 0, "edges": 0, "pruned": 0}
+        if self.path and self.path.exists():
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            self.last = tuple(state["last"]) if state.get("last") else None
+            self.counts.update(state.get("counts", {}))
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"last": self.last, "counts": self.counts}, f)
+        os.replace(tmp, self.path)
+
+    def advance(self, last, pairs, fused, edges, pruned=0):
+        self.last = last
+        self.counts["pairs"] += pairs
+        self.counts["fused"] += fused
+        self.counts["edges"] += edges
+        self.counts["pruned"] += pruned
+        self.save()
+
+    def finish(self):
+        if self.path and self.path.exists():
+            self.path.unlink()
+        self.last = None
+
+# ======================== 2. FUSION ========================
+def iter_pair_batches(graph, batch_size=FUSION_BATCH_SIZE, after=None):
+    # Curseur itéré paresseusement (pas de .data()) : mémoire bornée par le lot
+    after1, after2 = after or (None, None)
+    batch = []
+    for record in graph.run(Q_PAIRS, after1=after1, after2=after2):
+        batch.append({"c1": record["c1"], "c2": record["c2"]})
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_unified_names(graph, batch_size=FUSION_BATCH_SIZE, after=""):
+    while True:
+        names = [r["name"] for r in graph.run(Q_UNIFIED_NAMES, after=after, limit=batch_size).data()]
+        if not names:
+            return
+        yield names
+        after = names[-1]
+        if len(names) < batch_size:
+            return
+
+def fuse_pairs(graph, batch_size=FUSION_BATCH_SIZE, checkpoint=None, force=False):
+    checkpoint = checkpoint or FusionCheckpoint(None)
+    if checkpoint.last:
+        print(f"⏩ Reprise de la fusion après {checkpoint.last[0]} ↔ {checkpoint.last[1]} "
+              f"({checkpoint.counts['pairs']} paires déjà traitées)")
+    now = datetime.utcnow().isoformat()
+    for rows in iter_pair_batches(graph, batch_size, checkpoint.last):
+        tx = graph.begin()
+        res = tx.run(Q_FUSE, pairs=rows, now=now, force=force).data()
+        tx.commit()
+        fused = res[0]["fused"] if res else 0
+        edges = (res[0]["edges"] or 0) if res else 0
+        pruned = (res[0]["pruned"] or 0) if res else 0
+        checkpoint.advance((rows[-1]["c1"], rows[-1]["c2"]), len(rows), fused, edges, pruned)
+        print(f"   ↳ {checkpoint.counts['pairs']} paires parcourues, "
+              f"{checkpoint.counts['fused']} fusionnées, {checkpoint.counts['edges']} arêtes fusionnées, "
+              f"{checkpoint.counts['pruned']} supprimées")
+    counts = dict(checkpoint.counts)
+    checkpoint.finish()
+    return counts
+
+def total_fused(graph):
+    total = graph.run(Q_TOTAL).data()
+    return total[0]["total_fusionnees"] if total else 0
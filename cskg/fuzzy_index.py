@@ -0,0 +1,193 @@
+# ======================== INDEX DE BLOCAGE POUR LE MATCHING FUZZY ========================
+# Remplace la boucle fuzz.ratio « tous contre tous » par un index inversé de
+# q-grammes sur les identifiants CVE normalisés. Seuls les candidats plausibles
+# sont scorés, avec exactement le même fuzz.ratio qu'avant.
+#
+# Exactitude : fuzz.ratio(a, b) >= seuil impose une distance d'édition
+# d <= (1 - (seuil - 0.5) / 100) * (|a| + |b|). Deux chaînes à distance <= d
+# partagent au moins max(|a|, |b|) - q + 1 - d*q q-grammes (lemme des q-grammes).
+# Il suffit donc de sonder les (n - τ + 1) q-grammes les plus rares de la requête
+# (filtrage par préfixe) : aucun candidat atteignant le seuil n'est perdu.
+# Les grammes communs (préfixe "CVE-", année) sont les plus fréquents et ne sont
+# jamais sondés : le blocage se fait de fait sur le numéro de séquence, et les
+# longueurs incompatibles sont écartées d'emblée (blocage par longueur).
+#
+# L'index accepte des ajouts (add) et se sauvegarde en .npz (listes inversées en
+# CSR) : align_kg le recharge en mode incrémental et n'y insère que les CVE NVD
+# nouvelles, au lieu de relire et réindexer tout KG1 à chaque passage. Les noms
+# indexés sont normalisés : le nom tel qu'en base (`raw`) est conservé à côté, pour
+# écrire les SAME_AS sur des CVE qui n'ont pas été relues.
+import json
+import math
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from fuzzywuzzy import fuzz
+
+Q = 2
+FUZZY_INDEX_PATH = os.getenv("FUZZY_INDEX_PATH", "data/index/kg1_fuzzy.npz")
+PARALLEL_MIN_QUERIES = 2000
+
+def qgrams(text, q=Q):
+    # Multiset de q-grammes rendu ensemble : ("VE-", 0), ("VE-", 1), ...
+    seen = Counter()
+    grams = []
+    for i in range(len(text) - q + 1):
+        g = text[i:i + q]
+        grams.append((g, seen[g]))
+        seen[g] += 1
+    return grams
+
+class FuzzyIndex:
+    def __init__(self, names=(), threshold=90, q=Q, raw=None):
+        self.q = q
+        self.threshold = threshold
+        # Ratio minimal tel que round(100 * ratio) >= threshold
+        self.min_ratio = (threshold - 0.5) / 100.0
+        self.names = []
+        self.name_pos = {}
+        self.postings = defaultdict(list)
+        self.by_len = defaultdict(list)
+        self.lengths = []
+        self.gram_sets = []
+        self.raw = {}
+        self.add(names, raw)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.name_pos
+
+    def add(self, names, raw=None):
+        # Insère les noms absents (un nom déjà indexé garde sa position) ; retourne le nombre ajouté.
+        # `raw` : {nom indexé: nom en base}, mis à jour aussi pour les noms déjà présents
+        if raw:
+            self.raw.update(raw)
+        added = 0
+        for name in names:
+            if name in self.name_pos:
+                continue
+            idx = self.name_pos[name] = len(self.names)
+            self.names.append(name)
+            self.lengths.append(len(name))
+            self.by_len[len(name)].append(idx)
+            grams = qgrams(name, self.q)
+            self.gram_sets.append(frozenset(grams))
+            for gram in grams:
+                self.postings[gram].append(idx)
+            added += 1
+        return added
+
+    def _grams(self, idx):
+        # Ensembles de q-grammes calculés à la demande après un load()
+        grams = self.gram_sets[idx]
+        if grams is None:
+            grams = self.gram_sets[idx] = frozenset(qgrams(self.names[idx], self.q))
+        return grams
+
+    # ---------- persistance ----------
+    def save(self, path=FUZZY_INDEX_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        grams = sorted(self.postings)
+        ptr = np.cumsum([0] + [len(self.postings[g]) for g in grams]).astype(np.int64)
+        flat = np.fromiter((i for g in grams for i in self.postings[g]), dtype=np.int64, count=int(ptr[-1]))
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, names=np.array(self.names, dtype=str),
+                 grams=np.array([g for g, _ in grams], dtype=str),
+                 occurrences=np.array([o for _, o in grams], dtype=np.int32),
+                 ptr=ptr, flat=flat, meta=json.dumps({"q": self.q}),
+                 raw_keys=np.array(list(self.raw), dtype=str),
+                 raw_values=np.array(list(self.raw.values()), dtype=str))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=FUZZY_INDEX_PATH, threshold=90):
+        # Le seuil n'intervient qu'à la requête : un index sauvegardé sert pour tout seuil
+        data = np.load(path)
+        index = cls(threshold=threshold, q=json.loads(str(data["meta"]))["q"])
+        index.names = data["names"].tolist()
+        index.name_pos = {name: i for i, name in enumerate(index.names)}
+        index.lengths = [len(name) for name in index.names]
+        index.gram_sets = [None] * len(index.names)
+        if "raw_keys" in data:
+            index.raw = dict(zip(data["raw_keys"].tolist(), data["raw_values"].tolist()))
+        lengths = np.array(index.lengths, dtype=np.int64)
+        order = np.argsort(lengths, kind="stable")
+        uniq, starts = np.unique(lengths[order], return_index=True)
+        for lt, block in zip(uniq.tolist(), np.split(order, starts[1:])):
+            index.by_len[lt] = block.tolist()
+        ptr, flat = data["ptr"], data["flat"]
+        for i, (g, o) in enumerate(zip(data["grams"].tolist(), data["occurrences"].tolist())):
+            index.postings[(g, o)] = flat[ptr[i]:ptr[i + 1]].tolist()
+        return index
+
+    def _max_dist(self, l1, l2):
+        return math.floor((1.0 - self.min_ratio) * (l1 + l2) + 1e-9)
+
+    def candidates(self, query):
+        ls = len(query)
+        taus = {}
+        for lt in self.by_len:
+            d = self._max_dist(ls, lt)
+            if abs(ls - lt) <= d:
+                taus[lt] = max(ls, lt) - self.q + 1 - d * self.q
+
+        # Longueurs où le lemme ne dit rien (chaînes courtes) : tout le bloc
+        found = set()
+        for lt, tau in taus.items():
+            if tau <= 0:
+                found.update(self.by_len[lt])
+
+        positive = [tau for tau in taus.values() if tau > 0]
+        if positive:
+            grams = qgrams(query, self.q)
+            query_set = set(grams)
+            grams.sort(key=lambda g: len(self.postings.get(g, ())))
+            probed = set()
+            for gram in grams[:max(0, len(grams) - min(positive) + 1)]:
+                probed.update(self.postings.get(gram, ()))
+            # Filtre de comptage : au moins τ q-grammes communs pour la longueur du candidat
+            for idx in probed:
+                tau = taus.get(self.lengths[idx])
+                if tau is not None and len(query_set & self._grams(idx)) >= tau:
+                    found.add(idx)
+        return sorted(found)
+
+    def best_match(self, query):
+        # Même sémantique que la boucle d'origine : premier meilleur score dans l'ordre KG1
+        best_score, best_idx = 0, None
+        for idx in self.candidates(query):
+            score = fuzz.ratio(self.names[idx], query)
+            if score > best_score:
+                best_score, best_idx = score, idx
+                if score == 100:
+                    break
+        return (self.names[best_idx] if best_idx is not None else None), best_score
+
+# ======================== EXÉCUTION MULTI-CŒURS PAR MORCEAUX DE KG2 ========================
+_worker_index = None
+
+def _init_worker(names, threshold):
+    global _worker_index
+    _worker_index = FuzzyIndex(names, threshold)
+
+def _match_chunk(queries):
+    return [_worker_index.best_match(q) for q in queries]
+
+def best_matches(kg1_names, queries, threshold=90, workers=None, chunk_size=500, index=None):
+    # Retourne [(nom KG1 ou None, score), ...] dans l'ordre des requêtes ;
+    # `index` : FuzzyIndex déjà construit sur kg1_names (évite de le reconstruire)
+    queries = list(queries)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(queries) < PARALLEL_MIN_QUERIES:
+        index = index if index is not None else FuzzyIndex(kg1_names, threshold)
+        return [index.best_match(q) for q in queries]
+
+    chunks = [queries[i:i + chunk_size] for i in range(0, len(queries), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(list(kg1_names), threshold)) as pool:
+        return [m for part in pool.map(_match_chunk, chunks) for m in part]
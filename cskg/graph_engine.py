@@ -0,0 +1,809 @@
+# ======================== MOTEUR DE GRAPHE EN MÉMOIRE (HORS NEO4J) ========================
+# Backend embarqué pour exécuter fusion, propagation des IMPACTS et écriture
+# des SAME_AS sans Neo4j ni APOC : nœuds et arêtes indexés par entiers,
+# adjacence CSR par type de relation, propriétés en colonnes numpy typées. Le graphe se
+# charge depuis Neo4j ou depuis un snapshot (.npz), et seules les
+# modifications locales sont renvoyées vers Neo4j en une étape de synchronisation.
+import argparse
+import json
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import numpy as np
+
+GRAPH_SNAPSHOT = os.getenv("GRAPH_SNAPSHOT", "data/graph_snapshot.npz")
+DEFAULT_BATCH_SIZE = 5000
+
+# Propriété clé utilisée par les MERGE des pipelines (nessus_bulk, nvd_bulk)
+KEY_PROPS = {"Plugin": "plugin_id", "Port": "port"}
+_NAME_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+MISSING = -1
+
+def key_prop(label):
+    return KEY_PROPS.get(label, "name")
+
+def _check_name(name):
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Nom de label/relation invalide : {name!r}")
+    return name
+
+def _reserve(arr, n, fill=0):
+    # Capacité doublée : ajouts amortis en O(1)
+    if len(arr) >= n:
+        return arr
+    out = np.full(max(n, 2 * len(arr), 64), fill, dtype=arr.dtype)
+    out[:len(arr)] = arr
+    return out
+
+# ======================== 1. COLONNES TYPÉES ========================
+# b / i / f : valeurs natives ; s : chaînes codées par dictionnaire (int32) ;
+# j : tout le reste (listes, types mélangés) en JSON, codé par dictionnaire
+COLUMN_DTYPES = {"b": np.bool_, "i": np.int64, "f": np.float64, "s": np.int32, "j": np.int32}
+
+def _kind(value):
+    if isinstance(value, (bool, np.bool_)):
+        return "b"
+    if isinstance(value, (int, np.integer)):
+        return "i"
+    if isinstance(value, (float, np.floating)):
+        return "f"
+    if isinstance(value, str):
+        return "s"
+    return "j"
+
+class Column:
+    def __init__(self, kind):
+        self.kind = kind
+        self.data = np.zeros(0, dtype=COLUMN_DTYPES[kind])
+        self.valid = np.zeros(0, dtype=bool)
+        self.values, self.codes = [], {}
+
+    def accepts(self, value):
+        k = _kind(value)
+        return k == self.kind or (self.kind == "f" and k == "i") or self.kind == "j"
+
+    def get(self, i):
+        if i >= len(self.valid) or not self.valid[i]:
+            return None
+        v = self.data[i]
+        if self.kind == "s":
+            return self.values[v]
+        if self.kind == "j":
+            return json.loads(self.values[v])
+        return {"b": bool, "i": int, "f": float}[self.kind](v)
+
+    def set(self, i, value):
+        if value is None:
+            if i < len(self.valid):
+                self.valid[i] = False
+            return
+        self.data, self.valid = _reserve(self.data, i + 1), _reserve(self.valid, i + 1)
+        if self.kind in "sj":
+            if self.kind == "j":
+                value = json.dumps(value, sort_keys=True, default=str)
+            code = self.codes.get(value)
+            if code is None:
+                code = self.codes[value] = len(self.values)
+                self.values.append(value)
+            value = code
+        self.data[i] = value
+        self.valid[i] = True
+
+    def promote(self, value):
+        # int + float -> float ; tout autre mélange -> JSON
+        kind = "f" if {self.kind, _kind(value)} == {"i", "f"} else "j"
+        col = Column(kind)
+        for i in np.flatnonzero(self.valid).tolist():
+            col.set(i, self.get(i))
+        return col
+
+    def floats(self, n):
+        out = np.full(n, np.nan)
+        m = min(n, len(self.valid))
+        if self.kind in "bif":
+            out[:m] = np.where(self.valid[:m], self.data[:m], np.nan)
+        else:
+            for i in np.flatnonzero(self.valid[:m]).tolist():
+                try:
+                    out[i] = float(self.get(i))
+                except (TypeError, ValueError):
+                    pass
+        return out
+
+    def arrays(self, n):
+        data, valid = _reserve(self.data, n)[:n].copy(), _reserve(self.valid, n)[:n].copy()
+        values = np.zeros(0, dtype=str)
+        if self.kind in "sj":
+            # Dictionnaire compacté : seules les valeurs encore référencées sont écrites
+            used, inverse = np.unique(data[valid], return_inverse=True)
+            data[valid] = inverse
+            data[~valid] = 0
+            values = np.array([self.values[c] for c in used.tolist()], dtype=str)
+        return data, valid, values
+
+    @classmethod
+    def from_arrays(cls, kind, data, valid, values):
+        col = cls(kind)
+        col.data, col.valid = data.astype(COLUMN_DTYPES[kind]), valid.astype(bool)
+        if kind in "sj":
+            col.values = values.tolist()
+            col.codes = {v: c for c, v in enumerate(col.values)}
+        return col
+
+class Columns:
+    # Propriétés d'une famille de lignes (nœuds, ou arêtes d'un type), une colonne par propriété
+    def __init__(self):
+        self.cols = {}
+
+    def get(self, i, prop):
+        col = self.cols.get(prop)
+        return None if col is None else col.get(i)
+
+    def set(self, i, prop, value):
+        col = self.cols.get(prop)
+        if value is None:
+            if col is not None:
+                col.set(i, None)
+            return
+        if col is None:
+            col = self.cols[prop] = Column(_kind(value))
+        elif not col.accepts(value):
+            col = self.cols[prop] = col.promote(value)
+        col.set(i, value)
+
+    def properties(self, i):
+        out = {}
+        for prop, col in self.cols.items():
+            v = col.get(i)
+            if v is not None:
+                out[prop] = v
+        return out
+
+    def floats(self, prop, n):
+        col = self.cols.get(prop)
+        return np.full(n, np.nan) if col is None else col.floats(n)
+
+    def valid(self, prop, n):
+        col = self.cols.get(prop)
+        return np.zeros(n, dtype=bool) if col is None else _reserve(col.valid, n)[:n].copy()
+
+    def save(self, prefix, n, arrays):
+        # Colonnes numérotées (les noms de propriétés ne sont pas des noms de fichiers sûrs)
+        meta = []
+        for k, (prop, col) in enumerate(self.cols.items()):
+            data, valid, values = col.arrays(n)
+            arrays[f"{prefix}{k}__data"], arrays[f"{prefix}{k}__valid"] = data, valid
+            arrays[f"{prefix}{k}__values"] = values
+            meta.append([prop, col.kind])
+        return meta
+
+    @classmethod
+    def load(cls, prefix, meta, data):
+        cols = cls()
+        for k, (prop, kind) in enumerate(meta):
+            cols.cols[prop] = Column.from_arrays(kind, data[f"{prefix}{k}__data"], data[f"{prefix}{k}__valid"],
+                                                 data[f"{prefix}{k}__values"])
+        return cols
+
+# ======================== 2. TABLE D'ARÊTES (UN TYPE DE RELATION) ========================
+class EdgeTable:
+    # Extrémités, identifiants Neo4j (-1 : pas encore synchronisée) et état en tableaux numpy ;
+    # CSR construite à la demande, les arêtes ajoutées ensuite vont dans des listes de
+    # complément par nœud, fusionnées au prochain compactage
+    def __init__(self, rel_type):
+        self.type = _check_name(rel_type)
+        self.n = 0
+        self._src = np.zeros(0, dtype=np.int64)
+        self._dst = np.zeros(0, dtype=np.int64)
+        self._rid = np.zeros(0, dtype=np.int64)
+        self._alive = np.zeros(0, dtype=bool)
+        self.props = Columns()
+        self.dirty = set()
+        self.deleted = []
+        self._csr = None
+        self._extra_out = defaultdict(list)
+        self._extra_in = defaultdict(list)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def src(self):
+        return self._src[:self.n]
+
+    @property
+    def dst(self):
+        return self._dst[:self.n]
+
+    @property
+    def rid(self):
+        return self._rid[:self.n]
+
+    @property
+    def alive(self):
+        return self._alive[:self.n]
+
+    def add(self, src, dst, props=None, rid=None, dirty=True):
+        i = self.n
+        self.n += 1
+        self._src, self._dst = _reserve(self._src, self.n), _reserve(self._dst, self.n)
+        self._rid, self._alive = _reserve(self._rid, self.n, MISSING), _reserve(self._alive, self.n)
+        self._src[i], self._dst[i] = src, dst
+        self._rid[i] = MISSING if rid is None else rid
+        self._alive[i] = True
+        for k, v in (props or {}).items():
+            self.props.set(i, k, v)
+        if dirty:
+            self.dirty.add(i)
+        if self._csr is not None:
+            self._extra_out[int(src)].append(i)
+            self._extra_in[int(dst)].append(i)
+            if sum(map(len, self._extra_out.values())) > max(1024, self.n // 4):
+                self._csr = None
+        return i
+
+    def get(self, i, prop):
+        return self.props.get(i, prop)
+
+    def set(self, i, prop, value):
+        if self.get(i, prop) != value:
+            self.props.set(i, prop, value)
+            self.dirty.add(i)
+
+    def properties(self, i):
+        return self.props.properties(i)
+
+    def delete(self, i):
+        if not self._alive[i]:
+            return
+        self._alive[i] = False
+        if self._rid[i] != MISSING:
+            self.deleted.append(int(self._rid[i]))
+        self.dirty.discard(i)
+
+    def between(self, a, b):
+        return [i for i in self.out_edges(a) if self._dst[i] == b]
+
+    def arrays(self):
+        # (src, dst) des arêtes vivantes
+        live = np.flatnonzero(self.alive)
+        return self.src[live], self.dst[live], live
+
+    def _build(self):
+        src, dst = self.src, self.dst
+        n = int(max(src.max(initial=-1), dst.max(initial=-1))) + 1
+        out = np.argsort(src, kind="stable")
+        inn = np.argsort(dst, kind="stable")
+        out_ptr = np.zeros(n + 1, dtype=np.int64)
+        in_ptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n), out=out_ptr[1:])
+        np.cumsum(np.bincount(dst, minlength=n), out=in_ptr[1:])
+        self._csr = (out_ptr, out, in_ptr, inn)
+        self._extra_out.clear()
+        self._extra_in.clear()
+
+    def _edges(self, node, outgoing):
+        if self._csr is None:
+            self._build()
+        out_ptr, out, in_ptr, inn = self._csr
+        ptr, idx, extra = (out_ptr, out, self._extra_out) if outgoing else (in_ptr, inn, self._extra_in)
+        base = idx[ptr[node]:ptr[node + 1]].tolist() if node + 1 < len(ptr) else []
+        return [i for i in base + extra.get(int(node), []) if self._alive[i]]
+
+    def out_edges(self, node):
+        return self._edges(node, True)
+
+    def in_edges(self, node):
+        return self._edges(node, False)
+
+# ======================== 3. MOTEUR ========================
+class GraphEngine:
+    def __init__(self):
+        self.n_nodes = 0
+        self._eid = np.zeros(0, dtype=np.int64)
+        self._node_label = np.zeros(0, dtype=np.int32)
+        self.label_sets = []
+        self._label_ids = {}
+        self.node_props = Columns()
+        self.edges = {}
+        self.index = defaultdict(list)
+        self.dirty_nodes = set()
+
+    @property
+    def eid(self):
+        # Identifiant Neo4j par nœud (-1 : créé localement, pas encore synchronisé)
+        return self._eid[:self.n_nodes]
+
+    @property
+    def node_label(self):
+        return self._node_label[:self.n_nodes]
+
+    @property
+    def n_edges(self):
+        return sum(int(np.count_nonzero(t.alive)) for t in self.edges.values())
+
+    # ---------- nœuds ----------
+    def _intern(self, labels):
+        key = tuple(sorted(labels))
+        if key not in self._label_ids:
+            self._label_ids[key] = len(self.label_sets)
+            self.label_sets.append(key)
+        return self._label_ids[key]
+
+    def labels(self, i):
+        return self.label_sets[self._node_label[i]]
+
+    def has_label(self, i, label):
+        return label in self.label_sets[self._node_label[i]]
+
+    def add_node(self, labels, props=None, eid=None, dirty=True):
+        i = self.n_nodes
+        self.n_nodes += 1
+        self._eid = _reserve(self._eid, self.n_nodes, MISSING)
+        self._node_label = _reserve(self._node_label, self.n_nodes)
+        self._eid[i] = MISSING if eid is None else eid
+        self._node_label[i] = self._intern(labels)
+        props = props or {}
+        for k, v in props.items():
+            self.node_props.set(i, k, v)
+        for label in labels:
+            key = props.get(key_prop(label))
+            if key is not None:
+                self.index[(label, key)].append(i)
+        if dirty:
+            self.dirty_nodes.add(i)
+        return i
+
+    def get(self, i, prop):
+        return self.node_props.get(i, prop)
+
+    def set(self, i, prop, value):
+        if self.get(i, prop) != value:
+            self.node_props.set(i, prop, value)
+            self.dirty_nodes.add(i)
+
+    def properties(self, i):
+        return self.node_props.properties(i)
+
+    def floats(self, prop):
+        # Colonne numérique d'une propriété (NaN si absente)
+        return self.node_props.floats(prop, self.n_nodes)
+
+    def find(self, label, key, **props):
+        return [i for i in self.index.get((label, key), ())
+                if all(self.get(i, k) == v for k, v in props.items())]
+
+    def merge_node(self, label, key, props=None):
+        found = self.find(label, key)
+        if found:
+            return found[0], False
+        return self.add_node((label,), {key_prop(label): key, **(props or {})}), True
+
+    def label_mask(self, label):
+        has = np.array([label in s for s in self.label_sets], dtype=bool)
+        return has[self.node_label] if self.n_nodes else np.zeros(0, dtype=bool)
+
+    # ---------- arêtes ----------
+    def table(self, rel_type):
+        if rel_type not in self.edges:
+            self.edges[rel_type] = EdgeTable(rel_type)
+        return self.edges[rel_type]
+
+    def merge_edge(self, rel_type, a, b, on_create=None, on_match=None):
+        t = self.table(rel_type)
+        existing = t.between(a, b)
+        if existing:
+            for k, v in (on_match or {}).items():
+                t.set(existing[0], k, v)
+            return existing[0], False
+        return t.add(a, b, on_create), True
+
+    def degree(self, i):
+        return sum(len(t.out_edges(i)) + len(t.in_edges(i)) for t in self.edges.values())
+
+    def _adjacency(self, rel_type, reverse=False, undirected=False):
+        # (indptr, cibles) sur les arêtes vivantes, pour les jointures vectorisées
+        t = self.edges.get(rel_type)
+        if t is None:
+            return np.zeros(self.n_nodes + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        src, dst, _ = t.arrays()
+        if reverse:
+            src, dst = dst, src
+        if undirected:
+            src, dst = np.concatenate([src, dst]), np.concatenate([dst, src])
+        order = np.argsort(src, kind="stable")
+        ptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=self.n_nodes), out=ptr[1:])
+        return ptr, dst[order]
+
+    # ======================== 4. SNAPSHOT ========================
+    def save(self, path=GRAPH_SNAPSHOT):
+        # Tout en tableaux typés ; le JSON ne porte que les labels et le schéma des colonnes
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        arrays = {"eid": self.eid, "node_label": self.node_label,
+                  "dirty_nodes": np.array(sorted(self.dirty_nodes), dtype=np.int64)}
+        meta = {"label_sets": self.label_sets,
+                "node_props": self.node_props.save("nodes__", self.n_nodes, arrays), "edges": []}
+        for k, (rel_type, t) in enumerate(self.edges.items()):
+            prefix = f"edges{k}__"
+            arrays[f"{prefix}src"], arrays[f"{prefix}dst"] = t.src, t.dst
+            arrays[f"{prefix}rid"], arrays[f"{prefix}alive"] = t.rid, t.alive
+            arrays[f"{prefix}dirty"] = np.array(sorted(t.dirty), dtype=np.int64)
+            arrays[f"{prefix}deleted"] = np.array(t.deleted, dtype=np.int64)
+            meta["edges"].append([rel_type, t.props.save(f"{prefix}props", len(t), arrays)])
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(tmp, meta=json.dumps(meta), **arrays)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=GRAPH_SNAPSHOT):
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        g = cls()
+        for labels in meta["label_sets"]:
+            g._intern(labels)
+        g._eid, g._node_label = data["eid"].astype(np.int64), data["node_label"].astype(np.int32)
+        g.n_nodes = len(g._eid)
+        g.node_props = Columns.load("nodes__", meta["node_props"], data)
+        g.dirty_nodes = set(data["dirty_nodes"].tolist())
+        for label in {l for labels in g.label_sets for l in labels}:
+            col = g.node_props.cols.get(key_prop(label))
+            if col is None:
+                continue
+            for i in np.flatnonzero(g.label_mask(label) & g.node_props.valid(key_prop(label), g.n_nodes)).tolist():
+                g.index[(label, col.get(i))].append(i)
+        for k, (rel_type, props_meta) in enumerate(meta["edges"]):
+            prefix = f"edges{k}__"
+            t = g.table(rel_type)
+            t._src, t._dst = data[f"{prefix}src"].astype(np.int64), data[f"{prefix}dst"].astype(np.int64)
+            t._rid, t._alive = data[f"{prefix}rid"].astype(np.int64), data[f"{prefix}alive"].astype(bool)
+            t.n = len(t._src)
+            t.props = Columns.load(f"{prefix}props", props_meta, data)
+            t.dirty, t.deleted = set(data[f"{prefix}dirty"].tolist()), data[f"{prefix}deleted"].tolist()
+        return g
+
+    # ======================== 5. CHARGEMENT / SYNCHRONISATION NEO4J ========================
+    @classmethod
+    def from_neo4j(cls, graph, batch_size=DEFAULT_BATCH_SIZE * 2):
+        g = cls()
+        by_eid = {}
+        after = -1
+        while True:
+            rows = graph.run("""
+                MATCH (n) WHERE id(n) > $after
+                RETURN id(n) AS id, labels(n) AS labels, properties(n) AS props
+                ORDER BY id(n) LIMIT $limit""", after=after, limit=batch_size).data()
+            for r in rows:
+                by_eid[r["id"]] = g.add_node(r["labels"], r["props"], eid=r["id"], dirty=False)
+            if len(rows) < batch_size:
+                break
+            after = rows[-1]["id"]
+        # Une arête vers un nœud créé après la lecture des nœuds est ignorée : le
+        # snapshot reste celui des nœuds lus, elle sera reprise au prochain pull
+        after, skipped = -1, 0
+        while True:
+            rows = graph.run("""
+                MATCH (a)-[r]->(b) WHERE id(r) > $after
+                RETURN id(r) AS id, type(r) AS type, id(a) AS a, id(b) AS b, properties(r) AS props
+                ORDER BY id(r) LIMIT $limit""", after=after, limit=batch_size).data()
+            for r in rows:
+                a, b = by_eid.get(r["a"]), by_eid.get(r["b"])
+                if a is None or b is None:
+                    skipped += 1
+                    continue
+                g.table(r["type"]).add(a, b, r["props"], rid=r["id"], dirty=False)
+            if len(rows) < batch_size:
+                break
+            after = rows[-1]["id"]
+        if skipped:
+            print(f"⚠️ {skipped} arêtes vers des nœuds créés pendant la lecture ignorées")
+        return g
+
+    def _run_batches(self, graph, query, rows, batch_size, **params):
+        out = []
+        for i in range(0, len(rows), batch_size):
+            tx = graph.begin()
+            out.extend(tx.run(query, rows=rows[i:i + batch_size], **params).data())
+            tx.commit()
+        return out
+
+    def sync_to_neo4j(self, graph, batch_size=DEFAULT_BATCH_SIZE):
+        # Envoie uniquement les nœuds / arêtes créés, modifiés ou supprimés localement.
+        # Une ligne modifiée est renvoyée en entier (SET n = row.props) : une propriété
+        # effacée localement (set(..., None), _replace_props) disparaît aussi de Neo4j.
+        counts = defaultdict(int)
+        new_nodes = defaultdict(list)
+        changed_nodes = []
+        for i in sorted(self.dirty_nodes):
+            if self.eid[i] == MISSING:
+                new_nodes[self.labels(i)].append(i)
+            else:
+                changed_nodes.append({"id": int(self.eid[i]), "props": self.properties(i)})
+        for labels, ids in new_nodes.items():
+            primary = _check_name(labels[0])
+            extra = "".join(f":{_check_name(l)}" for l in labels[1:])
+            # Nœud créé localement : le MERGE peut retrouver un nœud écrit depuis par un
+            # pipeline, dont les propriétés sont complétées plutôt que remplacées
+            query = f"""
+                UNWIND $rows AS row
+                MERGE (n:{primary} {{{_check_name(key_prop(primary))}: row.key}})
+                SET n += row.props {"SET n" + extra if extra else ""}
+                RETURN row.i AS i, id(n) AS id"""
+            rows = [{"i": i, "key": self.get(i, key_prop(primary)), "props": self.properties(i)} for i in ids]
+            for r in self._run_batches(graph, query, rows, batch_size):
+                self.eid[r["i"]] = r["id"]
+            counts["nodes_created"] += len(rows)
+        self._run_batches(graph, """
+            UNWIND $rows AS row
+            MATCH (n) WHERE id(n) = row.id
+            SET n = row.props""", changed_nodes, batch_size)
+        counts["nodes_updated"] = len(changed_nodes)
+        self.dirty_nodes.clear()
+
+        for rel_type, t in self.edges.items():
+            if t.deleted:
+                self._run_batches(graph, """
+                    UNWIND $rows AS rid
+                    MATCH ()-[r]->() WHERE id(r) = rid
+                    DELETE r""", t.deleted, batch_size)
+                counts["edges_deleted"] += len(t.deleted)
+                t.deleted = []
+            created = [{"i": i, "a": int(self.eid[t.src[i]]), "b": int(self.eid[t.dst[i]]), "props": t.properties(i)}
+                       for i in sorted(t.dirty) if t.rid[i] == MISSING]
+            updated = [{"id": int(t.rid[i]), "props": t.properties(i)} for i in sorted(t.dirty) if t.rid[i] != MISSING]
+            for r in self._run_batches(graph, f"""
+                    UNWIND $rows AS row
+                    MATCH (a) WHERE id(a) = row.a
+                    MATCH (b) WHERE id(b) = row.b
+                    MERGE (a)-[r:{t.type}]->(b)
+                    SET r = row.props
+                    RETURN row.i AS i, id(r) AS id""", created, batch_size):
+                t.rid[r["i"]] = r["id"]
+            self._run_batches(graph, """
+                UNWIND $rows AS row
+                MATCH ()-[r]->() WHERE id(r) = row.id
+                SET r = row.props""", updated, batch_size)
+            counts["edges_created"] += len(created)
+            counts["edges_updated"] += len(updated)
+            t.dirty.clear()
+        return dict(counts)
+
+    # ======================== 6. OPÉRATIONS NATIVES ========================
+    def cves(self, source):
+        return [i for i in np.flatnonzero(self.label_mask("CVE")).tolist() if self.get(i, "source") == source]
+
+    def write_same_as(self, matches):
+        # Même contrat que same_as_bulk.write_same_as
+        now = datetime.utcnow().isoformat()
+        t = self.table("SAME_AS")
+        created, seen = set(), 0
+        for m in matches:
+            for a in self.find("CVE", m["kg1"], source="NVD"):
+                for b in self.find("CVE", m["kg2"], source="NESSUS"):
+                    seen += 1
+                    if t.between(a, b) or t.between(b, a):
+                        continue
+                    t.add(a, b, {"method": m["method"], "score": m["score"], "created_at": now})
+                    created.add(m["kg2"])
+        counts = {"created": len(created), "existing": seen - len(created),
+                  "missing": len(matches) - seen}
+        return counts, [m for m in matches if m["kg2"] in created]
+
+    def drop_same_as(self, pairs):
+        now = datetime.utcnow().isoformat()
+        t = self.table("SAME_AS")
+        dropped = 0
+        for p in pairs:
+            for a in self.find("CVE", p["kg1"], source="NVD"):
+                for b in self.find("CVE", p["kg2"], source="NESSUS"):
+                    for i in t.between(a, b) + t.between(b, a):
+                        if t.get(i, "method") is not None:
+                            t.delete(i)
+                            self.set(a, "same_as_changed_at", now)
+                            self.set(b, "same_as_changed_at", now)
+                            dropped += 1
+        return dropped
+
+    def same_as_pairs(self):
+        t = self.edges.get("SAME_AS")
+        pairs = set()
+        if t is not None:
+            src, dst, _ = t.arrays()
+            for a, b in zip(src.tolist(), dst.tolist()):
+                for c1, c2 in ((a, b), (b, a)):
+                    if self.get(c1, "source") == "NVD" and self.get(c2, "source") == "NESSUS":
+                        pairs.add((c1, c2))
+        return sorted(pairs, key=lambda p: (self.get(p[0], "name"), self.get(p[1], "name")))
+
+    def _edge_values(self, node, prop):
+        values = [t.get(i, prop) for t in self.edges.values() for i in t.out_edges(node) + t.in_edges(node)]
+        return [v for v in values if v is not None]
+
+    def fusion_signature(self, c1, c2):
+        # Même signature que fusion_bulk.Q_FUSE
+        last_seen = self._edge_values(c2, "last_seen")
+        changed = self._edge_values(c1, "changed_at") + self._edge_values(c2, "changed_at")
+        resolved = self._edge_values(c2, "resolved_at")
+        return (f"{self.get(c1, 'updated_at') or ''}|{self.get(c2, 'updated_at') or ''}|"
+                f"{self.degree(c1)}|{self.degree(c2)}|{max(last_seen) if last_seen else ''}|"
+                f"{max(changed) if changed else ''}|{max(resolved) if resolved else ''}")
+
+    def _replace_props(self, t, i, props):
+        # SET rel = properties(r) : les propriétés absentes de la source sont effacées
+        for k in set(t.properties(i)) | set(props):
+            t.set(i, k, props.get(k))
+
+    def fuse_pairs(self, force=False):
+        # Équivalent natif de fusion_bulk.fuse_pairs (sans lots ni point de reprise)
+        now = datetime.utcnow().isoformat()
+        same_as = self.table("SAME_AS")
+        counts = {"pairs": 0, "fused": 0, "edges": 0, "pruned": 0}
+        for c1, c2 in self.same_as_pairs():
+            counts["pairs"] += 1
+            links = same_as.between(c1, c2) + same_as.between(c2, c1)
+            sig = self.fusion_signature(c1, c2)
+            if not force and all(same_as.get(i, "fused_sig") == sig for i in links):
+                continue
+            u, _ = self.merge_node("CVE_UNIFIED", self.get(c1, "name"))
+            for prop, src in (("cvss", "cvss_score"), ("severity", "severity"),
+                              ("attackVector", "attackVector"), ("description", "description")):
+                v = self.get(c1, src)
+                self.set(u, prop, v if v is not None else self.get(c2, src))
+            self.set(u, "fused_at", now)
+            for rel_type, t in list(self.edges.items()):
+                if rel_type == "SAME_AS":
+                    continue
+                for c in (c1, c2):
+                    for i in t.out_edges(c):
+                        if t.dst[i] not in (c1, c2, u):
+                            props = t.properties(i)
+                            j, _ = self.merge_edge(rel_type, u, t.dst[i], props)
+                            self._replace_props(t, j, props)
+                            counts["edges"] += 1
+                    for i in t.in_edges(c):
+                        if t.src[i] not in (c1, c2, u):
+                            props = t.properties(i)
+                            j, _ = self.merge_edge(rel_type, t.src[i], u, props)
+                            self._replace_props(t, j, props)
+                            counts["edges"] += 1
+            counts["pruned"] += self._prune_unified(u, c1)
+            for i in links:
+                same_as.set(i, "fused_sig", sig)
+            counts["fused"] += 1
+        return counts
+
+    def _prune_unified(self, u, c1):
+        # Arêtes de u sans équivalent (même type, même sens, même voisin) sur c1 ou ses jumeaux Nessus
+        same_as = self.table("SAME_AS")
+        twins = {same_as.dst[i] for i in same_as.out_edges(c1)} | {same_as.src[i] for i in same_as.in_edges(c1)}
+        sources = {c1} | {c for c in twins if self.get(c, "source") == "NESSUS"}
+        pruned = 0
+        for rel_type, t in self.edges.items():
+            if rel_type == "SAME_AS":
+                continue
+            for i in t.out_edges(u):
+                if not any(t.between(c, t.dst[i]) for c in sources):
+                    t.delete(i)
+                    pruned += 1
+            for i in t.in_edges(u):
+                if not any(t.between(t.src[i], c) for c in sources):
+                    t.delete(i)
+                    pruned += 1
+        return pruned
+
+    def _expand(self, keys, ptr, targets):
+        # Jointure vectorisée : chaque ligne `keys[k]` est répétée pour chacune de ses cibles
+        counts = ptr[keys + 1] - ptr[keys]
+        rows = np.repeat(np.arange(len(keys)), counts)
+        offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        return rows, targets[np.repeat(ptr[keys], counts) + offsets]
+
+    def _aggregate(self, left, right, *weights):
+        key = left * self.n_nodes + right
+        uniq, inverse = np.unique(key, return_inverse=True)
+        sums = [np.bincount(inverse, weights=w, minlength=len(uniq)) for w in weights]
+        return (uniq // self.n_nodes, uniq % self.n_nodes, *sums)
+
+    def propagate_impacts(self):
+        # Host -HAS_PLUGIN-> Plugin -DETECTS-> CVE -SAME_AS- CVE <-IMPACTS- Service,
+        # agrégé par (host, service) avec la même sémantique que impacts.propagate_impacts
+        # (recalcul complet : weight = Σ cvss, paths = nombre de chemins)
+        counts = {"created": 0, "updated": 0, "removed": 0}
+        hp = self.edges.get("HAS_PLUGIN")
+        if not self.n_nodes or hp is None:
+            return counts
+        is_cve, is_plugin = self.label_mask("CVE"), self.label_mask("Plugin")
+        is_host, is_service = self.label_mask("Host"), self.label_mask("Service")
+        cvss = np.nan_to_num(self.floats("cvss_score"))
+
+        h, p, idx = hp.arrays()
+        open_ = ~hp.props.valid("resolved_at", len(hp))[idx]
+        keep = is_host[h] & is_plugin[p] & open_
+        h, p, mult = h[keep], p[keep], np.ones(int(keep.sum()))
+
+        rows, c = self._expand(p, *self._adjacency("DETECTS"))
+        keep = is_cve[c]
+        h, c, mult = self._aggregate(h[rows][keep], c[keep], mult[rows][keep])
+
+        rows, c2 = self._expand(c, *self._adjacency("SAME_AS", undirected=True))
+        keep = is_cve[c2]
+        h, c2, mult = self._aggregate(h[rows][keep], c2[keep], mult[rows][keep])
+
+        rows, s = self._expand(c2, *self._adjacency("IMPACTS", reverse=True))
+        keep = is_service[s]
+        h, s, m, c2 = h[rows][keep], s[keep], mult[rows][keep], c2[rows][keep]
+        h, s, n, total = self._aggregate(h, s, m, m * cvss[c2])
+
+        now = datetime.utcnow().isoformat()
+        t = self.table("IMPACTS")
+        targets = set()
+        for hi, si, ni, tot in zip(h.tolist(), s.tolist(), n.tolist(), total.tolist()):
+            targets.add((hi, si))
+            i, created = self.merge_edge("IMPACTS", hi, si, {"inferred": True})
+            if created or t.get(i, "weight") != tot or t.get(i, "paths") != int(ni):
+                t.set(i, "weight", tot)
+                t.set(i, "paths", int(ni))
+                t.set(i, "updated_at", now)
+                counts["created" if created else "updated"] += 1
+        # Plus aucun chemin : l'IMPACTS inféré Host -> Service n'a plus lieu d'être
+        # (les IMPACTS posés à la main sont conservés, comme dans impacts.Q_RECOMPUTE)
+        src, dst, live = t.arrays()
+        inferred = t.props.valid("inferred", len(t))[live]
+        for a, b, i, inf in zip(src.tolist(), dst.tolist(), live.tolist(), inferred.tolist()):
+            if inf and t.get(i, "inferred") and is_host[a] and is_service[b] and (a, b) not in targets:
+                t.delete(i)
+                counts["removed"] += 1
+        return counts
+
+# ======================== 7. CLI ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    pull = sub.add_parser("pull", help="Charge Neo4j dans un snapshot local")
+    pull.add_argument("--out", default=GRAPH_SNAPSHOT)
+    run = sub.add_parser("run", help="Fusion / propagation en mémoire sur un snapshot")
+    run.add_argument("--snapshot", default=GRAPH_SNAPSHOT)
+    run.add_argument("--fuse", action="store_true")
+    run.add_argument("--force", action="store_true", help="Refusionne toutes les paires")
+    run.add_argument("--propagate", action="store_true")
+    run.add_argument("--sync", action="store_true", help="Synchronise ensuite Neo4j")
+    sync = sub.add_parser("sync", help="Envoie les modifications du snapshot vers Neo4j")
+    sync.add_argument("--snapshot", default=GRAPH_SNAPSHOT)
+    args = parser.parse_args()
+
+    def neo4j():
+        from py2neo import Graph
+        uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+        user = os.getenv("NEO4J_USER", "neo4j")
+        pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+        return Graph(uri, auth=(user, pwd))
+
+    t0 = time.time()
+    if args.cmd == "pull":
+        engine = GraphEngine.from_neo4j(neo4j())
+        engine.save(args.out)
+        print(f"📥 Snapshot {args.out} : {engine.n_nodes} nœuds, {engine.n_edges} arêtes ({time.time() - t0:.1f}s)")
+    else:
+        engine = GraphEngine.load(args.snapshot)
+        print(f"📦 Snapshot chargé : {engine.n_nodes} nœuds, {engine.n_edges} arêtes ({time.time() - t0:.1f}s)")
+        if args.cmd == "run":
+            if args.fuse:
+                t0 = time.time()
+                counts = engine.fuse_pairs(force=args.force)
+                print(f"🔄 Fusion : {counts['fused']} / {counts['pairs']} paires, "
+                      f"{counts['edges']} arêtes fusionnées, {counts['pruned']} supprimées ({time.time() - t0:.2f}s)")
+            if args.propagate:
+                t0 = time.time()
+                counts = engine.propagate_impacts()
+                print(f"🔁 IMPACTS : {counts['created']} créées, {counts['updated']} mises à jour, "
+                      f"{counts['removed']} supprimées ({time.time() - t0:.2f}s)")
+            engine.save(args.snapshot)
+        if args.cmd == "sync" or args.sync:
+            t0 = time.time()
+            counts = engine.sync_to_neo4j(neo4j())
+            engine.save(args.snapshot)
+            print(f"📤 Synchronisation Neo4j : {counts} ({time.time() - t0:.1f}s)")
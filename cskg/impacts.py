@@ -0,0 +1,179 @@
+# ======================== PROPAGATION INCRÉMENTALE DES IMPACTS ========================
+# IMPACTS(host -> service) porte un agrégat exact :
+#   weight = somme des cvss_score des CVE c2 sur tous les chemins
+#            Host -HAS_PLUGIN-> Plugin -DETECTS-> CVE -SAME_AS- c2 <-IMPACTS- Service
+#   paths  = nombre de ces chemins (findings résolus exclus)
+# Seuls les hosts touchés par un changement depuis le dernier passage
+# (watermark) sont recalculés, et leurs agrégats sont réécrits (SET, jamais
+# d'addition) : une réexécution ne gonfle plus les poids. Les IMPACTS
+# Host -> Service créés par cette propagation portent inferred = true : ceux qui
+# n'ont plus de chemin sont supprimés, les autres (posés à la main) sont conservés.
+import argparse
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+IMPACTS_STATE_PATH = os.getenv("IMPACTS_STATE_PATH", "data/impacts_state.json")
+DEFAULT_BATCH_SIZE = 500
+
+Q_ALL_HOSTS = """
+MATCH (h:Host) WHERE h.name > $after
+RETURN h.name AS host
+ORDER BY host
+LIMIT $limit
+"""
+
+# Findings apparus ou résolus (changed_at posé par nessus_bulk / nessus_diff)
+Q_CHANGED_FINDINGS = """
+MATCH (h:Host)-[r:HAS_PLUGIN]->(:Plugin)
+WHERE r.changed_at > $since
+RETURN DISTINCT h.name AS host
+"""
+
+# CVE dont un chemin peut avoir changé : CVSS modifié, SAME_AS créé / supprimé, nouvelle détection
+Q_CHANGED_CVES = """
+MATCH (c:CVE) WHERE c.updated_at > $since OR c.same_as_changed_at > $since
+RETURN id(c) AS id
+UNION
+MATCH (c:CVE)-[s:SAME_AS]-(:CVE) WHERE s.created_at > $since
+RETURN id(c) AS id
+UNION
+MATCH (:Plugin)-[d:DETECTS]->(c:CVE) WHERE d.changed_at > $since
+RETURN id(c) AS id
+"""
+
+Q_HOSTS_OF_CVES = """
+UNWIND $ids AS cid
+MATCH (c:CVE) WHERE id(c) = cid
+OPTIONAL MATCH (c)-[:SAME_AS]-(o:CVE)
+WITH c, collect(o) AS others
+UNWIND [c] + others AS c0
+MATCH (h:Host)-[:HAS_PLUGIN]->(:Plugin)-[:DETECTS]->(c0)
+RETURN DISTINCT h.name AS host
+"""
+
+Q_HOSTS_OF_CVE_NAMES = """
+UNWIND $names AS n
+MATCH (c:CVE {name: n})
+OPTIONAL MATCH (c)-[:SAME_AS]-(o:CVE)
+WITH c, collect(o) AS others
+UNWIND [c] + others AS c0
+MATCH (h:Host)-[:HAS_PLUGIN]->(:Plugin)-[:DETECTS]->(c0)
+RETURN DISTINCT h.name AS host
+"""
+
+Q_RECOMPUTE = """
+UNWIND $hosts AS name
+MATCH (h:Host {name: name})
+CALL {
+  WITH h
+  OPTIONAL MATCH (h)-[hp:HAS_PLUGIN]->(:Plugin)-[:DETECTS]->(:CVE)-[:SAME_AS]-(c2:CVE)<-[:IMPACTS]-(s:Service)
+  WHERE hp.resolved_at IS NULL
+  WITH s, sum(coalesce(c2.cvss_score, 0.0)) AS weight, count(c2) AS paths
+  WHERE s IS NOT NULL
+  RETURN collect({s: s, weight: weight, paths: paths}) AS targets
+}
+CALL {
+  WITH h, targets
+  OPTIONAL MATCH (h)-[old:IMPACTS]->(s0:Service)
+  WHERE NOT s0 IN [t IN targets | t.s] AND old.inferred = true
+  DELETE old
+  RETURN count(old) AS removed
+}
+CALL {
+  WITH h, targets
+  UNWIND targets AS t
+  WITH h, t, t.s AS s
+  MERGE (h)-[r:IMPACTS]->(s)
+  ON CREATE SET r.inferred = true
+  SET r.weight = t.weight, r.paths = t.paths, r.updated_at = $now
+  RETURN count(r) AS written
+}
+RETURN sum(removed) AS removed, sum(written) AS written
+"""
+
+# ======================== 1. ÉTAT ========================
+def load_watermark(path=IMPACTS_STATE_PATH):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        return json.load(f).get("watermark")
+
+def save_watermark(watermark, path=IMPACTS_STATE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"watermark": watermark}, f)
+    os.replace(tmp, path)
+
+# ======================== 2. ENSEMBLE DE CHANGEMENTS ========================
+def all_hosts(graph, batch_size=10000):
+    hosts, after = [], ""
+    while True:
+        rows = graph.run(Q_ALL_HOSTS, after=after, limit=batch_size).data()
+        hosts.extend(r["host"] for r in rows)
+        if len(rows) < batch_size:
+            return hosts
+        after = rows[-1]["host"]
+
+def affected_hosts(graph, since, batch_size=DEFAULT_BATCH_SIZE):
+    hosts = {r["host"] for r in graph.run(Q_CHANGED_FINDINGS, since=since).data()}
+    cves = [r["id"] for r in graph.run(Q_CHANGED_CVES, since=since).data()]
+    for i in range(0, len(cves), batch_size):
+        hosts.update(r["host"] for r in graph.run(Q_HOSTS_OF_CVES, ids=cves[i:i + batch_size]).data())
+    return sorted(hosts), len(cves)
+
+def hosts_of_cves(graph, names):
+    return sorted({r["host"] for r in graph.run(Q_HOSTS_OF_CVE_NAMES, names=list(names)).data()})
+
+# ======================== 3. PROPAGATION ========================
+def recompute_hosts(graph, hosts, now=None, batch_size=DEFAULT_BATCH_SIZE):
+    # Réécrit les agrégats IMPACTS exacts des hosts donnés, un lot par transaction
+    now = now or datetime.utcnow().isoformat()
+    hosts = list(hosts)
+    counts = {"hosts": len(hosts), "written": 0, "removed": 0}
+    for i in range(0, len(hosts), batch_size):
+        tx = graph.begin()
+        res = tx.run(Q_RECOMPUTE, hosts=hosts[i:i + batch_size], now=now).data()
+        tx.commit()
+        if res:
+            counts["written"] += res[0]["written"] or 0
+            counts["removed"] += res[0]["removed"] or 0
+    return counts
+
+def propagate_impacts(graph, state_path=IMPACTS_STATE_PATH, full=False, batch_size=DEFAULT_BATCH_SIZE):
+    # Watermark pris avant la lecture du delta : rien n'est perdu entre deux passages
+    started = datetime.utcnow().isoformat()
+    since = None if full else load_watermark(state_path)
+    if since is None:
+        hosts = all_hosts(graph)
+        print(f"🔁 Propagation IMPACTS complète : {len(hosts)} hosts")
+    else:
+        hosts, n_cves = affected_hosts(graph, since, batch_size)
+        print(f"🔁 Propagation IMPACTS incrémentale depuis {since} : "
+              f"{n_cves} CVE modifiées, {len(hosts)} hosts à recalculer")
+
+    counts = recompute_hosts(graph, hosts, now=started, batch_size=batch_size)
+    save_watermark(started, state_path)
+    print(f"🔁 Propagation IMPACTS terminée : {counts['written']} relations à jour, "
+          f"{counts['removed']} supprimées.")
+    return counts
+
+# ======================== 4. MAIN ========================
+if __name__ == "__main__":
+    from py2neo import Graph
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true", help="Recalcule tous les hosts (ignore le watermark)")
+    parser.add_argument("--state", default=IMPACTS_STATE_PATH)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+    propagate_impacts(Graph(uri, auth=(user, pwd)), state_path=args.state, full=args.full,
+                      batch_size=args.batch_size)
@@ -0,0 +1,207 @@
+# ======================== ENRICHISSEMENT NER DES DESCRIPTIONS CVE ========================
+# Étape séparée de l'ingestion structurée : les descriptions passent par le
+# transformer par lots, les résultats sont mis en cache (SQLite) par
+# hash(modèle + description), et le seuil NER_THRESHOLD est appliqué à la lecture,
+# si bien que changer de seuil ne demande pas de relancer l'inférence.
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+NER_MODEL = os.getenv("NER_MODEL", "dslim/bert-base-NER")
+NER_THRESHOLD = float(os.getenv("NER_THRESHOLD", "0.5"))
+NER_CACHE_PATH = os.getenv("NER_CACHE_PATH", "data/ner_cache.sqlite")
+NER_QUEUE_SIZE = int(os.getenv("NER_QUEUE_SIZE", "8"))
+
+# ======================== 1. CACHE PERSISTANT ========================
+def cache_key(description, model=NER_MODEL):
+    return hashlib.sha256(f"{model}\0{description}".encode("utf-8")).hexdigest()
+
+class NERCache:
+    def __init__(self, path=NER_CACHE_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS ner (key TEXT PRIMARY KEY, entities TEXT NOT NULL)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, entities in self.conn.execute(
+                        f"SELECT key, entities FROM ner WHERE key IN ({marks})", chunk):
+                    found[key] = json.loads(entities)
+        return found
+
+    def put_many(self, items):
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO ner (key, entities) VALUES (?, ?)",
+                                  [(k, json.dumps(v)) for k, v in items.items()])
+            self.conn.commit()
+
+# ======================== 2. ENRICHISSEUR PAR LOTS ========================
+class NEREnricher:
+    def __init__(self, model=NER_MODEL, threshold=NER_THRESHOLD, cache_path=NER_CACHE_PATH,
+                 batch_size=32, num_threads=None):
+        self.model = model
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.num_threads = num_threads or os.cpu_count()
+        self.cache = NERCache(cache_path) if cache_path else None
+        self._pipeline = None
+        self._load_lock = threading.Lock()
+
+    @property
+    def pipeline(self):
+        # Chargement paresseux : aucun coût tant que tout est en cache
+        with self._load_lock:
+            if self._pipeline is None:
+                import torch
+                from transformers import pipeline
+                torch.set_num_threads(self.num_threads)
+                print(f"📦 Chargement du modèle NER {self.model}...")
+                ner = pipeline("ner", model=self.model, aggregation_strategy="simple")
+                # Sans model_max_length renseigné, le tokenizer ne tronque pas et une
+                # description de plus de 512 tokens fait échouer tout le lot
+                limit = getattr(ner.model.config, "max_position_embeddings", None)
+                if limit and not 0 < ner.tokenizer.model_max_length <= limit:
+                    ner.tokenizer.model_max_length = limit
+                self._pipeline = ner
+        return self._pipeline
+
+    def _infer(self, descriptions):
+        outputs = self.pipeline(descriptions, batch_size=self.batch_size)
+        return [[{"name": ent["word"], "type": ent["entity_group"], "score": float(ent["score"])}
+                 for ent in ents] for ents in outputs]
+
+    def _infer_each(self, descriptions):
+        # Reprise d'un lot en échec description par description : None pour celles qui échouent encore
+        results = []
+        for desc in descriptions:
+            try:
+                results.extend(self._infer([desc]))
+            except Exception as e:
+                print(f"⚠️ NER en échec sur une description ({len(desc)} caractères): {e}")
+                results.append(None)
+        return results
+
+    def raw_entities(self, descriptions):
+        keys = [cache_key(d, self.model) for d in descriptions]
+        cached = self.cache.get_many(set(keys)) if self.cache else {}
+
+        todo = {}
+        for key, desc in zip(keys, descriptions):
+            if key not in cached and key not in todo:
+                todo[key] = desc
+        if todo:
+            todo_keys = list(todo)
+            try:
+                results = self._infer([todo[k] for k in todo_keys])
+            except Exception as e:
+                print(f"⚠️ NER en échec sur un lot de {len(todo_keys)} descriptions, reprise une à une: {e}")
+                results = self._infer_each([todo[k] for k in todo_keys])
+            fresh = {k: r for k, r in zip(todo_keys, results) if r is not None}
+            if self.cache:
+                self.cache.put_many(fresh)
+            cached.update(fresh)
+        # None : description dont l'inférence a échoué
+        return [cached.get(k) for k in keys]
+
+    def entities_for(self, descriptions):
+        return [None if ents is None else [e for e in ents if e["score"] >= self.threshold]
+                for ents in self.raw_entities(descriptions)]
+
+# ======================== 3. ÉTAPE ASYNCHRONE ========================
+Q_RESET_FINGERPRINTS = """
+UNWIND $names AS n
+MATCH (c:CVE {name: n})
+REMOVE c.fingerprint
+"""
+
+class EnrichmentStage:
+    # Reçoit des (cve, description) depuis l'ingestion structurée et écrit les
+    # relations MENTIONS dans son propre thread. La file est bornée (queue_size lots,
+    # NER_QUEUE_SIZE) : l'ingestion avance sans attendre le modèle tant que le NER a
+    # moins de queue_size lots de retard, puis submit bloque (contre-pression voulue,
+    # mémoire bornée).
+    def __init__(self, graph, enricher, batch_size=256, queue_size=NER_QUEUE_SIZE):
+        self.graph = graph
+        self.enricher = enricher
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.errors = 0
+        self.failed = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, pairs, prune=()):
+        # `prune` : CVE modifiées dont les MENTIONS obsolètes doivent être retirées
+        pairs = list(pairs)
+        prune = set(prune)
+        for i in range(0, len(pairs), self.batch_size):
+            chunk = pairs[i:i + self.batch_size]
+            self.queue.put((chunk, [cve for cve, _ in chunk if cve in prune]))
+
+    def _run(self):
+        from nvd_bulk import write_entities
+        while True:
+            task = self.queue.get()
+            if task is None:
+                self.queue.task_done()
+                return
+            pairs, prune = task
+            try:
+                entities = self.enricher.entities_for([desc for _, desc in pairs])
+                # Seules les CVE dont l'inférence a échoué sont signalées et réinitialisées
+                bad = [cve for (cve, _), ents in zip(pairs, entities) if ents is None]
+                rows = [{"cve": cve, "name": e["name"], "type": e["type"]}
+                        for (cve, _), ents in zip(pairs, entities) if ents is not None for e in ents]
+                write_entities(self.graph, rows, prune=[cve for cve in prune if cve not in bad])
+                self.written += len(rows)
+                if bad:
+                    self.errors += 1
+                    self.failed.extend(bad)
+                    self._reset_fingerprints(bad)
+            except Exception as e:
+                self.errors += 1
+                self.failed.extend(cve for cve, _ in pairs)
+                print(f"⚠️ NER erreur sur le lot {pairs[0][0]} … {pairs[-1][0]}: {e}")
+                self._reset_fingerprints([cve for cve, _ in pairs])
+            finally:
+                self.queue.task_done()
+
+    def _reset_fingerprints(self, names):
+        # Empreinte effacée : une ingestion delta réécrira ces CVE et renverra leurs descriptions
+        try:
+            self.graph.run(Q_RESET_FINGERPRINTS, names=names)
+        except Exception as e:
+            print(f"⚠️ Empreintes non réinitialisées pour {len(names)} CVE: {e}")
+
+    def flush(self, strict=False):
+        # Attend que tous les lots soumis soient écrits (l'étape reste ouverte) ;
+        # `strict` : lève si des lots ont échoué depuis le dernier flush
+        self.queue.join()
+        if strict and self.failed:
+            failed, self.failed = self.failed, []
+            raise RuntimeError(f"NER en échec pour {len(failed)} CVE ({failed[0]} …)")
+        return self.written
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+        print(f"🧠 Enrichissement NER terminé : {self.written} relations MENTIONS.")
+        return self.written
@@ -0,0 +1,210 @@
+# ======================== IMPORT BULK DES SCANS NESSUS ========================
+# Normalise un export Nessus avec des opérations pandas vectorisées, dédoublonne
+# les entités Host/Plugin/Port/Service/CVE et les écrit avec quelques
+# transactions UNWIND au lieu d'une transaction (et d'un lookup CVE) par ligne.
+# Les CPE affichés dans la sortie des plugins deviennent des arêtes Host -HAS_CPE-> CPE
+# (plateformes installées, lues par priority.AssetIndex) ; le texte n'est pas conservé.
+import re
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 5000
+
+ALIAS = {
+    "pluginid":        "plugin_id",
+    "plugin_id_":      "plugin_id",
+    "id":              "plugin_id",
+    "plugin_name":     "plugin_name",
+    "name":            "plugin_name",
+    "risk_factor":     "risk",
+}
+REQUIRED = {"host", "plugin_name", "plugin_id", "port"}
+
+# Scores Nessus par finding (colonnes normalisées) conservés pour le scoring de risque
+SCORE_COLUMNS = {
+    "cvss3": "cvss_v3.0_base_score",
+    "cvss2": "cvss_v2.0_base_score",
+    "vpr":   "vpr_score",
+    "epss":  "epss_score",
+}
+
+CPE_PATTERN = re.compile(r"cpe:(?:/[aho]|2\.3:[aho])[^\s\"',;]*")
+
+# ======================== 1. NORMALISATION VECTORISÉE ========================
+def normalize_columns(df):
+    df.columns = (df.columns.str.strip()
+                            .str.lower()
+                            .str.replace(" ", "_"))
+    df = df.rename(columns=ALIAS)
+    # "Risk" et "Risk Factor" deviennent tous deux "risk" : on garde la première
+    df = df.loc[:, ~df.columns.duplicated()]
+
+    missing = REQUIRED - set(df.columns)
+    if missing:
+        raise ValueError(f"🚨 Colonnes manquantes dans le CSV : {missing}")
+    return df
+
+def _text(series):
+    return series.astype(str).str.strip()
+
+def normalize_frame(df):
+    # Une ligne par finding (host, plugin, port, service) + une colonne `cves` (liste)
+    out = pd.DataFrame({
+        "host":        _text(df["host"]),
+        "plugin_id":   _text(df["plugin_id"]),
+        "plugin_name": _text(df["plugin_name"]),
+        "port":        _text(df["port"]),
+    })
+    if "service" in df.columns:
+        out["service"] = _text(df["service"].fillna("unknown"))
+    else:
+        out["service"] = "unknown"
+    for col, src in SCORE_COLUMNS.items():
+        out[col] = pd.to_numeric(df[src], errors="coerce") if src in df.columns else np.nan
+    # "None" est lu comme valeur manquante par pandas
+    out["risk"] = _text(df["risk"].fillna("None")) if "risk" in df.columns else "None"
+
+    cve_col = df["cve"].fillna("") if "cve" in df.columns else pd.Series("", index=df.index)
+    out["cves"] = (cve_col.astype(str)
+                          .str.split(",")
+                          .map(lambda xs: [c.strip() for c in xs if c.startswith("CVE")]))
+    output = df["plugin_output"].fillna("") if "plugin_output" in df.columns else pd.Series("", index=df.index)
+    out["cpes"] = output.astype(str).str.findall(CPE_PATTERN).map(lambda xs: sorted(set(xs)))
+    return out
+
+# ======================== 2. DÉDOUBLONNAGE DES ENTITÉS ========================
+def _records(frame, columns):
+    return frame[columns].drop_duplicates().to_dict("records")
+
+def _nan_to_none(records):
+    for r in records:
+        for k, v in r.items():
+            if isinstance(v, float) and np.isnan(v):
+                r[k] = None
+    return records
+
+def plugin_scores(frame):
+    # Un jeu de scores par plugin (max sur ses lignes) : les scores Nessus sont par plugin
+    scores = frame.groupby("plugin_id", sort=False).agg(
+        plugin_name=("plugin_name", "first"), risk=("risk", "first"),
+        cvss3=("cvss3", "max"), cvss2=("cvss2", "max"), vpr=("vpr", "max"), epss=("epss", "max"))
+    return _nan_to_none(scores.reset_index().to_dict("records"))
+
+def build_entities(frame):
+    has_port = frame["port"].ne("") & frame["port"].ne("nan")
+    has_serv = frame["service"].ne("")
+    links = (frame[["host", "plugin_id", "cves"]]
+             .explode("cves")
+             .dropna(subset=["cves"])
+             .rename(columns={"cves": "cve"}))
+    platforms = (frame[["host", "cpes"]]
+                 .explode("cpes")
+                 .dropna(subset=["cpes"])
+                 .rename(columns={"cpes": "cpe"}))
+
+    return {
+        "hosts":      _records(frame, ["host"]),
+        "plugins":    plugin_scores(frame),
+        "ports":      _records(frame[has_port], ["port"]),
+        "services":   _records(frame[has_serv], ["service"]),
+        "cves":       _records(links, ["cve"]),
+        "cpes":       _records(platforms, ["cpe"]),
+        "has_plugin": _records(frame, ["host", "plugin_id"]),
+        "connected":  _records(frame[has_port], ["host", "port"]),
+        "runs":       _records(frame[has_serv], ["host", "service"]),
+        "detects":    _records(links, ["plugin_id", "cve"]),
+        "vulnerable": _records(links, ["host", "cve"]),
+        "has_cpe":    _records(platforms, ["host", "cpe"]),
+        "cve_scores": _records(frame, ["plugin_id"]),
+    }
+
+# ======================== 3. REQUÊTES UNWIND ========================
+QUERIES = [
+    ("hosts", """
+        UNWIND $rows AS row
+        MERGE (h:Host {name: row.host})
+        SET h.last_seen = $now"""),
+    ("plugins", """
+        UNWIND $rows AS row
+        MERGE (p:Plugin {plugin_id: row.plugin_id})
+        SET p.plugin_name = row.plugin_name, p.risk_factor = row.risk,
+            p.cvss3_score = row.cvss3, p.cvss2_score = row.cvss2,
+            p.vpr_score = row.vpr, p.epss_score = row.epss"""),
+    ("ports", """
+        UNWIND $rows AS row
+        MERGE (:Port {port: row.port})"""),
+    ("services", """
+        UNWIND $rows AS row
+        MERGE (:Service {name: row.service})"""),
+    ("cves", """
+        UNWIND $rows AS row
+        MERGE (c:CVE {name: row.cve})
+        ON CREATE SET c.source = 'NESSUS', c.updated_at = $now"""),
+    ("cpes", """
+        UNWIND $rows AS row
+        MERGE (:CPE {name: row.cpe})"""),
+    ("has_plugin", """
+        UNWIND $rows AS row
+        MATCH (h:Host {name: row.host}), (p:Plugin {plugin_id: row.plugin_id})
+        MERGE (h)-[r:HAS_PLUGIN]->(p)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    ("connected", """
+        UNWIND $rows AS row
+        MATCH (h:Host {name: row.host}), (p:Port {port: row.port})
+        MERGE (h)-[r:CONNECTED_TO]->(p)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    ("runs", """
+        UNWIND $rows AS row
+        MATCH (h:Host {name: row.host}), (s:Service {name: row.service})
+        MERGE (h)-[r:RUNS_SERVICE]->(s)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    ("detects", """
+        UNWIND $rows AS row
+        MATCH (p:Plugin {plugin_id: row.plugin_id}), (c:CVE {name: row.cve})
+        MERGE (p)-[r:DETECTS]->(c)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    ("vulnerable", """
+        UNWIND $rows AS row
+        MATCH (h:Host {name: row.host}), (c:CVE {name: row.cve})
+        MERGE (h)-[r:IS_VULNERABLE_TO]->(c)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    ("has_cpe", """
+        UNWIND $rows AS row
+        MATCH (h:Host {name: row.host}), (p:CPE {name: row.cpe})
+        MERGE (h)-[r:HAS_CPE]->(p)
+        ON CREATE SET r.first_seen = $now, r.changed_at = $now
+        SET r.changed_at = CASE WHEN r.resolved_at IS NULL THEN r.changed_at ELSE $now END,
+            r.last_seen = $now, r.resolved_at = null"""),
+    # Scores Nessus reportés sur les CVE : max sur tous les plugins qui les détectent
+    ("cve_scores", """
+        UNWIND $rows AS row
+        MATCH (:Plugin {plugin_id: row.plugin_id})-[:DETECTS]->(c:CVE)
+        WITH DISTINCT c
+        MATCH (p:Plugin)-[:DETECTS]->(c)
+        WITH c, max(p.cvss3_score) AS cvss3, max(p.vpr_score) AS vpr, max(p.epss_score) AS epss
+        SET c.cvss3_score = cvss3, c.vpr_score = vpr, c.epss_score = epss"""),
+]
+
+# ======================== 4. ÉCRITURE ========================
+def write_entities(graph, entities, now_iso, batch_size=DEFAULT_BATCH_SIZE):
+    # Les nœuds sont écrits avant les arêtes (ordre de QUERIES), un lot = une transaction
+    counts = {}
+    for key, query in QUERIES:
+        rows = entities.get(key, [])
+        for i in range(0, len(rows), batch_size):
+            tx = graph.begin()
+            tx.run(query, rows=rows[i:i + batch_size], now=now_iso)
+            tx.commit()
+        counts[key] = len(rows)
+    return counts
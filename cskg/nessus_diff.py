@@ -0,0 +1,273 @@
+# ======================== INGESTION MULTI-SCANS NESSUS AVEC DIFF ========================
+# Parse un répertoire (ou un glob) de scans dans un pool de processus, compare
+# chaque scan au précédent du même périmètre (new / resolved / persisting) et
+# n'écrit que le delta dans Neo4j, avec first_seen / last_seen / resolved_at
+# sur les arêtes. Un scan identique au précédent ne coûte qu'une mise à jour
+# de last_seen (UNWIND + SET par lots) sur ses hosts et ses arêtes persistantes. Les findings (host, plugin, service) et les scores
+# des plugins sont aussi diffés pour tenir à jour risk_scores.RiskStore.
+import argparse
+import glob
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+from nessus_bulk import plugin_scores, write_entities
+from nessus_reader import DEFAULT_CHUNKSIZE, iter_scan_chunks
+
+STATE_DIR = Path(os.getenv("SCAN_STATE_DIR", "data/scan_state"))
+SCAN_SUFFIXES = (".csv", ".nessus")
+SCOPE_DATE_SUFFIX = re.compile(r"[_\-.]\d{4}-?\d{2}-?\d{2}(T\d{4,6})?$")
+
+# Arêtes propres à un host : elles apparaissent et disparaissent avec les scans
+HOST_EDGES = {
+    "has_plugin": ("host", "plugin_id"),
+    "connected":  ("host", "port"),
+    "runs":       ("host", "service"),
+    "vulnerable": ("host", "cve"),
+    "has_cpe":    ("host", "cpe"),
+}
+# Arêtes de référentiel (plugin -> CVE) : ajoutées, jamais résolues
+GLOBAL_EDGES = {"detects": ("plugin_id", "cve")}
+# Findings suivis pour le scoring de risque (pas d'arête propre dans le graphe)
+FINDING_KEY = ("host", "plugin_id", "service")
+
+RESOLVE_QUERIES = {
+    "has_plugin": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:HAS_PLUGIN]->(:Plugin {plugin_id: row.plugin_id})
+        SET r.resolved_at = $now, r.changed_at = $now""",
+    "connected": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:CONNECTED_TO]->(:Port {port: row.port})
+        SET r.resolved_at = $now, r.changed_at = $now""",
+    "runs": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:RUNS_SERVICE]->(:Service {name: row.service})
+        SET r.resolved_at = $now, r.changed_at = $now""",
+    "vulnerable": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:IS_VULNERABLE_TO]->(:CVE {name: row.cve})
+        SET r.resolved_at = $now, r.changed_at = $now""",
+    "has_cpe": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:HAS_CPE]->(:CPE {name: row.cpe})
+        SET r.resolved_at = $now, r.changed_at = $now""",
+}
+
+# Arêtes toujours présentes : seul last_seen avance (ni changed_at, ni resolved_at)
+TOUCH_QUERIES = {
+    "has_plugin": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:HAS_PLUGIN]->(:Plugin {plugin_id: row.plugin_id})
+        SET r.last_seen = $now""",
+    "connected": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:CONNECTED_TO]->(:Port {port: row.port})
+        SET r.last_seen = $now""",
+    "runs": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:RUNS_SERVICE]->(:Service {name: row.service})
+        SET r.last_seen = $now""",
+    "vulnerable": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:IS_VULNERABLE_TO]->(:CVE {name: row.cve})
+        SET r.last_seen = $now""",
+    "has_cpe": """
+        UNWIND $rows AS row
+        MATCH (:Host {name: row.host})-[r:HAS_CPE]->(:CPE {name: row.cpe})
+        SET r.last_seen = $now""",
+    "detects": """
+        UNWIND $rows AS row
+        MATCH (:Plugin {plugin_id: row.plugin_id})-[r:DETECTS]->(:CVE {name: row.cve})
+        SET r.last_seen = $now""",
+}
+
+# ======================== 1. DÉCOUVERTE DES SCANS ========================
+def expand_scans(pattern):
+    if os.path.isdir(pattern):
+        paths = [str(p) for p in Path(pattern).iterdir() if p.suffix.lower() in SCAN_SUFFIXES]
+    else:
+        paths = glob.glob(pattern)
+    # Ordre chronologique : un scan est comparé au précédent de son périmètre
+    return sorted(paths, key=lambda p: (os.path.getmtime(p), p))
+
+def scan_scope(path):
+    # "dmz_2024-05-01.csv" et "dmz-20240502T0300.nessus" -> périmètre "dmz" ;
+    # seul un vrai suffixe date / horodatage est retiré ("web01", "vlan10_dmz" restent distincts)
+    stem = Path(path).stem
+    return SCOPE_DATE_SUFFIX.sub("", stem) or stem
+
+# ======================== 2. PARSING (POOL DE PROCESSUS) ========================
+def empty_findings():
+    return {key: set() for key in list(HOST_EDGES) + list(GLOBAL_EDGES) + ["finding"]}
+
+def collect_findings(frame, findings, plugins):
+    # Ajoute les findings d'un morceau normalisé (nessus_reader) aux ensembles du scan
+    has_port = frame["port"].ne("") & frame["port"].ne("nan")
+    has_serv = frame["service"].ne("")
+    links = frame[["host", "plugin_id", "cves"]].explode("cves").dropna(subset=["cves"])
+    platforms = frame[["host", "cpes"]].explode("cpes").dropna(subset=["cpes"])
+
+    findings["has_plugin"].update(zip(frame["host"], frame["plugin_id"]))
+    findings["connected"].update(zip(frame.loc[has_port, "host"], frame.loc[has_port, "port"]))
+    findings["runs"].update(zip(frame.loc[has_serv, "host"], frame.loc[has_serv, "service"]))
+    findings["vulnerable"].update(zip(links["host"], links["cves"]))
+    findings["detects"].update(zip(links["plugin_id"], links["cves"]))
+    findings["has_cpe"].update(zip(platforms["host"], platforms["cpes"]))
+    findings["finding"].update(zip(*(frame[c] for c in FINDING_KEY)))
+    plugins.update((p["plugin_id"], p) for p in plugin_scores(frame))
+
+def parse_scan(path, chunksize=DEFAULT_CHUNKSIZE):
+    findings, plugins = empty_findings(), {}
+    for frame in iter_scan_chunks(path, chunksize=chunksize):
+        collect_findings(frame, findings, plugins)
+    return {"path": path, "findings": findings, "plugins": plugins}
+
+# ======================== 3. ÉTAT PAR PÉRIMÈTRE ========================
+def state_path(scope):
+    return STATE_DIR / f"{scope}.json"
+
+def load_state(scope):
+    path = state_path(scope)
+    if not path.exists():
+        return None
+    with open(path, "r") as f:
+        state = json.load(f)
+    state["findings"] = {k: {tuple(x) for x in v} for k, v in state["findings"].items()}
+    return state
+
+def save_state(scope, scan, now_iso):
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    path = state_path(scope)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"scan": scan["path"], "scanned_at": now_iso,
+                   "findings": {k: sorted(v) for k, v in scan["findings"].items()},
+                   "plugins": scan["plugins"]}, f)
+    os.replace(tmp, path)
+
+# ======================== 4. DIFF ========================
+def diff_scans(previous, current):
+    prev = previous["findings"] if previous else {}
+    diff = {}
+    for key, curr in current["findings"].items():
+        before = prev.get(key, set())
+        diff[key] = {"new": curr - before, "resolved": before - curr, "persisting": curr & before}
+    return diff
+
+def _rows(pairs, columns):
+    return [dict(zip(columns, pair)) for pair in sorted(pairs)]
+
+def changed_plugins(previous, plugins):
+    # Plugins dont les scores Nessus ont bougé depuis le scan précédent du périmètre
+    before = (previous or {}).get("plugins", {})
+    return {p for p, rec in plugins.items() if before.get(p) != rec}
+
+def delta_entities(diff, plugins, hosts, rescored=()):
+    edges = {key: _rows(diff[key]["new"], cols) for key, cols in {**HOST_EDGES, **GLOBAL_EDGES}.items()}
+    plugin_ids = {r["plugin_id"] for r in edges["has_plugin"] + edges["detects"]} | set(rescored)
+    cves = {r["cve"] for r in edges["vulnerable"] + edges["detects"]}
+    return {
+        # Tous les hosts du scan : leur last_seen avance même sans changement
+        "hosts":    [{"host": h} for h in sorted(hosts)],
+        "plugins":  [plugins.get(p, {"plugin_id": p, "plugin_name": ""}) for p in sorted(plugin_ids)],
+        "ports":    [{"port": p} for p in sorted({r["port"] for r in edges["connected"]})],
+        "services": [{"service": s} for s in sorted({r["service"] for r in edges["runs"]})],
+        "cves":     [{"cve": c} for c in sorted(cves)],
+        "cpes":     [{"cpe": c} for c in sorted({r["cpe"] for r in edges["has_cpe"]})],
+        **edges,
+        "cve_scores": [{"plugin_id": p} for p in sorted(plugin_ids)],
+    }
+
+def write_delta(graph, diff, scan, now_iso, rescored=(), batch_size=5000):
+    hosts = {h for h, _ in scan["findings"]["has_plugin"]}
+    entities = delta_entities(diff, scan["plugins"], hosts, rescored)
+    counts = write_entities(graph, entities, now_iso, batch_size=batch_size)
+    counts.update(write_persisting(graph, diff, now_iso, batch_size=batch_size))
+    counts.update(write_resolved(graph, diff, now_iso, batch_size=batch_size))
+    return counts
+
+def _run_rows(graph, query, rows, now_iso, batch_size):
+    for i in range(0, len(rows), batch_size):
+        tx = graph.begin()
+        tx.run(query, rows=rows[i:i + batch_size], now=now_iso)
+        tx.commit()
+
+def write_persisting(graph, diff, now_iso, batch_size=5000):
+    # last_seen des arêtes vues aux deux scans (les nouvelles le reçoivent via write_entities)
+    counts = {}
+    for key, query in TOUCH_QUERIES.items():
+        rows = _rows(diff[key]["persisting"], {**HOST_EDGES, **GLOBAL_EDGES}[key])
+        _run_rows(graph, query, rows, now_iso, batch_size)
+        counts[f"{key}_persisting"] = len(rows)
+    return counts
+
+def write_resolved(graph, diff, now_iso, batch_size=5000):
+    # Arêtes host absentes du scan courant : resolved_at / changed_at posés
+    counts = {}
+    for key, query in RESOLVE_QUERIES.items():
+        rows = _rows(diff[key]["resolved"], HOST_EDGES[key])
+        _run_rows(graph, query, rows, now_iso, batch_size)
+        counts[f"{key}_resolved"] = len(rows)
+    return counts
+
+# ======================== 5. PIPELINE ========================
+def ingest_scans(graph, pattern, workers=None, chunksize=DEFAULT_CHUNKSIZE, risk_store=None, scope=None):
+    from risk_scores import RiskStore
+    paths = expand_scans(pattern)
+    if not paths:
+        print(f"🚫 Aucun scan trouvé pour : {pattern}")
+        return []
+    print(f"🚀 {len(paths)} scan(s) à traiter ({pattern})")
+
+    store = risk_store or RiskStore.load()
+    reports = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Parsing en parallèle ; diff et écriture dans l'ordre chronologique
+        futures = [pool.submit(parse_scan, path, chunksize) for path in paths]
+        for path, future in zip(paths, futures):
+            try:
+                scan = future.result()
+            except Exception as e:
+                print(f"[!] Scan illisible {path} : {e}")
+                continue
+            scope_name = scope or scan_scope(scan["path"])
+            now_iso = datetime.utcnow().isoformat()
+            previous = load_state(scope_name)
+            diff = diff_scans(previous, scan)
+            rescored = changed_plugins(previous, scan["plugins"])
+            counts = write_delta(graph, diff, scan, now_iso, rescored)
+            save_state(scope_name, scan, now_iso)
+            # Store de risque tenu au même pas que l'état du périmètre
+            store.apply_diff(diff, scan["plugins"])
+            store.save()
+
+            summary = {k: {kind: len(v) for kind, v in d.items()} for k, d in diff.items()}
+            print(f"📊 {Path(scan['path']).name} [{scope_name}] : "
+                  f"{summary['vulnerable']['new']} CVE nouvelles, "
+                  f"{summary['vulnerable']['resolved']} résolues, "
+                  f"{summary['vulnerable']['persisting']} persistantes | "
+                  f"plugins +{summary['has_plugin']['new']} / -{summary['has_plugin']['resolved']}")
+            reports.append({"scan": scan["path"], "scope": scope_name, "diff": summary, "written": counts})
+    return reports
+
+# ======================== 6. MAIN ========================
+if __name__ == "__main__":
+    from py2neo import Graph
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scans", help="Répertoire ou glob de scans (.csv / .nessus)")
+    parser.add_argument("--workers", type=int, default=None, help="Processus de parsing")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--scope", default=None, help="Périmètre imposé (sinon déduit du nom de fichier)")
+    args = parser.parse_args()
+
+    uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+    graph = Graph(uri, auth=(user, pwd))
+
+    ingest_scans(graph, args.scans, workers=args.workers, chunksize=args.chunksize, scope=args.scope)
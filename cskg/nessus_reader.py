@@ -0,0 +1,95 @@
+# ======================== LECTURE EN FLUX DES EXPORTS NESSUS ========================
+# Lit un export Nessus (CSV ou rapport natif .nessus XML) par morceaux de taille
+# fixe : la mémoire est bornée par `chunksize`, quelle que soit la taille du fichier.
+# Les longs champs texte (Description, ...) ne sont jamais conservés ; Plugin Output
+# n'est lu que le temps d'en extraire les CPE (nessus_bulk.normalize_frame).
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from nessus_bulk import normalize_columns, normalize_frame
+
+DEFAULT_CHUNKSIZE = 50000
+
+# Colonnes (normalisées) inutiles au graphe, écartées dès le parseur
+DROP_COLUMNS = {"description", "synopsis", "solution", "see_also"}
+
+# Balises ReportItem conservées, renommées comme les colonnes CSV normalisées
+XML_FIELDS = {
+    "risk_factor":      "risk",
+    "cvss3_base_score": "cvss_v3.0_base_score",
+    "cvss_base_score":  "cvss_v2.0_base_score",
+    "vpr_score":        "vpr_score",
+    "epss_score":       "epss_score",
+    "plugin_output":    "plugin_output",
+}
+
+def _normalized(col):
+    return col.strip().lower().replace(" ", "_")
+
+def is_nessus_xml(path):
+    if str(path).lower().endswith(".nessus"):
+        return True
+    with open(path, "rb") as f:
+        head = f.read(512).lstrip()
+    return head.startswith(b"<?xml") or head.startswith(b"<NessusClientData")
+
+# ======================== 1. CSV PAR MORCEAUX ========================
+def iter_csv_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    reader = pd.read_csv(path, chunksize=chunksize, dtype=str,
+                         usecols=lambda c: _normalized(c) not in DROP_COLUMNS)
+    for chunk in reader:
+        yield normalize_columns(chunk)
+
+# ======================== 2. XML .nessus INCRÉMENTAL ========================
+def iter_nessus_rows(path):
+    host = None
+    report = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if event == "start":
+            if elem.tag == "Report":
+                report = elem
+            elif elem.tag == "ReportHost":
+                host = elem.get("name")
+            continue
+
+        if elem.tag == "ReportItem":
+            row = {
+                "host":        host,
+                "plugin_id":   elem.get("pluginID"),
+                "plugin_name": elem.get("pluginName"),
+                "port":        elem.get("port"),
+                "protocol":    elem.get("protocol"),
+                "service":     elem.get("svc_name"),
+                "severity":    elem.get("severity"),
+            }
+            cves = []
+            for child in elem:
+                if child.tag == "cve":
+                    cves.append((child.text or "").strip())
+                elif child.tag in XML_FIELDS:
+                    row[XML_FIELDS[child.tag]] = (child.text or "").strip()
+            row["cve"] = ",".join(cves)
+            elem.clear()
+            yield row
+        elif elem.tag == "ReportHost":
+            elem.clear()
+            if report is not None:
+                report.clear()
+
+def iter_xml_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    rows = []
+    for row in iter_nessus_rows(path):
+        rows.append(row)
+        if len(rows) >= chunksize:
+            yield pd.DataFrame(rows)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows)
+
+# ======================== 3. POINT D'ENTRÉE ========================
+def iter_scan_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+    # Produit des findings normalisés (cf. nessus_bulk.normalize_frame) par morceau
+    chunks = iter_xml_chunks(path, chunksize) if is_nessus_xml(path) else iter_csv_chunks(path, chunksize)
+    for chunk in chunks:
+        yield normalize_frame(chunk)
@@ -0,0 +1,276 @@
+# ======================== INGESTION BULK DES CVE NVD ========================
+# Transforme des items NVD (API 2.0 ou flux JSON) en listes de paramètres et
+# les écrit dans Neo4j via des requêtes UNWIND, par lots, au lieu d'un
+# aller-retour `graph.merge` par nœud et par relation.
+#
+# Le seul contrat attendu de `graph` est : graph.begin() -> tx, tx.run(query, **params),
+# tx.commit(). Un py2neo.Graph convient, tout comme un backend local de test.
+import hashlib
+import json
+import os
+from datetime import datetime
+from itertools import islice
+
+DEFAULT_BATCH_SIZE = int(os.getenv("NVD_BATCH_SIZE", "500"))
+
+CVSS_FIELDS = {
+    "cvss_score":         "baseScore",
+    "severity":           "baseSeverity",
+    "attackVector":       "attackVector",
+    "privilegesRequired": "privilegesRequired",
+    "userInteraction":    "userInteraction",
+    "vectorString":       "vectorString",
+}
+
+CWE_RELATIONS = {"ASSOCIATED_WITH", "CLASSIFIED_AS"}
+
+# ======================== 1. NORMALISATION D'UN ITEM ========================
+def parse_cve_item(item, source="NVD"):
+    cve = item["cve"]
+    cve_id = cve["id"]
+    description = cve["descriptions"][0]["value"]
+
+    props = {"description": description, "source": source}
+    if cve.get("published"):
+        props["published"] = cve["published"]
+
+    # --- CVSS v3.1 ---
+    metrics = cve.get("metrics", {})
+    if "cvssMetricV31" in metrics:
+        data = metrics["cvssMetricV31"][0]["cvssData"]
+        for prop, key in CVSS_FIELDS.items():
+            if data.get(key) is not None:
+                props[prop] = data[key]
+
+    # --- CWE ---
+    cwes = []
+    for weakness in cve.get("weaknesses", []):
+        for desc in weakness.get("description", []):
+            cwe_id = desc["value"]
+            if "CWE" in cwe_id and cwe_id not in cwes:
+                cwes.append(cwe_id)
+
+    # --- CPE ---
+    cpes = []
+    for configuration in cve.get("configurations", []):
+        for config in configuration.get("nodes", []):
+            for cpe in config.get("cpeMatch", []):
+                cpe_uri = cpe["criteria"]
+                if cpe_uri not in cpes:
+                    cpes.append(cpe_uri)
+
+    record = {
+        "name": cve_id,
+        "description": description,
+        "props": props,
+        "cwes": cwes,
+        "cpes": cpes,
+        "entities": [],
+    }
+    props["fingerprint"] = fingerprint(record)
+    if cve.get("lastModified"):
+        props["last_modified"] = cve["lastModified"]
+    return record
+
+# Empreinte du contenu normalisé (indépendante de l'ordre NVD des CWE/CPE)
+def fingerprint(record):
+    payload = {
+        "props": {k: v for k, v in record["props"].items() if k not in ("fingerprint", "last_modified")},
+        "cwes": sorted(record["cwes"]),
+        "cpes": sorted(record["cpes"]),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def iter_batches(iterable, batch_size):
+    it = iter(iterable)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+# ======================== 2. REQUÊTES UNWIND ========================
+Q_CVE = """
+UNWIND $rows AS row
+MERGE (c:CVE {name: row.name})
+SET c += row.props, c.updated_at = $now
+"""
+
+Q_CWE = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.cve})
+MERGE (w:CWE {name: row.cwe})
+MERGE (c)-[:%s]->(w)
+"""
+
+Q_CPE = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.cve})
+MERGE (p:CPE {name: row.cpe})
+MERGE (c)-[:AFFECTS]->(p)
+"""
+
+Q_ENTITY = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.cve})
+MERGE (e:Entity {name: row.name})
+SET e.type = row.type
+MERGE (c)-[:MENTIONS]->(e)
+"""
+
+Q_ENTITY_PRUNE = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.cve})-[r:MENTIONS]->(e:Entity)
+WHERE NOT e.name IN row.names
+DELETE r
+"""
+
+Q_CWE_PRUNE = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.name})-[r:%s]->(w:CWE)
+WHERE NOT w.name IN row.cwes
+DELETE r
+"""
+
+Q_CPE_PRUNE = """
+UNWIND $rows AS row
+MATCH (c:CVE {name: row.name})-[r:AFFECTS]->(p:CPE)
+WHERE NOT p.name IN row.cpes
+DELETE r
+"""
+
+Q_FINGERPRINTS = """
+UNWIND $names AS name
+MATCH (c:CVE {name: name})
+RETURN c.name AS name, c.fingerprint AS fingerprint, c.last_modified AS last_modified
+"""
+
+Q_EXISTING = """
+UNWIND $names AS name
+MATCH (c:CVE {name: name})
+RETURN c.name AS name
+"""
+
+# ======================== 3. ÉCRITURE PAR LOTS ========================
+def write_batch(graph, records, cwe_rel="ASSOCIATED_WITH", prune=()):
+    # `prune` : noms des CVE déjà en base dont les arêtes CWE/CPE sont à
+    # différencier (les arêtes absentes du nouvel enregistrement sont supprimées).
+    if cwe_rel not in CWE_RELATIONS:
+        raise ValueError(f"Relation CWE inconnue : {cwe_rel}")
+
+    prune = set(prune)
+    cve_rows = []
+    for r in records:
+        props = r["props"]
+        if r["name"] in prune:
+            # Un score CVSS retiré par NVD doit disparaître du nœud (SET += null)
+            props = dict({prop: None for prop in CVSS_FIELDS}, **props)
+        cve_rows.append({"name": r["name"], "props": props})
+    prune_rows = [{"name": r["name"], "cwes": r["cwes"], "cpes": r["cpes"]}
+                  for r in records if r["name"] in prune]
+    cwe_rows = [{"cve": r["name"], "cwe": w} for r in records for w in r["cwes"]]
+    cpe_rows = [{"cve": r["name"], "cpe": p} for r in records for p in r["cpes"]]
+    ent_rows = [{"cve": r["name"], "name": e["name"], "type": e["type"]}
+                for r in records for e in r["entities"]]
+
+    tx = graph.begin()
+    tx.run(Q_CVE, rows=cve_rows, now=datetime.utcnow().isoformat())
+    if prune_rows:
+        tx.run(Q_CWE_PRUNE % cwe_rel, rows=prune_rows)
+        tx.run(Q_CPE_PRUNE, rows=prune_rows)
+    if cwe_rows:
+        tx.run(Q_CWE % cwe_rel, rows=cwe_rows)
+    if cpe_rows:
+        tx.run(Q_CPE, rows=cpe_rows)
+    if ent_rows:
+        tx.run(Q_ENTITY, rows=ent_rows)
+    tx.commit()
+
+    return {"cve": len(cve_rows), "cwe": len(cwe_rows), "cpe": len(cpe_rows), "entity": len(ent_rows)}
+
+def write_entities(graph, rows, prune=()):
+    # `prune` : CVE dont l'ensemble MENTIONS est recalculé en entier (mode delta)
+    names = {cve: [] for cve in prune}
+    for r in rows:
+        if r["cve"] in names:
+            names[r["cve"]].append(r["name"])
+    prune_rows = [{"cve": cve, "names": n} for cve, n in names.items()]
+    if not rows and not prune_rows:
+        return 0
+    tx = graph.begin()
+    if prune_rows:
+        tx.run(Q_ENTITY_PRUNE, rows=prune_rows)
+    if rows:
+        tx.run(Q_ENTITY, rows=rows)
+    tx.commit()
+    return len(rows)
+
+def existing_cves(graph, names):
+    return {row["name"] for row in graph.run(Q_EXISTING, names=list(names)).data()}
+
+def split_changed(graph, records):
+    # Retourne (nouvelles, modifiées, inchangées) selon l'empreinte stockée sur le nœud
+    known = {row["name"]: row for row in
+             graph.run(Q_FINGERPRINTS, names=[r["name"] for r in records]).data()}
+    new, changed, unchanged = [], [], []
+    for r in records:
+        row = known.get(r["name"])
+        if row is None:
+            new.append(r)
+        elif row["fingerprint"] == r["props"]["fingerprint"]:
+            unchanged.append(r)
+        elif (row["last_modified"] and r["props"].get("last_modified")
+              and r["props"]["last_modified"] < row["last_modified"]):
+            unchanged.append(r)  # flux plus ancien que la base
+        else:
+            changed.append(r)
+    return new, changed, unchanged
+
+def parse_items(items, source="NVD"):
+    for item in items:
+        try:
+            yield parse_cve_item(item, source=source)
+        except Exception as e:
+            cve_id = item.get("cve", {}).get("id", "?")
+            print(f"[!] Erreur de parsing pour {cve_id}: {e}")
+
+def ingest_cves(graph, items, batch_size=DEFAULT_BATCH_SIZE, enrichment=None,
+                cwe_rel="ASSOCIATED_WITH", skip_existing=False, delta=False, strict=False):
+    # `items` peut être une liste ou un générateur (page API, flux --file).
+    # `enrichment` : EnrichmentStage optionnelle (ner_enrich) qui reçoit les
+    # descriptions une fois les données structurées écrites.
+    # `delta` : seules les CVE nouvelles ou dont l'empreinte a changé sont écrites.
+    # `strict` : une erreur d'écriture est propagée au lieu d'être ignorée (curseurs,
+    # checkpoints : l'appelant ne doit pas avancer au-delà d'un lot non écrit).
+    totals = {"cve": 0, "cwe": 0, "cpe": 0, "entity": 0, "skipped": 0, "changed": 0}
+
+    for batch in iter_batches(parse_items(items), batch_size):
+        changed = []
+        if delta:
+            new, changed, unchanged = split_changed(graph, batch)
+            totals["skipped"] += len(unchanged)
+            totals["changed"] += len(changed)
+            batch = new + changed
+        elif skip_existing:
+            known = existing_cves(graph, (r["name"] for r in batch))
+            totals["skipped"] += len(known)
+            batch = [r for r in batch if r["name"] not in known]
+        if not batch:
+            continue
+
+        prune = [r["name"] for r in changed]
+        try:
+            counts = write_batch(graph, batch, cwe_rel=cwe_rel, prune=prune)
+        except Exception as e:
+            print(f"[!] Erreur sur le lot {batch[0]['name']} … {batch[-1]['name']}: {e}")
+            if strict:
+                raise
+            continue
+        for k, v in counts.items():
+            totals[k] += v
+        if enrichment is not None:
+            enrichment.submit(((r["name"], r["description"]) for r in batch), prune=prune)
+        print(f"📦 Lot écrit : {counts['cve']} CVE, {counts['cwe']} CWE, "
+              f"{counts['cpe']} CPE, {counts['entity']} entités")
+
+    return totals
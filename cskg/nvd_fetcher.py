@@ -0,0 +1,207 @@
+# ======================== FETCHER NVD CONCURRENT ========================
+# Parcourt les pages `startIndex` de l'API NVD 2.0 en parallèle (pool de threads),
+# sous un limiteur à fenêtre glissante calé sur les quotas NVD, avec une session HTTP
+# poolée, des retries avec backoff et un curseur persistant pour reprendre un
+# backfill interrompu. Les pages sont transmises à l'ingestion via une file bornée.
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+NVD_API_URL = os.getenv("NVD_API_URL", "https://services.nvd.nist.gov/rest/json/cves/2.0")
+NVD_API_KEY = os.getenv("NVD_API_KEY")
+NVD_MAX_PAGE_SIZE = 2000
+
+# Quotas publics NVD : 5 requêtes / 30 s sans clé, 50 / 30 s avec clé
+NVD_WINDOW_SECONDS = 30
+NVD_RATE_NO_KEY = 5
+NVD_RATE_WITH_KEY = 50
+
+# ======================== 1. LIMITEUR À FENÊTRE GLISSANTE ========================
+class SlidingWindowLimiter:
+    # Au plus `capacity` requêtes sur toute fenêtre de `period` secondes, y compris au
+    # démarrage (un token-bucket plein laisse passer capacity + recharge sur la première fenêtre)
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.period = period
+        self.sent = deque()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.sent and now - self.sent[0] >= self.period:
+                    self.sent.popleft()
+                if len(self.sent) < self.capacity:
+                    self.sent.append(now)
+                    return
+                wait_s = self.period - (now - self.sent[0])
+            time.sleep(wait_s)
+
+def nvd_rate_limiter(api_key=NVD_API_KEY):
+    capacity = NVD_RATE_WITH_KEY if api_key else NVD_RATE_NO_KEY
+    return SlidingWindowLimiter(capacity, NVD_WINDOW_SECONDS)
+
+# ======================== 2. SESSION HTTP POOLÉE ========================
+def make_session(pool_size=8, retries=5, backoff=2.0, api_key=NVD_API_KEY):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(403, 429, 500, 502, 503, 504),  # NVD renvoie 403 en cas de dépassement de quota
+        allowed_methods=("GET",),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if api_key:
+        session.headers["apiKey"] = api_key
+    return session
+
+# ======================== 3. CURSEUR PERSISTANT ========================
+class PageCursor:
+    # `next_start` : toutes les pages avant cet index sont ingérées.
+    # `done` : pages ingérées au-delà du filigrane (complétions hors ordre).
+    # `per_page` : taille de page du run ; les index ne valent que pour elle.
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.next_start = 0
+        self.done = set()
+        self.total_results = None
+        self.per_page = None
+        self.lock = threading.Lock()
+        if self.path and self.path.exists():
+            with open(self.path, "r") as f:
+                state = json.load(f)
+            self.next_start = state.get("next_start", 0)
+            self.done = set(state.get("done", []))
+            self.total_results = state.get("total_results")
+            self.per_page = state.get("per_page")
+
+    def bind(self, per_page):
+        # Reprendre avec une autre taille de page sauterait ou relirait des CVE
+        if self.per_page is not None and self.per_page != per_page and (self.next_start or self.done):
+            raise ValueError(f"Curseur {self.path} créé avec {self.per_page} CVE par page, "
+                             f"reprise demandée avec {per_page} : supprimez-le ou gardez la même taille")
+        self.per_page = per_page
+
+    def is_done(self, start):
+        return start < self.next_start or start in self.done
+
+    def mark_done(self, start, per_page):
+        with self.lock:
+            self.done.add(start)
+            while self.next_start in self.done:
+                self.done.discard(self.next_start)
+                self.next_start += per_page
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"next_start": self.next_start, "done": sorted(self.done),
+                       "total_results": self.total_results, "per_page": self.per_page}, f)
+        os.replace(tmp, self.path)
+
+# ======================== 4. FETCHER ========================
+class NVDFetcher:
+    def __init__(self, base_url=NVD_API_URL, params=None, per_page=NVD_MAX_PAGE_SIZE,
+                 workers=4, session=None, limiter=None, cursor=None, timeout=60):
+        self.base_url = base_url
+        self.params = dict(params or {})
+        self.per_page = min(per_page, NVD_MAX_PAGE_SIZE)
+        self.workers = workers
+        self.session = session or make_session(pool_size=workers)
+        self.limiter = limiter or nvd_rate_limiter()
+        self.cursor = cursor or PageCursor()
+        self.cursor.bind(self.per_page)
+        self.timeout = timeout
+
+    def fetch_page(self, start):
+        self.limiter.acquire()
+        params = dict(self.params, startIndex=start, resultsPerPage=self.per_page)
+        response = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_pages(self, max_pages=None):
+        # La première page non traitée donne totalResults ; les suivantes partent en parallèle.
+        first = self.cursor.next_start
+        data = self.fetch_page(first)
+        total = data.get("totalResults", 0)
+        self.cursor.total_results = total
+        yield first, data
+
+        starts = [s for s in range(first + self.per_page, total, self.per_page)
+                  if not self.cursor.is_done(s)]
+        if max_pages is not None:
+            starts = starts[:max(0, max_pages - 1)]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            starts_iter = iter(starts)
+            for start in starts_iter:
+                pending[pool.submit(self.fetch_page, start)] = start
+                if len(pending) >= self.workers * 2:
+                    break
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    start = pending.pop(fut)
+                    yield start, fut.result()
+                    nxt = next(starts_iter, None)
+                    if nxt is not None:
+                        pending[pool.submit(self.fetch_page, nxt)] = nxt
+
+# ======================== 5. RECOUVREMENT FETCH / INGESTION ========================
+_END = object()
+
+def stream_pages(fetcher, max_pages=None, queue_size=4):
+    q = queue.Queue(maxsize=queue_size)
+
+    def producer():
+        try:
+            for page in fetcher.iter_pages(max_pages=max_pages):
+                q.put(page)
+        except Exception as e:
+            q.put(e)
+        q.put(_END)
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    while True:
+        page = q.get()
+        if page is _END:
+            break
+        if isinstance(page, Exception):
+            raise page
+        yield page
+    thread.join()
+
+def backfill(consume, fetcher, max_pages=None, queue_size=4):
+    # `consume(vulnerabilities)` est appelé dans le thread courant pendant que
+    # les pages suivantes se téléchargent ; le curseur n'avance qu'après ingestion.
+    # `consume` doit lever en cas d'échec d'écriture : la page n'est alors pas marquée
+    # et la reprise repart d'elle.
+    ingested = 0
+    for start, data in stream_pages(fetcher, max_pages=max_pages, queue_size=queue_size):
+        vulns = data.get("vulnerabilities", [])
+        consume(vulns)
+        fetcher.cursor.mark_done(start, fetcher.per_page)
+        ingested += len(vulns)
+        total = fetcher.cursor.total_results or 0
+        print(f"📥 Page {start}: {len(vulns)} CVE ingérées ({fetcher.cursor.next_start}/{total})")
+    return ingested
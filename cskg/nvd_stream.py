@@ -0,0 +1,106 @@
+# ======================== LECTURE EN FLUX DES FICHIERS NVD ========================
+# Produit les éléments du tableau `vulnerabilities` d'un fichier JSON NVD un par
+# un (gzip accepté), sans charger le document entier : la mémoire reste bornée
+# par la taille du tampon de lecture et du plus gros élément.
+import gzip
+import json
+
+CHUNK_SIZE = 1 << 16
+_WS = " \t\r\n"
+_DELIMS = _WS + ",:]}"
+_decoder = json.JSONDecoder()
+
+def open_feed(path, mode="rt"):
+    with open(path, "rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    if is_gzip or str(path).endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+class _Reader:
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"JSON NVD invalide : '{char}' attendu à la position {self.pos}")
+        self.pos += 1
+
+    def scalar_complete(self):
+        # Un scalaire (nombre, true, null, ...) n'est entier qu'une fois son délimiteur lu
+        end = self.pos
+        while end < len(self.buf) and self.buf[end] not in _DELIMS:
+            end += 1
+        return end < len(self.buf) or self.eof
+
+    def value(self):
+        # Un nombre coupé entre deux morceaux ("1." | "25") se décode sans erreur :
+        # on complète le tampon jusqu'au délimiteur avant de décoder
+        if self.peek() not in '{["':
+            while not self.scalar_complete():
+                self.fill()
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            self.pos = end
+            return obj
+
+def iter_vulnerabilities(path, key="vulnerabilities", chunk_size=CHUNK_SIZE):
+    with open_feed(path) as f:
+        reader = _Reader(f, chunk_size)
+        reader.expect("{")
+        while reader.peek() not in ("}", ""):
+            name = reader.value()
+            reader.expect(":")
+            if name != key:
+                reader.value()  # métadonnées (totalResults, format, ...)
+            else:
+                reader.expect("[")
+                while reader.peek() != "]":
+                    yield reader.value()
+                    if reader.peek() == ",":
+                        reader.pos += 1
+                reader.expect("]")
+            if reader.peek() == ",":
+                reader.pos += 1
+
+def write_vulnerabilities(path, items, key="vulnerabilities"):
+    count = 0
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        f.write(f'{{"{key}": [')
+        for item in items:
+            if count:
+                f.write(",\n")
+            json.dump(item, f)
+            count += 1
+        f.write("]}\n")
+    return count
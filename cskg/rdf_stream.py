@@ -0,0 +1,92 @@
+# ======================== EXPORT RDF EN FLUX (N-TRIPLES / N-QUADS) ========================
+# Écrit les triplets au fil de l'eau dans un fichier .nt / .nq (éventuellement
+# gzip) au lieu de construire un rdflib.Graph en mémoire puis de le sérialiser en
+# Turtle. Les IRI sont construites une seule fois grâce à un cache. La sortie
+# Turtle devient une étape optionnelle de post-traitement (to_turtle).
+import gzip
+import threading
+from functools import lru_cache
+from urllib.parse import quote_plus
+
+RDF_TYPE = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+RDFS_LABEL = "<http://www.w3.org/2000/01/rdf-schema#label>"
+OWL_CLASS = "<http://www.w3.org/2002/07/owl#Class>"
+OWL_OBJECT_PROPERTY = "<http://www.w3.org/2002/07/owl#ObjectProperty>"
+OWL_SAME_AS = "<http://www.w3.org/2002/07/owl#sameAs>"
+
+UCO = "https://ontology.unifiedcyberontology.org/uco#"
+STUCO = "http://w3id.org/sepses/vocab/ref/stuco#"
+CYBER = "http://example.org/cyber#"
+UNIFIED = "http://example.org/unified#"
+
+PREFIXES = {
+    "rdf": "http://www.w3.org/1999/02/22-rdf-syntax-ns#",
+    "rdfs": "http://www.w3.org/2000/01/rdf-schema#",
+    "owl": "http://www.w3.org/2002/07/owl#",
+    "uco": UCO,
+    "stuco": STUCO,
+    "cyber": CYBER,
+    "unified": UNIFIED,
+}
+
+# ======================== 1. TERMES ========================
+def iri_fragment(txt: str) -> str:
+    return quote_plus(txt.strip().replace("/", "_"))
+
+@lru_cache(maxsize=1 << 20)
+def iri(namespace: str, local: str = "", kind: str = "") -> str:
+    # iri(CYBER, "CVE-2021-44228", "CVE") -> <http://example.org/cyber#CVE/CVE-2021-44228>
+    if kind:
+        return f"<{namespace}{kind}/{iri_fragment(local)}>"
+    return f"<{namespace}{local}>"
+
+_ESCAPES = str.maketrans({"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r"})
+
+def literal(value) -> str:
+    return '"' + str(value).translate(_ESCAPES) + '"'
+
+# ======================== 2. ÉCRIVAIN INCRÉMENTAL ========================
+class TripleWriter:
+    # `graph_iri` renseigné -> N-Quads ; chemin en .gz -> compression gzip
+    def __init__(self, path, graph_iri=None, compress=None):
+        self.path = str(path)
+        compress = self.path.endswith(".gz") if compress is None else compress
+        self.f = gzip.open(self.path, "wt", encoding="utf-8") if compress else open(self.path, "w", encoding="utf-8")
+        self.suffix = f" {graph_iri} .\n" if graph_iri else " .\n"
+        self.count = 0
+        # Plusieurs producteurs (threads d'export) peuvent partager le même fichier
+        self.lock = threading.Lock()
+
+    def add(self, s, p, o):
+        with self.lock:
+            self.f.write(f"{s} {p} {o}{self.suffix}")
+            self.count += 1
+
+    def add_many(self, triples):
+        lines = [f"{s} {p} {o}{self.suffix}" for s, p, o in triples]
+        with self.lock:
+            self.f.writelines(lines)
+            self.count += len(lines)
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ======================== 3. POST-TRAITEMENT TURTLE (OPTIONNEL) ========================
+def to_turtle(src, dest):
+    from rdflib import ConjunctiveGraph, Graph as RDFGraph
+
+    quads = ".nq" in str(src)
+    kg = ConjunctiveGraph() if quads else RDFGraph()
+    for prefix, ns in PREFIXES.items():
+        kg.bind(prefix, ns)
+    opener = gzip.open if str(src).endswith(".gz") else open
+    with opener(src, "rb") as f:
+        kg.parse(f, format="nquads" if quads else "nt")
+    kg.serialize(destination=str(dest), format="trig" if quads else "turtle")
+    return dest
@@ -0,0 +1,371 @@
+# ======================== SCORES DE RISQUE INCRÉMENTAUX (HOST / SERVICE / CVE) ========================
+# Agrégats de risque tenus en colonnes numpy, mis à jour par deltas :
+#   - un finding = (host, plugin, service) ouvert ; son score vient des scores
+#     Nessus du plugin (VPR, sinon CVSS v3, sinon CVSS v2, sinon Risk Factor) et
+#     du CVSS NVD des CVE qu'il détecte (max des deux) ;
+#   - chaque host, service et CVE garde n_open, Σ score, Σ EPSS et un compteur
+#     par sévérité : ouvrir, résoudre ou re-scorer un finding ne touche que ses
+#     propres lignes, et toute lecture est en O(1).
+# Le store est persisté en .npz et alimenté par extract_nessus.py / nessus_diff.py ;
+# les CVE re-scorées côté NVD (ou fusionnées) sont reprises par sync_cves depuis un watermark.
+import argparse
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+RISK_STORE_PATH = os.getenv("RISK_STORE_PATH", "data/risk_scores.npz")
+SEVERITIES = ("None", "Low", "Medium", "High", "Critical")
+RISK_FACTOR_SCORE = {"none": 0.0, "low": 2.0, "medium": 5.0, "high": 8.0, "critical": 10.0}
+
+# CVSS NVD des CVE connues du store : re-scorées, ou dont les jumelles SAME_AS ont changé
+Q_RESCORED_CVES = """
+MATCH (c:CVE) WHERE c.name IN $names
+OPTIONAL MATCH (c)-[s:SAME_AS]-(o:CVE)
+WITH c.name AS name, collect(c) + collect(o) AS nodes, collect(s) AS links
+WHERE $since IS NULL
+   OR any(x IN nodes WHERE x.updated_at > $since OR x.same_as_changed_at > $since)
+   OR any(l IN links WHERE l.created_at > $since)
+UNWIND nodes AS x
+RETURN name, max(x.cvss_score) AS cvss
+"""
+
+# ======================== 1. SCORES ========================
+def severity_index(score):
+    # Seuils CVSS v3 : 0 / <4 / <7 / <9 / >=9
+    if score <= 0:
+        return 0
+    return 1 if score < 4 else 2 if score < 7 else 3 if score < 9 else 4
+
+def base_score(vpr=None, cvss3=None, cvss2=None, risk=None):
+    for v in (vpr, cvss3, cvss2):
+        if v is not None and not np.isnan(v):
+            return float(v)
+    return RISK_FACTOR_SCORE.get(str(risk or "none").strip().lower(), 0.0)
+
+def _nan(v):
+    return np.nan if v is None else float(v)
+
+def _grow(arr, n):
+    if len(arr) >= n:
+        return arr
+    out = np.zeros((max(n, 2 * len(arr), 64),) + arr.shape[1:], dtype=arr.dtype)
+    out[:len(arr)] = arr
+    return out
+
+# ======================== 2. AGRÉGATS COLONNAIRES ========================
+class Aggregates:
+    # Une ligne par entité (host, service ou CVE), indexée par nom
+    def __init__(self):
+        self.names = []
+        self.index = {}
+        self.n_open = np.zeros(0, dtype=np.int64)
+        self.score_sum = np.zeros(0, dtype=np.float64)
+        self.epss_sum = np.zeros(0, dtype=np.float64)
+        self.sev = np.zeros((0, len(SEVERITIES)), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+            n = len(self.names)
+            self.n_open, self.score_sum = _grow(self.n_open, n), _grow(self.score_sum, n)
+            self.epss_sum, self.sev = _grow(self.epss_sum, n), _grow(self.sev, n)
+        return i
+
+    def add(self, i, score, epss, sign):
+        self.n_open[i] += sign
+        self.score_sum[i] += sign * score
+        self.epss_sum[i] += sign * epss
+        self.sev[i, severity_index(score)] += sign
+
+    def get(self, name):
+        i = self.index.get(name)
+        if i is None:
+            return None
+        n = int(self.n_open[i])
+        sev = self.sev[i]
+        top = int(np.flatnonzero(sev)[-1]) if n else 0
+        return {"name": name, "open": n, "risk": float(self.score_sum[i]),
+                "mean": float(self.score_sum[i] / n) if n else 0.0,
+                "expected_exploits": float(self.epss_sum[i]), "severity": SEVERITIES[top],
+                **{s.lower(): int(c) for s, c in zip(SEVERITIES, sev)}}
+
+    def top(self, k=10):
+        n = len(self.names)
+        order = np.argsort(-self.score_sum[:n], kind="stable")[:k]
+        return [self.get(self.names[i]) for i in order if self.n_open[i] > 0]
+
+    def columns(self, prefix):
+        n = len(self.names)
+        return {f"{prefix}__n_open": self.n_open[:n], f"{prefix}__score_sum": self.score_sum[:n],
+                f"{prefix}__epss_sum": self.epss_sum[:n], f"{prefix}__sev": self.sev[:n]}
+
+    @classmethod
+    def from_columns(cls, names, data, prefix):
+        agg = cls()
+        agg.names = list(names)
+        agg.index = {n: i for i, n in enumerate(agg.names)}
+        agg.n_open = data[f"{prefix}__n_open"].copy()
+        agg.score_sum = data[f"{prefix}__score_sum"].copy()
+        agg.epss_sum = data[f"{prefix}__epss_sum"].copy()
+        agg.sev = data[f"{prefix}__sev"].copy()
+        return agg
+
+# ======================== 3. STORE ========================
+class RiskStore:
+    def __init__(self, path=RISK_STORE_PATH):
+        self.path = path
+        self.hosts, self.services, self.cves = Aggregates(), Aggregates(), Aggregates()
+        # Plugins : score de base, EPSS, CVE détectées
+        self.plugin_index, self.plugin_names = {}, []
+        self.p_base = np.zeros(0, dtype=np.float64)
+        self.p_epss = np.zeros(0, dtype=np.float64)
+        self.p_cves = []
+        self.plugin_findings = []
+        # Findings : (host, service, plugin) et score actuellement compté dans les agrégats
+        self.finding_index = {}
+        self.f_host = np.zeros(0, dtype=np.int64)
+        self.f_service = np.zeros(0, dtype=np.int64)
+        self.f_plugin = np.zeros(0, dtype=np.int64)
+        self.f_open = np.zeros(0, dtype=bool)
+        self.f_score = np.zeros(0, dtype=np.float64)
+        self.f_epss = np.zeros(0, dtype=np.float64)
+        # CVE : CVSS NVD (après fusion) et plugins qui les détectent
+        self.c_nvd = np.zeros(0, dtype=np.float64)
+        self.cve_plugins = []
+        self.watermark = None
+        # CVE d'indice >= synced : jamais lues dans Neo4j, reprises sans watermark
+        self.synced = 0
+
+    # ---------- identifiants ----------
+    def _plugin(self, plugin_id):
+        i = self.plugin_index.get(plugin_id)
+        if i is None:
+            i = self.plugin_index[plugin_id] = len(self.plugin_names)
+            self.plugin_names.append(plugin_id)
+            n = len(self.plugin_names)
+            self.p_base, self.p_epss = _grow(self.p_base, n), _grow(self.p_epss, n)
+            self.p_cves.append([])
+            self.plugin_findings.append([])
+        return i
+
+    def _cve(self, name):
+        i = self.cves.id(name)
+        if i >= len(self.cve_plugins):
+            self.cve_plugins.append(set())
+            self.c_nvd = _grow(self.c_nvd, i + 1)
+            self.c_nvd[i] = np.nan
+        return i
+
+    # ---------- contributions ----------
+    def _score(self, fid):
+        pid = self.f_plugin[fid]
+        nvd = [self.c_nvd[c] for c in self.p_cves[pid] if not np.isnan(self.c_nvd[c])]
+        return max([self.p_base[pid]] + nvd), self.p_epss[pid]
+
+    def _contribute(self, fid, sign):
+        score, epss = self.f_score[fid], self.f_epss[fid]
+        self.hosts.add(self.f_host[fid], score, epss, sign)
+        self.services.add(self.f_service[fid], score, epss, sign)
+        for c in self.p_cves[self.f_plugin[fid]]:
+            self.cves.add(c, score, epss, sign)
+
+    def _rescore(self, fid):
+        score, epss = self._score(fid)
+        if score == self.f_score[fid] and epss == self.f_epss[fid]:
+            return False
+        self._contribute(fid, -1)
+        self.f_score[fid], self.f_epss[fid] = score, epss
+        self._contribute(fid, +1)
+        return True
+
+    # ---------- mises à jour ----------
+    def set_plugin(self, plugin_id, vpr=None, cvss3=None, cvss2=None, epss=None, risk=None, cves=()):
+        pid = self._plugin(str(plugin_id))
+        base, epss = base_score(_nan(vpr), _nan(cvss3), _nan(cvss2), risk), 0.0 if epss is None else float(epss)
+        # Liste de CVE prise telle quelle : une CVE retirée du plugin ne lui est plus comptée
+        cids = sorted({self._cve(c) for c in cves})
+        if base == self.p_base[pid] and epss == self.p_epss[pid] and cids == self.p_cves[pid]:
+            return 0
+        open_fids = [f for f in self.plugin_findings[pid] if self.f_open[f]]
+        for f in open_fids:
+            self._contribute(f, -1)
+        self.p_base[pid], self.p_epss[pid] = base, epss
+        for c in set(self.p_cves[pid]) - set(cids):
+            self.cve_plugins[c].discard(pid)
+        self.p_cves[pid] = cids
+        for c in cids:
+            self.cve_plugins[c].add(pid)
+        for f in open_fids:
+            self.f_score[f], self.f_epss[f] = self._score(f)
+            self._contribute(f, +1)
+        return len(open_fids)
+
+    def open_finding(self, host, plugin_id, service="unknown"):
+        key = (host, str(plugin_id), service)
+        fid = self.finding_index.get(key)
+        if fid is None:
+            fid = self.finding_index[key] = len(self.finding_index)
+            n = fid + 1
+            self.f_host, self.f_service = _grow(self.f_host, n), _grow(self.f_service, n)
+            self.f_plugin, self.f_open = _grow(self.f_plugin, n), _grow(self.f_open, n)
+            self.f_score, self.f_epss = _grow(self.f_score, n), _grow(self.f_epss, n)
+            self.f_host[fid], self.f_service[fid] = self.hosts.id(host), self.services.id(service)
+            self.f_plugin[fid] = pid = self._plugin(str(plugin_id))
+            self.plugin_findings[pid].append(fid)
+        if self.f_open[fid]:
+            return False
+        self.f_open[fid] = True
+        self.f_score[fid], self.f_epss[fid] = self._score(fid)
+        self._contribute(fid, +1)
+        return True
+
+    def resolve_finding(self, host, plugin_id, service="unknown"):
+        fid = self.finding_index.get((host, str(plugin_id), service))
+        if fid is None or not self.f_open[fid]:
+            return False
+        self._contribute(fid, -1)
+        self.f_open[fid] = False
+        return True
+
+    def rescore_cve(self, name, cvss):
+        # CVSS NVD (ou fusionné) d'une CVE : seuls les findings ouverts qui la détectent bougent
+        c = self.cves.index.get(name)
+        cvss = _nan(cvss)
+        if c is None or (np.isnan(cvss) and np.isnan(self.c_nvd[c])) or cvss == self.c_nvd[c]:
+            return 0
+        self.c_nvd[c] = cvss
+        return sum(self._rescore(f) for p in self.cve_plugins[c]
+                   for f in self.plugin_findings[p] if self.f_open[f])
+
+    # ---------- alimentation ----------
+    def apply_plugins(self, plugins, detects):
+        # plugins : [{"plugin_id", "risk", "cvss3", "cvss2", "vpr", "epss"}], detects : [(plugin_id, cve)]
+        cves = {}
+        for pid, cve in detects:
+            cves.setdefault(str(pid), []).append(cve)
+        for p in plugins:
+            self.set_plugin(p["plugin_id"], p.get("vpr"), p.get("cvss3"), p.get("cvss2"), p.get("epss"),
+                            p.get("risk"), cves.get(str(p["plugin_id"]), ()))
+
+    def apply_frame(self, frame):
+        # Findings normalisés (nessus_bulk.normalize_frame) : tous ouverts
+        from nessus_bulk import plugin_scores
+        links = frame[["plugin_id", "cves"]].explode("cves").dropna(subset=["cves"])
+        self.apply_plugins(plugin_scores(frame), zip(links["plugin_id"], links["cves"]))
+        opened = 0
+        for host, pid, service in frame[["host", "plugin_id", "service"]].drop_duplicates().itertuples(index=False):
+            opened += self.open_finding(host, pid, service)
+        return opened
+
+    def apply_diff(self, diff, plugins):
+        # Diff nessus_diff : seuls les findings nouveaux / résolus touchent les agrégats
+        # (les persistants sont rouverts sans effet si le store les connaît déjà)
+        self.apply_plugins(plugins.values(), diff["detects"]["new"] | diff["detects"]["persisting"])
+        counts = {"opened": 0, "resolved": 0}
+        for host, pid, service in diff["finding"]["new"] | diff["finding"]["persisting"]:
+            counts["opened"] += self.open_finding(host, pid, service)
+        for host, pid, service in diff["finding"]["resolved"]:
+            counts["resolved"] += self.resolve_finding(host, pid, service)
+        return counts
+
+    def sync_cves(self, graph, batch_size=5000):
+        # CVSS NVD des CVE connues, re-scorées ou fusionnées depuis le dernier passage
+        started = datetime.utcnow().isoformat()
+        names, moved = list(self.cves.names), 0
+        for group, since in ((names[:self.synced], self.watermark), (names[self.synced:], None)):
+            for i in range(0, len(group), batch_size):
+                for row in graph.run(Q_RESCORED_CVES, names=group[i:i + batch_size], since=since).data():
+                    moved += self.rescore_cve(row["name"], row["cvss"])
+        self.watermark, self.synced = started, len(names)
+        return moved
+
+    # ---------- lectures O(1) ----------
+    def host(self, name):
+        return self.hosts.get(name)
+
+    def service(self, name):
+        return self.services.get(name)
+
+    def cve(self, name):
+        return self.cves.get(name)
+
+    # ---------- persistance ----------
+    def save(self, path=None):
+        path = path or self.path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        n_p, n_f = len(self.plugin_names), len(self.finding_index)
+        p_cves_ptr = np.cumsum([0] + [len(c) for c in self.p_cves]).astype(np.int64)
+        meta = {"hosts": self.hosts.names, "services": self.services.names, "cves": self.cves.names,
+                "plugins": self.plugin_names, "watermark": self.watermark, "synced": self.synced}
+        tmp = f"{path}.tmp.npz"
+        np.savez_compressed(
+            tmp, meta=json.dumps(meta),
+            **self.hosts.columns("hosts"), **self.services.columns("services"), **self.cves.columns("cves"),
+            p_base=self.p_base[:n_p], p_epss=self.p_epss[:n_p], p_cves_ptr=p_cves_ptr,
+            p_cves=np.array([c for cs in self.p_cves for c in cs], dtype=np.int64),
+            f_host=self.f_host[:n_f], f_service=self.f_service[:n_f], f_plugin=self.f_plugin[:n_f],
+            f_open=self.f_open[:n_f], f_score=self.f_score[:n_f], f_epss=self.f_epss[:n_f],
+            c_nvd=self.c_nvd[:len(self.cves)])
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=RISK_STORE_PATH):
+        store = cls(path)
+        if not Path(path).exists():
+            return store
+        data = np.load(path)
+        meta = json.loads(str(data["meta"]))
+        store.hosts = Aggregates.from_columns(meta["hosts"], data, "hosts")
+        store.services = Aggregates.from_columns(meta["services"], data, "services")
+        store.cves = Aggregates.from_columns(meta["cves"], data, "cves")
+        store.watermark = meta["watermark"]
+        store.synced = meta.get("synced", 0)
+        store.plugin_names = list(meta["plugins"])
+        store.plugin_index = {p: i for i, p in enumerate(store.plugin_names)}
+        store.p_base, store.p_epss = data["p_base"].copy(), data["p_epss"].copy()
+        ptr, flat = data["p_cves_ptr"], data["p_cves"].tolist()
+        store.p_cves = [flat[ptr[i]:ptr[i + 1]] for i in range(len(store.plugin_names))]
+        store.c_nvd = data["c_nvd"].copy()
+        store.cve_plugins = [set() for _ in store.cves.names]
+        for pid, cids in enumerate(store.p_cves):
+            for c in cids:
+                store.cve_plugins[c].add(pid)
+        for k in ("f_host", "f_service", "f_plugin", "f_open", "f_score", "f_epss"):
+            setattr(store, k, data[k].copy())
+        store.plugin_findings = [[] for _ in store.plugin_names]
+        for fid, (h, s, p) in enumerate(zip(store.f_host.tolist(), store.f_service.tolist(), store.f_plugin.tolist())):
+            store.finding_index[(store.hosts.names[h], store.plugin_names[p], store.services.names[s])] = fid
+            store.plugin_findings[p].append(fid)
+        return store
+
+# ======================== 4. MAIN ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--store", default=RISK_STORE_PATH)
+    parser.add_argument("--sync", action="store_true", help="Reprend les CVE re-scorées dans Neo4j")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    store = RiskStore.load(args.store)
+    if args.sync:
+        from py2neo import Graph
+        uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+        user = os.getenv("NEO4J_USER", "neo4j")
+        pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+        moved = store.sync_cves(Graph(uri, auth=(user, pwd)))
+        store.save()
+        print(f"🔄 {moved} findings re-scorés depuis Neo4j")
+    for kind, agg in (("Hosts", store.hosts), ("Services", store.services), ("CVE", store.cves)):
+        print(f"📊 {kind} les plus exposés :")
+        for row in agg.top(args.top):
+            print(f"   • {row['name']:<24} risque {row['risk']:.1f} ({row['open']} findings, "
+                  f"max {row['severity']}, EPSS Σ {row['expected_exploits']:.2f})")
@@ -0,0 +1,66 @@
+# ======================== ÉCRITURE EN MASSE DES RELATIONS SAME_AS ========================
+# Les alignements sont collectés puis écrits par lots (UNWIND + MERGE sur les
+# noms des deux CVE) : quelques transactions au lieu d'un aller-retour par paire.
+# Une relation déjà présente (dans un sens ou dans l'autre) n'est pas modifiée.
+from datetime import datetime
+
+DEFAULT_BATCH_SIZE = 5000
+
+Q_SAME_AS = """
+UNWIND $rows AS row
+MATCH (a:CVE {name: row.kg1, source: 'NVD'})
+MATCH (b:CVE {name: row.kg2, source: 'NESSUS'})
+MERGE (a)-[r:SAME_AS]-(b)
+ON CREATE SET r.method = row.method, r.score = row.score, r.created_at = $now
+RETURN row.kg2 AS kg2, r.created_at = $now AS created
+"""
+
+# Alignement remplacé : seules les relations créées par l'alignement (method renseignée)
+Q_SAME_AS_DROP = """
+UNWIND $rows AS row
+MATCH (a:CVE {name: row.kg1, source: 'NVD'})-[r:SAME_AS]-(b:CVE {name: row.kg2, source: 'NESSUS'})
+WHERE r.method IS NOT NULL
+SET a.same_as_changed_at = $now, b.same_as_changed_at = $now
+DELETE r
+RETURN count(r) AS dropped
+"""
+
+# Une paire reliée dans les deux sens (import antérieur) n'est comptée qu'une fois
+Q_SAME_AS_STATS = """
+MATCH (a)-[r:SAME_AS]-(b) WHERE id(a) < id(b)
+WITH a, b, head(collect(r.method)) AS method
+RETURN method, count(*) AS total
+"""
+
+def write_same_as(graph, matches, batch_size=DEFAULT_BATCH_SIZE):
+    # matches : [{"kg1", "kg2", "method", "score"}, ...]
+    # Retourne (compteurs, lignes effectivement créées, dans l'ordre d'entrée)
+    now = datetime.utcnow().isoformat()
+    created = set()
+    seen = 0
+    for i in range(0, len(matches), batch_size):
+        tx = graph.begin()
+        for rec in tx.run(Q_SAME_AS, rows=matches[i:i + batch_size], now=now).data():
+            seen += 1
+            if rec["created"]:
+                created.add(rec["kg2"])
+        tx.commit()
+    counts = {"created": len(created), "existing": seen - len(created),
+              "missing": len(matches) - seen}
+    return counts, [m for m in matches if m["kg2"] in created]
+
+def drop_same_as(graph, pairs, batch_size=DEFAULT_BATCH_SIZE):
+    # pairs : [{"kg1", "kg2"}, ...] -> nombre de relations supprimées
+    # (les deux CVE sont horodatées pour la propagation incrémentale des IMPACTS)
+    now = datetime.utcnow().isoformat()
+    dropped = 0
+    for i in range(0, len(pairs), batch_size):
+        tx = graph.begin()
+        dropped += sum(r["dropped"] for r in tx.run(Q_SAME_AS_DROP, rows=pairs[i:i + batch_size], now=now).data())
+        tx.commit()
+    return dropped
+
+def same_as_stats(graph):
+    # Une seule agrégation pour le total et la répartition par méthode
+    per_method = {r["method"]: r["total"] for r in graph.run(Q_SAME_AS_STATS).data()}
+    return sum(per_method.values()), per_method
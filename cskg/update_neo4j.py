@@ -1,9 +1,10 @@
 import os
-import time
-import requests
 from datetime import datetime
+import requests
 from py2neo import Graph, Node, Relationship
-from transformers import pipeline
+from nvd_bulk import ingest_cves
+from nvd_fetcher import NVDFetcher, make_session, stream_pages
+from ner_enrich import EnrichmentStage, NEREnricher
 
 # ======================== CONFIGURATION ========================
 uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
@@ -15,17 +16,18 @@ NER_MODEL = "dslim/bert-base-NER"
 NER_THRESHOLD = 0.5
 
 # ======================== INIT PIPELINE NER ========================
-print("📦 Chargement du modèle NER...")
-ner_pipeline = pipeline("ner", model=NER_MODEL, aggregation_strategy="simple")
+# Chargement paresseux + cache persistant (voir ner_enrich.py)
+enricher = NEREnricher(model=NER_MODEL, threshold=NER_THRESHOLD)
 
 # ======================== API NVD ========================
+session = make_session()
+
 def fetch_cve_nvd(start=0, results_per_page=50):
-    url = f"https://services.nvd.nist.gov/rest/json/cves/2.0?startIndex={start}&resultsPerPage={results_per_page}"
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"❌ Erreur API NVD : {response.status_code}")
+    try:
+        return NVDFetcher(per_page=results_per_page, session=session).fetch_page(start)
+    except Exception as e:
+        print(f"❌ Erreur API NVD : {e}")
         return None
-    return response.json()
 
 # ======================== INSERTION NEO4J ========================
 def insert_cve(item):
@@ -37,7 +39,8 @@ def insert_cve(item):
         print(f"↪️ {cve_id} déjà présent. Ignoré.")
         return
 
-    node = Node("CVE", name=cve_id, description=description, source="NVD")
+    node = Node("CVE", name=cve_id, description=description, source="NVD",
+                updated_at=datetime.utcnow().isoformat())
     if published:
         node["published"] = published
 
@@ -82,33 +85,51 @@ def insert_cve(item):
 
     # NER
     try:
-        entities = ner_pipeline(description)
+        entities = enricher.entities_for([description])[0]
         for ent in entities:
-            if ent["score"] < NER_THRESHOLD:
-                continue
-            word = ent["word"]
-            ent_type = ent["entity_group"]
+            word = ent["name"]
+            ent_type = ent["type"]
             ent_node = Node("Entity", name=word, type=ent_type)
             graph.merge(ent_node, "Entity", "name")
             graph.create(Relationship(node, "MENTIONS", ent_node))
     except Exception as e:
         print(f"⚠️ NER erreur {cve_id} : {e}")
 
+# Équivalent par lots de insert_cve, en mode delta : les CVE inchangées (même
+# empreinte) sont ignorées, les CVE re-scorées ou modifiées sont mises à jour
+def insert_cves_bulk(items, batch_size=500, enrichment=None):
+    return ingest_cves(graph, items, batch_size=batch_size, enrichment=enrichment,
+                       cwe_rel="CLASSIFIED_AS", delta=True)
+
 # ======================== PIPELINE DE MISE À JOUR ========================
-def update_graph_cve(max_pages=1, per_page=50):
+def update_graph_cve(max_pages=1, per_page=50, bulk=True):
     print(f"🚀 Démarrage de la mise à jour NVD (pages: {max_pages})")
-    for page in range(max_pages):
-        data = fetch_cve_nvd(start=page * per_page, results_per_page=per_page)
-        if not data:
-            break
-        vulns = data.get("vulnerabilities", [])
-        print(f"📦 {len(vulns)} vulnérabilités reçues - page {page + 1}")
-        for item in vulns:
-            try:
-                insert_cve(item)
-                time.sleep(0.2)
-            except Exception as e:
-                print(f"[!] Erreur insertion CVE : {e}")
+    fetcher = NVDFetcher(per_page=per_page, session=session)
+    stage = EnrichmentStage(graph, enricher).start() if bulk else None
+    try:
+        # Les pages suivantes se téléchargent pendant l'insertion de la page courante
+        for page, (start, data) in enumerate(stream_pages(fetcher, max_pages=max_pages)):
+            vulns = data.get("vulnerabilities", [])
+            print(f"📦 {len(vulns)} vulnérabilités reçues - page {page + 1} (startIndex={start})")
+            if bulk:
+                try:
+                    totals = insert_cves_bulk(vulns, enrichment=stage)
+                except Exception as e:
+                    # Les pages déjà écrites restent valides ; l'exécution suivante reprend en delta
+                    print(f"❌ Erreur écriture Neo4j (page {page + 1}, startIndex={start}) : {e}")
+                    break
+                print(f"↪️ {totals['skipped']} CVE inchangées ignorées, {totals['changed']} mises à jour.")
+                continue
+            for item in vulns:
+                try:
+                    insert_cve(item)
+                except Exception as e:
+                    print(f"[!] Erreur insertion CVE : {e}")
+    except requests.RequestException as e:
+        print(f"❌ Erreur API NVD : {e}")
+    finally:
+        if stage:
+            stage.close()
     print("✅ Mise à jour NVD terminée.")
 
 # ======================== MAIN ========================
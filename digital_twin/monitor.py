@@ -1,13 +1,39 @@
 # ======================== MONITORING CVE (NVD) ========================
-import requests
-import json
-import subprocess
+# Les nouvelles CVE sont ingérées dans le processus courant (nvd_bulk +
+# étape NER) au lieu de relancer collect_nvd.py / update_neo4j.py. En mode
+# --daemon, le modèle NER, la connexion Neo4j et la session HTTP restent
+# chauds d'un cycle à l'autre et NVD est interrogé toutes les --interval secondes.
+#
+# L'intervalle depuis le dernier check est découpé en fenêtres lastModified
+# conformes à NVD (120 jours max), chacune paginée en entier ; les fenêtres
+# sont téléchargées en parallèle sous le limiteur partagé, et le check n'avance
+# qu'à la fin de la dernière fenêtre dont toutes les fenêtres précédentes sont ingérées.
+#
+# Les CVE qui touchent une plateforme de nos hosts (priority.AssetIndex) sont
+# détournées vers une voie rapide qui les ingère, les aligne et propage les
+# IMPACTS avant le reste du lot.
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "cskg"))
+from nvd_fetcher import NVDFetcher, make_session, nvd_rate_limiter
+from priority import AssetIndex, FastLane
+
 # === CONFIGURATION ===
-LAST_CHECK_FILE = Path("digital_twin/last_check.txt")
-NVD_API_URL = "https://services.nvd.nist.gov/rest/json/cves/2.0"
+LAST_CHECK_FILE = Path(os.getenv("MONITOR_LAST_CHECK", "digital_twin/last_check.txt"))
+MONITOR_INTERVAL = int(os.getenv("MONITOR_INTERVAL", "300"))
+NVD_MAX_WINDOW_DAYS = 120
+MONITOR_WINDOW_DAYS = int(os.getenv("MONITOR_WINDOW_DAYS", str(NVD_MAX_WINDOW_DAYS)))
+MONITOR_WINDOW_WORKERS = int(os.getenv("MONITOR_WINDOW_WORKERS", "2"))
+MONITOR_PAGE_WORKERS = int(os.getenv("MONITOR_PAGE_WORKERS", "2"))
 
 # === FONCTION : heure du dernier check
 def get_last_check_time():
@@ -17,52 +43,201 @@ def get_last_check_time():
     return datetime.utcnow() - timedelta(days=1)
 
 # === FONCTION : mise à jour heure du dernier check
-def update_last_check_time():
-    with open(LAST_CHECK_FILE, "w") as f:
-        f.write(datetime.utcnow().isoformat())
-
-# === FONCTION : appel API NVD
-def fetch_new_cves(published_after):
-    print(f"🔎 Vérification des CVEs publiées après : {published_after}")
-    params = {
-        "pubStartDate": published_after.isoformat() + "Z",
-        "resultsPerPage": 100
-    }
-    response = requests.get(NVD_API_URL, params=params)
-    response.raise_for_status()
-    data = response.json()
-    return data.get("vulnerabilities", [])
+def update_last_check_time(checked_at=None):
+    LAST_CHECK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = LAST_CHECK_FILE.with_suffix(LAST_CHECK_FILE.suffix + ".tmp")
+    with open(tmp, "w") as f:
+        f.write((checked_at or datetime.utcnow()).isoformat())
+    os.replace(tmp, LAST_CHECK_FILE)
 
-# === PIPELINE : si nouvelle CVE trouvée
-def run_monitoring():
-    print(f"🕒 Lancement du monitoring : {datetime.utcnow().isoformat()}")
+# === FONCTION : date au format NVD (millisecondes, UTC)
+def nvd_date(dt):
+    return dt.isoformat(timespec="milliseconds") + "Z"
 
-    last_check = get_last_check_time()
-    new_cves = fetch_new_cves(last_check)
+# === FONCTION : découpage de l'intervalle en fenêtres NVD
+def iter_windows(start, end, days=MONITOR_WINDOW_DAYS):
+    step = timedelta(days=max(1, min(days, NVD_MAX_WINDOW_DAYS)))
+    while start < end:
+        stop = min(start + step, end)
+        yield start, stop
+        start = stop
 
-    if not new_cves:
-        print("✅ Aucune nouvelle CVE détectée.")
-    else:
-        print(f"🚨 {len(new_cves)} nouvelle(s) CVE trouvée(s).")
+# === FONCTION : toutes les pages d'une fenêtre (nouvelles et modifiées)
+def fetch_window(window, session=None, limiter=None, workers=MONITOR_PAGE_WORKERS):
+    start, end = window
+    fetcher = NVDFetcher(params={"lastModStartDate": nvd_date(start), "lastModEndDate": nvd_date(end)},
+                         workers=workers, session=session, limiter=limiter)
+    for _, data in fetcher.iter_pages():
+        yield data.get("vulnerabilities", [])
+
+# === FONCTION : fenêtres en parallèle, ingestion dans le thread courant
+_DONE = object()
+
+def poll_windows(windows, consume, on_checkpoint=None, session=None, limiter=None,
+                 window_workers=MONITOR_WINDOW_WORKERS, page_workers=MONITOR_PAGE_WORKERS, queue_size=8):
+    # `consume(vulns)` reçoit chaque page ; `on_checkpoint(fin)` est appelé quand
+    # toutes les fenêtres jusqu'à `fin` incluse sont ingérées. Une erreur arrête les
+    # téléchargements et le check reste sur la dernière fenêtre complète.
+    q = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def produce(i):
+        try:
+            for vulns in fetch_window(windows[i], session=session, limiter=limiter, workers=page_workers):
+                if stop.is_set():
+                    break
+                q.put((i, vulns))
+            q.put((i, _DONE))
+        except Exception as e:
+            q.put((i, e))
+
+    done, next_window, finished, ingested, error = set(), 0, 0, 0, None
+    with ThreadPoolExecutor(max_workers=max(1, window_workers)) as pool:
+        for i in range(len(windows)):
+            pool.submit(produce, i)
+        while finished < len(windows):
+            i, item = q.get()
+            if item is _DONE or isinstance(item, Exception):
+                finished += 1
+                if isinstance(item, Exception):
+                    error = error or item
+                    stop.set()
+                elif error is None:
+                    done.add(i)
+                    completed = next_window
+                    while next_window in done:
+                        next_window += 1
+                    if next_window > completed:
+                        print(f"🪟 Fenêtres ingérées : {next_window}/{len(windows)} "
+                              f"(jusqu'à {windows[next_window - 1][1].isoformat()})")
+                        if on_checkpoint:
+                            try:
+                                on_checkpoint(windows[next_window - 1][1])
+                            except Exception as e:
+                                # Écriture différée (voie rapide, NER) en échec : on s'arrête là
+                                error = e
+                                stop.set()
+                continue
+            if error is None:
+                try:
+                    consume(item)
+                    ingested += len(item)
+                except Exception as e:
+                    error = e
+                    stop.set()
+    if error is not None:
+        raise error
+    return ingested
 
-        # 1. Stocker temporairement
-        tmp_file = Path("digital_twin/tmp_new_cves.json")
-        with open(tmp_file, "w") as f:
-            json.dump({"vulnerabilities": new_cves}, f)
+# === CONTEXTE CHAUD : chargé une fois, réutilisé à chaque cycle
+class MonitorContext:
+    def __init__(self, graph=None, enricher=None, session=None, fast_lane=True):
+        from ner_enrich import EnrichmentStage, NEREnricher
+        if graph is None:
+            from py2neo import Graph
+            uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+            user = os.getenv("NEO4J_USER", "neo4j")
+            pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+            graph = Graph(uri, auth=(user, pwd))
+        self.graph = graph
+        self.enricher = enricher or NEREnricher()
+        self.session = session or make_session()
+        self.limiter = nvd_rate_limiter()
+        self.stage = EnrichmentStage(self.graph, self.enricher).start()
+        self.totals = {}
+        self.fast_lane = None
+        if fast_lane:
+            index = AssetIndex(self.graph).build()
+            self.fast_lane = FastLane(self.graph, index, enrichment=self.stage).start()
 
-        # 2. Exécuter collect_nvd.py
-        subprocess.run(["python", "cskg/collect_nvd.py", "--file", str(tmp_file)], check=True)
+    def warm_up(self):
+        # Charge le modèle NER avant le premier cycle plutôt qu'à la première CVE
+        t0 = time.time()
+        self.enricher.pipeline
+        print(f"🔥 Modèle NER prêt ({time.time() - t0:.1f}s)")
 
-        # 3. Exécuter update_neo4j.py
-        subprocess.run(["python", "cskg/update_neo4j.py"], check=True)
+    def ingest(self, vulns):
+        from nvd_bulk import ingest_cves
+        if self.fast_lane is not None:
+            vulns = self.fast_lane.route(vulns)
+        # strict : un lot non écrit remonte à poll_windows, le check ne dépasse pas sa fenêtre
+        totals = ingest_cves(self.graph, vulns, enrichment=self.stage, delta=True, strict=True)
+        for k, v in totals.items():
+            self.totals[k] = self.totals.get(k, 0) + v
+        return totals
 
-        # 4. Nettoyer
-        tmp_file.unlink()
+    def checkpoint(self, checked_at):
+        # Voie rapide et MENTIONS des pages déjà consommées doivent être écrites avant d'avancer
+        if self.fast_lane is not None:
+            self.fast_lane.flush()
+        self.stage.flush(strict=True)
+        update_last_check_time(checked_at)
 
-    update_last_check_time()
+    def close(self):
+        if self.fast_lane is not None:
+            self.fast_lane.close()
+        self.stage.close()
+
+# === PIPELINE : si nouvelle CVE trouvée
+def run_monitoring(ctx=None):
+    print(f"🕒 Lancement du monitoring : {datetime.utcnow().isoformat()}")
+    owned = ctx is None
+    ctx = ctx or MonitorContext()
+    try:
+        # Le check est daté avant l'appel : une CVE modifiée pendant l'ingestion sera revue au cycle suivant
+        started = datetime.utcnow()
+        last_check = get_last_check_time()
+        windows = list(iter_windows(last_check, started))
+        print(f"🔎 CVEs publiées ou modifiées depuis {last_check.isoformat()} : {len(windows)} fenêtre(s)")
+
+        ctx.totals = {}
+        if ctx.fast_lane is not None:
+            ctx.fast_lane.index.refresh()
+        t0 = time.time()
+        received = poll_windows(windows, ctx.ingest, on_checkpoint=ctx.checkpoint,
+                                session=ctx.session, limiter=ctx.limiter)
+        if not received:
+            print("✅ Aucune nouvelle CVE détectée.")
+        else:
+            print(f"📥 {received} CVE reçues : {ctx.totals.get('cve', 0)} écrites, "
+                  f"{ctx.totals.get('skipped', 0)} inchangées ({time.time() - t0:.1f}s)")
+    finally:
+        if owned:
+            ctx.close()
     print("⏱️ Monitoring terminé.")
 
-if __name__ == "__main__":
-    run_monitoring()
+# === MODE DAEMON : boucle de polling, arrêt propre sur SIGINT / SIGTERM
+def run_daemon(interval=MONITOR_INTERVAL, ctx=None):
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
 
+    ctx = ctx or MonitorContext()
+    ctx.warm_up()
+    print(f"🛰️ Monitoring continu : interrogation NVD toutes les {interval}s")
+    try:
+        while not stop.is_set():
+            t0 = time.time()
+            try:
+                run_monitoring(ctx)
+            except Exception as e:
+                print(f"❌ Cycle de monitoring en échec : {e}")
+            stop.wait(max(0.0, interval - (time.time() - t0)))
+    finally:
+        ctx.close()
+    print("🛑 Monitoring continu arrêté.")
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--daemon", action="store_true", help="Reste actif et interroge NVD en continu")
+    parser.add_argument("--interval", type=int, default=MONITOR_INTERVAL, help="Secondes entre deux cycles")
+    parser.add_argument("--no-fast-lane", action="store_true", help="Désactive la voie rapide (index des actifs)")
+    args = parser.parse_args()
+    ctx = MonitorContext(fast_lane=not args.no_fast_lane)
+    if args.daemon:
+        run_daemon(interval=args.interval, ctx=ctx)
+    else:
+        try:
+            run_monitoring(ctx)
+        finally:
+            ctx.close()
@@ -0,0 +1,234 @@
+# ======================== PRIORISATION DES CVE SELON LES ACTIFS ========================
+# Index mémoire des plateformes (CPE) présentes sur nos hosts, sous forme de
+# trie part -> vendor -> product -> version, construit depuis le graphe seul.
+# Deux sources, toutes deux issues de Nessus : les plateformes des hosts
+# (Host -HAS_CPE-> CPE, extraites de la sortie des plugins par nessus_bulk), et
+# les CPE des CVE déjà détectées sur les hosts (AFFECTS côté NVD). Une CVE
+# entrante dont un critère cpeMatch touche l'index passe par la voie rapide
+# (ingestion, propagation des IMPACTS des hosts touchés)
+# avec un objectif de latence ; les autres restent dans la voie bulk.
+import itertools
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "cskg"))
+
+ASSET_INDEX_TTL = int(os.getenv("ASSET_INDEX_TTL", "3600"))
+FAST_LANE_SLA = float(os.getenv("FAST_LANE_SLA", "60"))
+
+ANY_VERSION = ("", "*", "-")
+
+Q_ASSET_CPES = """
+MATCH (h:Host)-[r:HAS_CPE]->(p:CPE)
+WHERE r.resolved_at IS NULL
+RETURN p.name AS cpe, collect(DISTINCT h.name) AS hosts
+UNION
+MATCH (h:Host)-[hp:HAS_PLUGIN]->(:Plugin)-[:DETECTS]->(c:CVE)
+WHERE hp.resolved_at IS NULL
+OPTIONAL MATCH (c)-[:SAME_AS]-(k:CVE)
+WITH h, c, collect(k) AS ks
+UNWIND [c] + ks AS x
+MATCH (x)-[:AFFECTS]->(p:CPE)
+RETURN p.name AS cpe, collect(DISTINCT h.name) AS hosts
+"""
+
+# ======================== 1. CPE ET VERSIONS ========================
+def parse_cpe(uri):
+    # cpe:/a:vendor:product:version (2.2) ou cpe:2.3:a:vendor:product:version:... -> (part, vendor, product, version)
+    if uri.startswith("cpe:2.3:"):
+        fields = uri[len("cpe:2.3:"):].split(":")
+    elif uri.startswith("cpe:/"):
+        fields = uri[len("cpe:/"):].split(":")
+    else:
+        return None
+    fields += [""] * (4 - len(fields))
+    part, vendor, product, version = (f.lower() for f in fields[:4])
+    if not vendor or not product:
+        return None
+    return part, vendor, product, version
+
+def version_key(version):
+    # "2.4.62" < "2.4.100", "1.26.0-3" > "1.26.0" ; segments non numériques comparés en texte
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p)
+                 for p in re.split(r"[.\-_+:]", version) if p)
+
+def in_range(version, match):
+    key = version_key(version)
+    bounds = (("versionStartIncluding", lambda k, b: k >= b), ("versionStartExcluding", lambda k, b: k > b),
+              ("versionEndIncluding", lambda k, b: k <= b), ("versionEndExcluding", lambda k, b: k < b))
+    return all(ok(key, version_key(match[field])) for field, ok in bounds if match.get(field))
+
+def cvss_of(item):
+    metrics = item.get("cve", {}).get("metrics", {})
+    for key in ("cvssMetricV31", "cvssMetricV30", "cvssMetricV2"):
+        if metrics.get(key):
+            return float(metrics[key][0]["cvssData"].get("baseScore") or 0.0)
+    return 0.0
+
+# ======================== 2. TRIE DES ACTIFS ========================
+class CPETrie:
+    def __init__(self):
+        self.root = {}
+        self.size = 0
+
+    def add(self, uri, host):
+        cpe = parse_cpe(uri)
+        if cpe is None:
+            return False
+        part, vendor, product, version = cpe
+        versions = self.root.setdefault(part, {}).setdefault(vendor, {}).setdefault(product, {})
+        hosts = versions.setdefault("" if version in ANY_VERSION else version, set())
+        if host not in hosts:
+            hosts.add(host)
+            self.size += 1
+        return True
+
+    def match(self, cpe_match):
+        # Hosts touchés par un critère cpeMatch NVD (version exacte, plage, ou produit entier)
+        cpe = parse_cpe(cpe_match.get("criteria", ""))
+        if cpe is None:
+            return set()
+        part, vendor, product, version = cpe
+        parts = self.root.values() if part in ("", "*") else [self.root.get(part, {})]
+        hits = set()
+        for vendors in parts:
+            versions = vendors.get(vendor, {}).get(product)
+            if not versions:
+                continue
+            # Version inconnue côté actif : le produit est présent, on priorise
+            hits |= versions.get("", set())
+            if version not in ANY_VERSION:
+                hits |= versions.get(version, set())
+            else:
+                for v, hosts in versions.items():
+                    if v and in_range(v, cpe_match):
+                        hits |= hosts
+        return hits
+
+# ======================== 3. INDEX DES ACTIFS ========================
+class AssetIndex:
+    def __init__(self, graph, ttl=ASSET_INDEX_TTL):
+        self.graph = graph
+        self.ttl = ttl
+        self.trie = CPETrie()
+        self.built_at = None
+
+    def add_graph(self, graph):
+        added = 0
+        for row in graph.run(Q_ASSET_CPES).data():
+            for host in row["hosts"]:
+                added += self.trie.add(row["cpe"], host)
+        return added
+
+    def build(self):
+        t0 = time.time()
+        self.trie = CPETrie()
+        self.add_graph(self.graph)
+        self.built_at = time.time()
+        print(f"🗂️ Index des actifs : {self.trie.size} couples (CPE, host) ({time.time() - t0:.1f}s)")
+        return self
+
+    def refresh(self):
+        if self.built_at is None or time.time() - self.built_at > self.ttl:
+            self.build()
+        return self
+
+    def hosts_for(self, item):
+        hits = set()
+        for configuration in item.get("cve", {}).get("configurations", []):
+            for node in configuration.get("nodes", []):
+                for cpe_match in node.get("cpeMatch", []):
+                    if cpe_match.get("vulnerable", True):
+                        hits |= self.trie.match(cpe_match)
+        return hits
+
+# ======================== 4. VOIE RAPIDE ========================
+class FastLane:
+    # File de priorité (CVSS décroissant) traitée dans son propre thread, CVE par CVE :
+    # ingestion delta puis IMPACTS des hosts touchés. Pas de SAME_AS exact : NVD et
+    # Nessus fusionnent sur le même nœud :CVE {name}, l'homonyme Nessus est ce nœud.
+    def __init__(self, graph, index, enrichment=None, sla=FAST_LANE_SLA):
+        self.graph = graph
+        self.index = index
+        self.enrichment = enrichment
+        self.sla = sla
+        self.queue = queue.PriorityQueue()
+        self.seq = itertools.count()
+        self.stats = {"cves": 0, "late": 0, "errors": 0, "max_latency": 0.0}
+        self.failed = []
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def route(self, vulns):
+        # Retourne les CVE de la voie bulk ; celles qui touchent nos actifs partent en voie rapide
+        bulk = []
+        for item in vulns:
+            hosts = self.index.hosts_for(item)
+            if hosts:
+                self.queue.put((-cvss_of(item), next(self.seq), time.time(), item, sorted(hosts)))
+            else:
+                bulk.append(item)
+        return bulk
+
+    def process(self, item, hosts):
+        from impacts import hosts_of_cves, recompute_hosts
+        from nvd_bulk import ingest_cves
+        name = item["cve"]["id"]
+        # strict : une écriture en échec lève, la CVE passe dans self.failed et flush() bloque le check
+        ingest_cves(self.graph, [item], enrichment=self.enrichment, delta=True, strict=True)
+        impacted = sorted(set(hosts) | set(hosts_of_cves(self.graph, [name])))
+        return recompute_hosts(self.graph, impacted, now=datetime.utcnow().isoformat())
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task[3] is None:
+                self.queue.task_done()
+                return
+            _, _, enqueued, item, hosts = task
+            try:
+                self.process(item, hosts)
+                latency = time.time() - enqueued
+                self.stats["cves"] += 1
+                self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+                if latency > self.sla:
+                    self.stats["late"] += 1
+                    print(f"⚠️ Voie rapide : {item['cve']['id']} traitée en {latency:.1f}s (objectif {self.sla:.0f}s)")
+                else:
+                    print(f"⚡ {item['cve']['id']} (CVSS {-task[0]:.1f}) sur {len(hosts)} host(s) "
+                          f"dans le graphe en {latency:.1f}s")
+            except Exception as e:
+                self.stats["errors"] += 1
+                self.failed.append(item["cve"]["id"])
+                print(f"⚠️ Voie rapide en échec sur {item['cve']['id']}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        # Une CVE en échec a quitté la voie bulk : on lève pour que le check n'avance
+        # pas, et la fenêtre sera relue (et la CVE re-routée) au cycle suivant
+        self.queue.join()
+        if self.failed:
+            failed, self.failed = self.failed, []
+            raise RuntimeError(f"Voie rapide en échec pour {len(failed)} CVE ({', '.join(failed[:5])})")
+        return self.stats
+
+    def close(self):
+        if self.thread is not None:
+            # Sentinelle en dernière position : les CVE déjà en file sont traitées avant l'arrêt
+            self.queue.put((float("inf"), next(self.seq), time.time(), None, []))
+            self.thread.join()
+            self.thread = None
+        print(f"⚡ Voie rapide : {self.stats['cves']} CVE, {self.stats['late']} hors objectif, "
+              f"latence max {self.stats['max_latency']:.1f}s")
+        return self.stats
@@ -1 +1,431 @@
-# Placeholder for digital_twin/simulator.py
+# ======================== SIMULATEUR D'ATTAQUE ET DE SCÉNARIOS WHAT-IF ========================
+# Le graphe Host / Plugin / CVE / Port / Service (snapshot graph_engine ou Neo4j)
+# est réduit une fois pour toutes à des tableaux entiers :
+#   - findings (host, plugin, CVE) ouverts, agrégés en couples (host, CVE) ;
+#   - adjacence CSR host -> exposition (Port / Service) -> host, pour le mouvement latéral.
+# La probabilité d'exploitation d'un host combine CVSS, EPSS et VPR de ses CVE
+# ouvertes (1 - Π(1 - p)), tenue en log-survie par host : un scénario
+# "patcher ces plugins / isoler ces hosts" n'est qu'un delta sur cet état de base.
+# Les parcours (BFS déterministe et Monte Carlo) sont vectorisés par niveaux,
+# tous tirages d'un lot à la fois ; les tirages et les scénarios sont répartis
+# sur un pool de processus.
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "cskg"))
+
+SIM_TRIALS = int(os.getenv("SIM_TRIALS", "1000"))
+SIM_WORKERS = int(os.getenv("SIM_WORKERS", str(os.cpu_count() or 1)))
+SIM_BATCH = 256
+DEFAULT_EXPLOIT_P = 0.1   # CVE sans aucun score
+MAX_EXPLOIT_P = 0.999
+WEIGHTS = {"cvss": 1.0, "epss": 1.0, "vpr": 1.0}
+# Port 0 (niveau host) et services génériques : partagés par tous, pas un vecteur latéral
+HUB_EXPOSURES = {"0", "general", "unknown", ""}
+
+# ======================== 1. OUTILS VECTORISÉS ========================
+def _expand(keys, ptr, targets):
+    # Chaque ligne `keys[k]` est répétée pour chacune de ses cibles CSR
+    counts = ptr[keys + 1] - ptr[keys]
+    rows = np.repeat(np.arange(len(keys)), counts)
+    offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return rows, targets[np.repeat(ptr[keys], counts) + offsets]
+
+def _csr(src, dst, n):
+    order = np.argsort(src, kind="stable")
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=ptr[1:])
+    return ptr, dst[order]
+
+def _float(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return np.nan
+
+def exploit_probability(cvss, epss, vpr, weights=WEIGHTS):
+    # Moyenne pondérée des scores disponibles, ramenés dans [0, 1]
+    parts = np.stack([np.asarray(cvss) / 10.0, np.asarray(epss), np.asarray(vpr) / 10.0])
+    w = np.array([weights["cvss"], weights["epss"], weights["vpr"]])[:, None]
+    avail = ~np.isnan(parts)
+    num = (np.where(avail, parts, 0.0) * w).sum(axis=0)
+    den = (avail * w).sum(axis=0)
+    p = np.where(den > 0, num / np.where(den > 0, den, 1.0), DEFAULT_EXPLOIT_P)
+    return np.clip(p, 0.0, MAX_EXPLOIT_P)
+
+# ======================== 2. SCÉNARIOS ========================
+class Scenario:
+    def __init__(self, name="baseline", patch=(), isolate=()):
+        self.name = name
+        self.patch = [str(p) for p in patch]
+        self.isolate = [str(h) for h in isolate]
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get("name", "scenario"), d.get("patch", ()), d.get("isolate", ()))
+
+    def to_dict(self):
+        return {"name": self.name, "patch": self.patch, "isolate": self.isolate}
+
+# ======================== 3. ÉTAT DE BASE ========================
+class SimState:
+    def __init__(self, hosts, plugins, finding_pair, finding_plugin, pair_host, pair_p, pair_net,
+                 host_exposures, n_exposures, entries=None, weights=WEIGHTS, has_net_info=None):
+        self.hosts = list(hosts)
+        self.plugins = list(plugins)
+        self.host_index = {h: i for i, h in enumerate(self.hosts)}
+        self.plugin_index = {p: i for i, p in enumerate(self.plugins)}
+        n_hosts, n_pairs = len(self.hosts), len(pair_host)
+
+        # Findings (host, plugin, CVE) -> couple (host, CVE) ; un couple reste ouvert
+        # tant qu'au moins un plugin non patché le détecte
+        self.finding_pair = np.asarray(finding_pair, dtype=np.int64)
+        self.plugin_ptr, self.plugin_findings = _csr(np.asarray(finding_plugin, dtype=np.int64),
+                                                     np.arange(len(self.finding_pair)), len(self.plugins))
+        self.pair_count = np.bincount(self.finding_pair, minlength=n_pairs)
+        self.pair_host = np.asarray(pair_host, dtype=np.int64)
+        self.pair_logsurv = np.log1p(-np.asarray(pair_p, dtype=np.float64))
+        self.pair_net = np.asarray(pair_net, dtype=bool)
+
+        self.base_logsurv = np.bincount(self.pair_host, weights=self.pair_logsurv, minlength=n_hosts)
+        self.base_open = np.bincount(self.pair_host, minlength=n_hosts)
+        self.base_net = np.bincount(self.pair_host, weights=self.pair_net, minlength=n_hosts)
+        # Le graphe renseigne-t-il attackVector ? Sinon tout host exposé est une entrée.
+        # Ne dépend pas des findings ouverts : patcher la dernière CVE réseau ne doit pas
+        # faire de chaque host une entrée (un état reconstruit = l'état de base + delta)
+        self.has_net_info = bool(self.pair_net.any()) if has_net_info is None else bool(has_net_info)
+
+        # Mouvement latéral : host -> exposition -> host
+        hx = np.asarray(host_exposures, dtype=np.int64).reshape(-1, 2)
+        self.n_exposures = int(n_exposures)
+        self.hx_ptr, self.hx_idx = _csr(hx[:, 0], hx[:, 1], n_hosts)
+        self.xh_ptr, self.xh_idx = _csr(hx[:, 1], hx[:, 0], self.n_exposures)
+
+        self.entries = None
+        if entries:
+            self.entries = np.zeros(n_hosts, dtype=bool)
+            self.entries[[self.host_index[h] for h in entries if h in self.host_index]] = True
+        self.weights = weights
+
+    @property
+    def n_hosts(self):
+        return len(self.hosts)
+
+    @classmethod
+    def from_engine(cls, engine, entries=None, weights=WEIGHTS):
+        n = engine.n_nodes
+        is_host = engine.label_mask("Host")
+        is_plugin = engine.label_mask("Plugin")
+        is_cve = engine.label_mask("CVE")
+
+        # Scores par CVE, complétés par la CVE jumelle (SAME_AS) : max de chaque score
+        col = lambda prop: np.array([_float(engine.get(i, prop)) for i in range(n)], dtype=np.float64)
+        cvss, epss, vpr = col("cvss_score"), col("epss_score"), col("vpr_score")
+        # CVE Nessus sans score NVD : CVSS v3 reporté par les plugins (nessus_bulk)
+        cvss = np.fmax(cvss, col("cvss3_score"))
+        vectors = [engine.get(i, "attackVector") for i in range(n)]
+        net = np.array([v == "NETWORK" for v in vectors], dtype=bool)
+        has_net_info = any(v is not None and is_cve[i] for i, v in enumerate(vectors))
+        if "SAME_AS" in engine.edges:
+            a, b, _ = engine.edges["SAME_AS"].arrays()
+            for arr in (cvss, epss, vpr):
+                np.fmax.at(arr, a, arr[b].copy())
+                np.fmax.at(arr, b, arr[a].copy())
+            np.logical_or.at(net, a, net[b].copy())
+            np.logical_or.at(net, b, net[a].copy())
+        p_cve = exploit_probability(cvss, epss, vpr, weights)
+
+        host_nodes = np.flatnonzero(is_host)
+        plugin_nodes = np.flatnonzero(is_plugin)
+        host_of = np.full(n, -1, dtype=np.int64)
+        host_of[host_nodes] = np.arange(len(host_nodes))
+        plugin_of = np.full(n, -1, dtype=np.int64)
+        plugin_of[plugin_nodes] = np.arange(len(plugin_nodes))
+
+        # Findings ouverts : Host -HAS_PLUGIN-> Plugin -DETECTS-> CVE
+        h = p = np.zeros(0, dtype=np.int64)
+        if "HAS_PLUGIN" in engine.edges:
+            t = engine.edges["HAS_PLUGIN"]
+            h, p, idx = t.arrays()
+            keep = is_host[h] & is_plugin[p] & np.array([t.get(i, "resolved_at") is None
+                                                        for i in idx.tolist()], dtype=bool)
+            h, p = h[keep], p[keep]
+        rows, c = _expand(p, *engine._adjacency("DETECTS"))
+        keep = is_cve[c]
+        h, p, c = h[rows][keep], p[rows][keep], c[keep]
+        pair_key, finding_pair = np.unique(h * n + c, return_inverse=True)
+        pair_cve = pair_key % n
+
+        # Expositions : ports et services ouverts des hosts (hors hubs)
+        exposures, hx = {}, []
+        for rel in ("CONNECTED_TO", "RUNS_SERVICE"):
+            t = engine.edges.get(rel)
+            if t is None:
+                continue
+            src, dst, idx = t.arrays()
+            for s, d, i in zip(src.tolist(), dst.tolist(), idx.tolist()):
+                key = engine.get(d, "port") if rel == "CONNECTED_TO" else engine.get(d, "name")
+                if not is_host[s] or t.get(i, "resolved_at") is not None or str(key) in HUB_EXPOSURES:
+                    continue
+                hx.append((host_of[s], exposures.setdefault((rel, key), len(exposures))))
+
+        return cls(hosts=[engine.get(i, "name") for i in host_nodes],
+                   plugins=[str(engine.get(i, "plugin_id")) for i in plugin_nodes],
+                   finding_pair=finding_pair, finding_plugin=plugin_of[p],
+                   pair_host=host_of[pair_key // n], pair_p=p_cve[pair_cve], pair_net=net[pair_cve],
+                   host_exposures=np.array(sorted(set(hx)), dtype=np.int64), n_exposures=len(exposures),
+                   entries=entries, weights=weights, has_net_info=has_net_info)
+
+    # ---------- application d'un scénario (delta sur l'état de base) ----------
+    def apply(self, scenario):
+        patched = [self.plugin_index[p] for p in scenario.patch if p in self.plugin_index]
+        logsurv, n_open, n_net = self.base_logsurv, self.base_open, self.base_net
+        if patched:
+            patched = np.asarray(patched, dtype=np.int64)
+            _, findings = _expand(patched, self.plugin_ptr, self.plugin_findings)
+            pairs, dec = np.unique(self.finding_pair[findings], return_counts=True)
+            closed = pairs[self.pair_count[pairs] == dec]
+            hosts = self.pair_host[closed]
+            logsurv, n_open, n_net = logsurv.copy(), n_open.copy(), n_net.copy()
+            np.subtract.at(logsurv, hosts, self.pair_logsurv[closed])
+            np.subtract.at(n_open, hosts, 1)
+            np.subtract.at(n_net, hosts, self.pair_net[closed])
+
+        blocked = np.zeros(self.n_hosts, dtype=bool)
+        blocked[[self.host_index[h] for h in scenario.isolate if h in self.host_index]] = True
+        p_host = np.where(n_open > 0, -np.expm1(logsurv), 0.0)
+        p_host[blocked] = 0.0
+        if self.entries is not None:
+            entry = self.entries.copy()
+        else:
+            entry = (n_net > 0) if self.has_net_info else (n_open > 0)
+        entry &= ~blocked
+        return p_host, entry
+
+    # ---------- atteignabilité déterministe (BFS par niveaux) ----------
+    def _lateral(self, src_hosts):
+        # host -> expositions (dédoublonnées) -> hosts ; retourne (source, cible)
+        rows, x = _expand(src_hosts, self.hx_ptr, self.hx_idx)
+        src = src_hosts[rows]
+        x, first = np.unique(x, return_index=True)
+        src = src[first]
+        rows, dst = _expand(x, self.xh_ptr, self.xh_idx)
+        return src[rows], dst
+
+    def reachability(self, p_host, entry):
+        level = np.full(self.n_hosts, -1, dtype=np.int64)
+        parent = np.full(self.n_hosts, -1, dtype=np.int64)
+        ok = p_host > 0
+        frontier = np.flatnonzero(entry & ok)
+        level[frontier] = 0
+        depth = 0
+        while frontier.size:
+            depth += 1
+            src, dst = self._lateral(frontier)
+            new = ok[dst] & (level[dst] < 0)
+            dst, first = np.unique(dst[new], return_index=True)
+            level[dst] = depth
+            parent[dst] = src[new][first]
+            frontier = dst
+        return level, parent
+
+    def attack_path(self, parent, host):
+        path, i = [], self.host_index[host] if isinstance(host, str) else host
+        while i >= 0:
+            path.append(self.hosts[i])
+            i = parent[i]
+        return path[::-1]
+
+    # ---------- Monte Carlo : tous les tirages d'un lot propagés ensemble ----------
+    def _spread(self, exploitable, entry):
+        n_trials = exploitable.shape[0]
+        comp = exploitable & entry[None, :]
+        steps = np.where(comp, 0, -1).astype(np.int16)
+        frontier = comp
+        depth = 0
+        while self.n_exposures and frontier.any():
+            depth += 1
+            t, h = np.nonzero(frontier)
+            rows, x = _expand(h, self.hx_ptr, self.hx_idx)
+            key = np.unique(t[rows] * self.n_exposures + x)
+            t, x = key // self.n_exposures, key % self.n_exposures
+            rows, h2 = _expand(x, self.xh_ptr, self.xh_idx)
+            new = np.zeros((n_trials, self.n_hosts), dtype=bool)
+            new[t[rows], h2] = True
+            new &= exploitable & ~comp
+            comp |= new
+            steps[new] = depth
+            frontier = new
+        return comp, steps
+
+    def monte_carlo(self, p_host, entry, trials, seed=None, batch=SIM_BATCH):
+        rng = np.random.default_rng(seed)
+        hits = np.zeros(self.n_hosts, dtype=np.int64)
+        step_sum = np.zeros(self.n_hosts, dtype=np.int64)
+        totals = []
+        for start in range(0, trials, batch):
+            size = min(batch, trials - start)
+            exploitable = rng.random((size, self.n_hosts)) < p_host[None, :]
+            comp, steps = self._spread(exploitable, entry)
+            hits += comp.sum(axis=0)
+            step_sum += np.where(comp, steps, 0).sum(axis=0)
+            totals.append(comp.sum(axis=1))
+        return {"trials": trials, "hits": hits, "step_sum": step_sum,
+                "totals": np.concatenate(totals) if totals else np.zeros(0, dtype=np.int64)}
+
+    def evaluate(self, scenario, trials=SIM_TRIALS, seed=None, top=10):
+        p_host, entry = self.apply(scenario)
+        level, parent = self.reachability(p_host, entry)
+        mc = self.monte_carlo(p_host, entry, trials, seed)
+        return summarize(self, scenario, level, parent, mc, top)
+
+# ======================== 4. RÉSUMÉ ========================
+def merge_mc(parts):
+    return {"trials": sum(m["trials"] for m in parts),
+            "hits": sum(m["hits"] for m in parts),
+            "step_sum": sum(m["step_sum"] for m in parts),
+            "totals": np.concatenate([m["totals"] for m in parts])}
+
+def summarize(state, scenario, level, parent, mc, top=10):
+    trials = max(mc["trials"], 1)
+    p_comp = mc["hits"] / trials
+    mean_steps = np.divide(mc["step_sum"], mc["hits"], out=np.zeros(state.n_hosts), where=mc["hits"] > 0)
+    order = np.argsort(-p_comp, kind="stable")[:top]
+    totals = mc["totals"] if len(mc["totals"]) else np.zeros(1)
+    return {
+        **scenario.to_dict(),
+        "entry_hosts": int((level == 0).sum()),
+        "reachable_hosts": int((level >= 0).sum()),
+        "max_depth": int(level.max(initial=-1)),
+        "expected_compromised": float(totals.mean()),
+        "p95_compromised": float(np.percentile(totals, 95)),
+        "top_hosts": [{"host": state.hosts[i], "p_compromise": round(float(p_comp[i]), 4),
+                       "mean_steps": round(float(mean_steps[i]), 2),
+                       "path": state.attack_path(parent, int(i)) if level[i] >= 0 else []}
+                      for i in order if p_comp[i] > 0],
+    }
+
+def add_risk_reduction(baseline, results):
+    # Écart au scénario vide évalué avec la même graine : un scénario sans effet donne 0
+    for r in results:
+        r["risk_reduction"] = baseline["expected_compromised"] - r["expected_compromised"]
+    return results
+
+# ======================== 5. POOL DE PROCESSUS ========================
+_STATE = None
+
+def _init_worker(state):
+    global _STATE
+    _STATE = state
+
+def _mc_task(args):
+    scenario, trials, seed = args
+    p_host, entry = _STATE.apply(scenario)
+    return _STATE.monte_carlo(p_host, entry, trials, seed)
+
+def _eval_task(args):
+    scenario, trials, seed, top = args
+    return _STATE.evaluate(scenario, trials, seed, top)
+
+def run_trials(state, scenario, trials=SIM_TRIALS, workers=SIM_WORKERS, seed=None, top=10):
+    # Un scénario, tirages répartis sur le pool (graines indépendantes par morceau)
+    p_host, entry = state.apply(scenario)
+    level, parent = state.reachability(p_host, entry)
+    chunks = [c for c in np.array_split(np.arange(trials), max(1, workers)) if len(c)]
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    if workers <= 1 or len(chunks) <= 1:
+        parts = [state.monte_carlo(p_host, entry, len(c), s) for c, s in zip(chunks, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as pool:
+            parts = list(pool.map(_mc_task, [(scenario, len(c), s) for c, s in zip(chunks, seeds)]))
+    return summarize(state, scenario, level, parent, merge_mc(parts), top)
+
+def evaluate_many(state, scenarios, trials=SIM_TRIALS, workers=SIM_WORKERS, seed=None, top=10):
+    # Plusieurs scénarios what-if : l'état de base est envoyé une fois par processus,
+    # chaque scénario n'applique que son delta. Même graine pour tous : écarts comparables.
+    tasks = [(s, trials, seed, top) for s in scenarios]
+    if workers <= 1 or len(tasks) <= 1:
+        results = [state.evaluate(*t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(state,)) as pool:
+            results = list(pool.map(_eval_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    return results
+
+# ======================== 6. CHARGEMENT ========================
+def load_state(snapshot=None, from_neo4j=False, entries=None):
+    from graph_engine import GRAPH_SNAPSHOT, GraphEngine
+    t0 = time.time()
+    if from_neo4j:
+        from py2neo import Graph
+        uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+        user = os.getenv("NEO4J_USER", "neo4j")
+        pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+        engine = GraphEngine.from_neo4j(Graph(uri, auth=(user, pwd)))
+    else:
+        engine = GraphEngine.load(snapshot or GRAPH_SNAPSHOT)
+    state = SimState.from_engine(engine, entries=entries)
+    print(f"📦 État de simulation : {state.n_hosts} hosts, {len(state.pair_host)} couples (host, CVE), "
+          f"{state.n_exposures} expositions ({time.time() - t0:.1f}s)")
+    return state
+
+# ======================== 7. MAIN ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default=None, help="Snapshot graph_engine (.npz)")
+    parser.add_argument("--from-neo4j", action="store_true", help="Charge directement depuis Neo4j")
+    parser.add_argument("--trials", type=int, default=SIM_TRIALS)
+    parser.add_argument("--workers", type=int, default=SIM_WORKERS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--entry", default="", help="Hosts d'entrée (séparés par des virgules)")
+    parser.add_argument("--patch", default="", help="Plugins patchés (IDs séparés par des virgules)")
+    parser.add_argument("--isolate", default="", help="Hosts isolés (séparés par des virgules)")
+    parser.add_argument("--scenarios", default=None, help="Fichier JSON : [{name, patch, isolate}, ...]")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", default=None, help="Résultats JSON")
+    args = parser.parse_args()
+
+    split = lambda s: [x.strip() for x in s.split(",") if x.strip()]
+    state = load_state(args.snapshot, args.from_neo4j, entries=split(args.entry) or None)
+
+    scenarios = []
+    if args.scenarios:
+        with open(args.scenarios, "r") as f:
+            scenarios = [Scenario.from_dict(d) for d in json.load(f)]
+    if args.patch or args.isolate:
+        scenarios.append(Scenario("cli", split(args.patch), split(args.isolate)))
+
+    t0 = time.time()
+    results = []
+    if scenarios:
+        # Base évaluée comme un scénario vide, même graine pour tous (nombres aléatoires communs) :
+        # risk_reduction ne mesure que l'effet du scénario, pas le bruit des tirages
+        seed = np.random.SeedSequence(args.seed).entropy
+        results = evaluate_many(state, [Scenario()] + scenarios, args.trials, args.workers, seed, args.top)
+        baseline = results.pop(0)
+    else:
+        baseline = run_trials(state, Scenario(), args.trials, args.workers, args.seed, args.top)
+    elapsed = time.time() - t0
+    print(f"🎯 Base : {baseline['reachable_hosts']} hosts atteignables ({baseline['entry_hosts']} entrées), "
+          f"{baseline['expected_compromised']:.2f} compromis en moyenne")
+    for h in baseline["top_hosts"]:
+        print(f"   • {h['host']:<20} p={h['p_compromise']:.3f}  chemin : {' → '.join(h['path'])}")
+
+    if results:
+        add_risk_reduction(baseline, results)
+        for r in sorted(results, key=lambda r: -r["risk_reduction"])[:args.top]:
+            print(f"🧪 {r['name']:<20} compromis moyens {r['expected_compromised']:.2f} "
+                  f"(−{r['risk_reduction']:.2f}), atteignables {r['reachable_hosts']}")
+    print(f"⏱️ {len(results) + 1} évaluation(s) en {elapsed:.1f}s ({(len(results) + 1) / max(elapsed, 1e-9) * 60:.0f}/min)")
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump({"baseline": baseline, "scenarios": results}, f, indent=2)
+        print(f"📄 Résultats exportés dans {args.out}")
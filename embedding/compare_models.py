@@ -1,6 +1,8 @@
 # 📊 compare_models.py — Évaluation des alignements SAME_AS (NVD ↔ Nessus)
 
 import os
+import sys
+from pathlib import Path
 import pandas as pd
 import numpy as np
 import matplotlib
@@ -10,9 +12,11 @@ from sklearn.metrics.pairwise import cosine_similarity
 from sklearn.manifold import TSNE
 from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
-from sentence_transformers import SentenceTransformer
 from py2neo import Graph, NodeMatcher
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "cskg"))
+from embedding_store import EmbeddingStore, cve_text
+
 # ========== 1. Connexion à Neo4j ==========
 uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
 user = os.getenv("NEO4J_USER", "neo4j")
@@ -53,16 +57,17 @@ print(f"✅ Similarité cosine moyenne (embedding) : {avg_cosine:.4f}")
 
 # ========== 5. Embeddings avec Sentence-BERT ==========
 print("\n🔍 t-SNE des entités alignées...")
-model = SentenceTransformer("all-mpnet-base-v2")
+store = EmbeddingStore()
 
 all_entities = list(set(align_df['CVE_KG1'].tolist() + align_df['CVE_KG2'].tolist()))
 texts = []
 for eid in all_entities:
     node = matcher.match("CVE", name=eid).first()
     description = node["description"] if node and "description" in node else ""
-    texts.append(f"{eid} {description}")
+    texts.append(cve_text(eid, description))
 
-embeddings = model.encode(texts, convert_to_numpy=True)
+# Vecteurs déjà calculés par align_kg.py relus depuis le store (pas de ré-encodage)
+embeddings = store.get(texts)
 
 # ========== 6. t-SNE ==========
 tsne = TSNE(n_components=2, random_state=42, perplexity=30)
@@ -0,0 +1,267 @@
+# ======================== SNAPSHOT DES TRIPLETS (ENTIERS, MEMMAP) ========================
+# Le graphe fusionné est exporté une fois depuis Neo4j en triplets (tête, relation,
+# queue) encodés en int32 dans un fichier mappé en mémoire (triples.<v>.bin), avec les
+# vocabulaires d'entités « Label:clé » et de relations (entities.<v>.json / relations.<v>.json).
+# Les vocabulaires ne font que grandir : un id reste valable d'un export à l'autre.
+# Chaque triplet porte la génération de l'export qui l'a vu apparaître (generations.<v>.bin),
+# ce qui permet à train_rotate.py de n'affiner que sur les triplets nouveaux.
+# L'échantillonneur de négatifs (corruption « bern ») tourne dans un pool de threads
+# pendant que le modèle calcule.
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+ROTATE_SNAPSHOT_DIR = os.getenv("ROTATE_SNAPSHOT_DIR", "data/kg_triples")
+ROTATE_SAMPLER_WORKERS = int(os.getenv("ROTATE_SAMPLER_WORKERS", "4"))
+# Relations hors apprentissage (liste séparée par des virgules)
+ROTATE_EXCLUDE = {r for r in os.getenv("ROTATE_EXCLUDE", "").split(",") if r}
+EXPORT_CHUNK = 100000
+
+# Un seul passage sur les relations ; findings résolus exclus
+Q_EXPORT = """
+MATCH (h)-[r]->(t)
+WHERE r.resolved_at IS NULL
+RETURN labels(h)[0] AS hl, coalesce(h.name, h.plugin_id, toString(h.port)) AS hk,
+       type(r) AS rel,
+       labels(t)[0] AS tl, coalesce(t.name, t.plugin_id, toString(t.port)) AS tk
+"""
+
+def entity_key(label, key):
+    return f"{label}:{key}"
+
+# ======================== 1. SNAPSHOT ========================
+class TriplesSnapshot:
+    def __init__(self, root=ROTATE_SNAPSHOT_DIR):
+        self.dir = root
+        self.entities, self.relations = [], []
+        self.entity_index, self.relation_index = {}, {}
+        self.count = 0
+        self.generation = 0
+        self.exported_at = None
+        self.version = 0
+        self._triples = None
+        self._generations = None
+        self._load()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.dir, "meta.json")
+
+    def _path(self, name):
+        return os.path.join(self.dir, name)
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r") as f:
+            meta = json.load(f)
+        self.count, self.generation, self.exported_at = meta["count"], meta["generation"], meta["exported_at"]
+        self.version = meta["version"]
+        with open(self._path(f"entities.{self.version}.json"), "r") as f:
+            self.entities = json.load(f)
+        with open(self._path(f"relations.{self.version}.json"), "r") as f:
+            self.relations = json.load(f)
+        self.entity_index = {e: i for i, e in enumerate(self.entities)}
+        self.relation_index = {r: i for i, r in enumerate(self.relations)}
+        self._open()
+
+    def _open(self):
+        if self.count:
+            self._triples = np.memmap(self._path(f"triples.{self.version}.bin"), dtype=np.int32, mode="r",
+                                      shape=(self.count, 3))
+            self._generations = np.memmap(self._path(f"generations.{self.version}.bin"), dtype=np.int32,
+                                          mode="r", shape=(self.count,))
+        else:
+            self._triples, self._generations = None, None
+
+    # ---------- lecture ----------
+    def __len__(self):
+        return self.count
+
+    @property
+    def n_entities(self):
+        return len(self.entities)
+
+    @property
+    def n_relations(self):
+        return len(self.relations)
+
+    @property
+    def triples(self):
+        # Vue mappée (sans copie) : int32 (count, 3)
+        return self._triples if self._triples is not None else np.empty((0, 3), dtype=np.int32)
+
+    @property
+    def generations(self):
+        return self._generations if self._generations is not None else np.empty(0, dtype=np.int32)
+
+    def since(self, generation):
+        # Indices des triplets apparus après la génération donnée
+        return np.flatnonzero(np.asarray(self.generations) > generation)
+
+    def _keys(self, triples):
+        # Clé int64 unique par triplet (vocabulaires courants)
+        t = np.asarray(triples, dtype=np.int64)
+        return (t[:, 0] * self.n_relations + t[:, 1]) * self.n_entities + t[:, 2]
+
+    # ---------- écriture ----------
+    def encode(self, heads, relations, tails):
+        # Chaînes -> ids, vocabulaires étendus au besoin
+        def ids(values, index, vocab):
+            out = np.empty(len(values), dtype=np.int32)
+            for i, v in enumerate(values):
+                j = index.get(v)
+                if j is None:
+                    j = index[v] = len(vocab)
+                    vocab.append(v)
+                out[i] = j
+            return out
+        return np.stack([ids(heads, self.entity_index, self.entities),
+                         ids(relations, self.relation_index, self.relations),
+                         ids(tails, self.entity_index, self.entities)], axis=1)
+
+    def update(self, chunks):
+        # Remplace le contenu par les triplets courants (itérable de tableaux int32 (n, 3)
+        # issus de encode) : les triplets déjà connus gardent leur génération.
+        current = np.concatenate(list(chunks) or [np.empty((0, 3), dtype=np.int32)])
+        if self.n_entities ** 2 * max(self.n_relations, 1) >= 2 ** 63:
+            raise ValueError("Vocabulaire trop grand pour les clés int64")
+        keys = self._keys(current)
+        keys, first = np.unique(keys, return_index=True)
+        current = current[first]
+        old_keys = self._keys(self.triples)
+        kept = np.isin(old_keys, keys)
+        is_new = ~np.isin(keys, old_keys)
+        counts = {"added": int(is_new.sum()), "removed": int((~kept).sum()), "total": len(keys)}
+        if counts["added"]:
+            self.generation += 1
+        triples = np.concatenate([np.asarray(self.triples)[kept], current[is_new]]).astype(np.int32)
+        generations = np.concatenate([np.asarray(self.generations)[kept],
+                                      np.full(counts["added"], self.generation, dtype=np.int32)])
+        self._write(triples, generations)
+        return counts
+
+    def _write(self, triples, generations):
+        # Fichiers de données versionnés, méta écrite en dernier : un export
+        # interrompu laisse l'ancien snapshot lisible
+        os.makedirs(self.dir, exist_ok=True)
+        previous, version = self.version, self.version + 1
+        self._triples = self._generations = None
+        triples.tofile(self._path(f"triples.{version}.bin"))
+        generations.tofile(self._path(f"generations.{version}.bin"))
+        for name, vocab in (("entities", self.entities), ("relations", self.relations)):
+            with open(self._path(f"{name}.{version}.json"), "w") as f:
+                json.dump(vocab, f)
+        self.count, self.version, self.exported_at = len(triples), version, datetime.utcnow().isoformat()
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": version, "count": self.count, "generation": self.generation,
+                       "exported_at": self.exported_at, "entities": self.n_entities,
+                       "relations": self.n_relations}, f)
+        os.replace(tmp, self._meta_path)
+        for name in ("triples", "generations", "entities", "relations"):
+            ext = "json" if name in ("entities", "relations") else "bin"
+            if os.path.exists(self._path(f"{name}.{previous}.{ext}")):
+                os.remove(self._path(f"{name}.{previous}.{ext}"))
+        self._open()
+
+# ======================== 2. EXPORT NEO4J ========================
+def iter_graph_triples(graph, chunk=EXPORT_CHUNK, exclude=ROTATE_EXCLUDE):
+    # Curseur lu en flux : les enregistrements sont regroupés par paquets de `chunk`
+    rows = []
+    for rec in graph.run(Q_EXPORT):
+        if rec["hk"] is None or rec["tk"] is None or rec["rel"] in exclude:
+            continue
+        rows.append((entity_key(rec["hl"], rec["hk"]), rec["rel"], entity_key(rec["tl"], rec["tk"])))
+        if len(rows) >= chunk:
+            yield rows
+            rows = []
+    if rows:
+        yield rows
+
+def export_graph(graph, snapshot=None, chunk=EXPORT_CHUNK):
+    snapshot = TriplesSnapshot() if snapshot is None else snapshot
+    encoded = (snapshot.encode(*zip(*rows)) for rows in iter_graph_triples(graph, chunk))
+    counts = snapshot.update(encoded)
+    print(f"📦 Snapshot triplets : {counts['total']} triplets ({counts['added']} nouveaux, "
+          f"{counts['removed']} retirés), {snapshot.n_entities} entités, {snapshot.n_relations} relations "
+          f"(génération {snapshot.generation})")
+    return counts
+
+# ======================== 3. ÉCHANTILLONNAGE DE NÉGATIFS ========================
+def bernoulli_head_probs(triples, n_relations):
+    # Probabilité de corrompre la tête par relation (tph / (tph + hpt), Wang et al. 2014)
+    t = np.asarray(triples, dtype=np.int64)
+    probs = np.full(n_relations, 0.5)
+    if not len(t):
+        return probs
+    per_rel = np.bincount(t[:, 1], minlength=n_relations).astype(np.float64)
+    heads = np.bincount(np.unique(t[:, 1] * (t[:, 0].max() + 1) + t[:, 0]) // (t[:, 0].max() + 1),
+                        minlength=n_relations)
+    tails = np.bincount(np.unique(t[:, 1] * (t[:, 2].max() + 1) + t[:, 2]) // (t[:, 2].max() + 1),
+                        minlength=n_relations)
+    seen = per_rel > 0
+    tph, hpt = per_rel[seen] / heads[seen], per_rel[seen] / tails[seen]
+    probs[seen] = tph / (tph + hpt)
+    return probs
+
+class NegativeSampler:
+    # Lots (positifs, négatifs, mode) préparés par un pool de threads, rendus dans l'ordre.
+    # Chaque lot a son propre générateur (seed, epoch, lot) : une reprise au lot b
+    # redonne exactement les mêmes lots, quel que soit le nombre de threads.
+    def __init__(self, triples, n_entities, n_relations, batch_size, num_negatives, indices=None,
+                 workers=ROTATE_SAMPLER_WORKERS, seed=0, prefetch=None):
+        self.triples = triples
+        self.indices = np.arange(len(triples)) if indices is None else np.asarray(indices, dtype=np.int64)
+        self.n_entities = n_entities
+        self.batch_size = batch_size
+        self.num_negatives = num_negatives
+        self.workers = max(1, workers)
+        self.seed = seed
+        self.prefetch = prefetch or 2 * self.workers
+        sample = np.asarray(triples)[self.indices] if len(self.indices) < len(triples) else triples
+        self.head_probs = bernoulli_head_probs(sample, n_relations)
+
+    def __len__(self):
+        return -(-len(self.indices) // self.batch_size)
+
+    def _order(self, epoch):
+        return np.random.default_rng((self.seed, epoch)).permutation(self.indices)
+
+    def batch(self, order, epoch, b):
+        rng = np.random.default_rng((self.seed, epoch, b))
+        pos = np.asarray(self.triples[np.sort(order[b * self.batch_size:(b + 1) * self.batch_size])],
+                         dtype=np.int64)
+        head_mode = rng.random(len(pos)) < self.head_probs[pos[:, 1]]
+        neg = rng.integers(0, self.n_entities, size=(len(pos), self.num_negatives), dtype=np.int64)
+        return pos, neg, head_mode
+
+    def epoch(self, epoch, start=0):
+        order = self._order(epoch)
+        n = len(self)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            for b in range(start, min(n, start + self.prefetch)):
+                pending[b] = pool.submit(self.batch, order, epoch, b)
+            for b in range(start, n):
+                nxt = b + self.prefetch
+                if nxt < n:
+                    pending[nxt] = pool.submit(self.batch, order, epoch, nxt)
+                yield (b,) + pending.pop(b).result()
+
+# ======================== 4. MAIN ========================
+if __name__ == "__main__":
+    import argparse
+    from py2neo import Graph
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--snapshot", default=ROTATE_SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+    user = os.getenv("NEO4J_USER", "neo4j")
+    pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+    export_graph(Graph(uri, auth=(user, pwd)), TriplesSnapshot(args.snapshot))
@@ -1 +1,137 @@
-# Placeholder for embedding/predict_rotate.py
+# ======================== PRÉDICTIONS RotatE (NUMPY) ========================
+# Lit les plongements exportés par train_rotate.py (entities.npy / relations.npy)
+# et le vocabulaire du snapshot kg_triples : aucun besoin de torch ni de Neo4j.
+# Par défaut, propose pour chaque host les CVE les plus plausibles qui ne lui
+# sont pas encore liées (IS_VULNERABLE_TO), exportées en CSV.
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+from kg_triples import ROTATE_SNAPSHOT_DIR, TriplesSnapshot
+
+ROTATE_MODEL_DIR = os.getenv("ROTATE_MODEL_DIR", "data/models/rotate")
+PREDICTIONS_PATH = "data/predictions/rotate_predictions.csv"
+# Taille max (éléments) du bloc anchors x candidats x dim calculé d'un coup
+SCORE_BLOCK = 2 ** 24
+
+class RotatEPredictor:
+    def __init__(self, model_dir=ROTATE_MODEL_DIR, snapshot=None):
+        with open(os.path.join(model_dir, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.gamma = self.meta["gamma"]
+        entity = np.load(os.path.join(model_dir, "entities.npy"), mmap_mode="r")
+        self.e_re, self.e_im = np.split(np.asarray(entity), 2, axis=1)
+        phase = np.load(os.path.join(model_dir, "relations.npy"))
+        self.r_re, self.r_im = np.cos(phase), np.sin(phase)
+        self.snapshot = TriplesSnapshot() if snapshot is None else snapshot
+        # Le snapshot peut être plus récent que le modèle : entités sans plongement ignorées
+        self.n_entities = min(len(self.e_re), self.snapshot.n_entities)
+        self._candidates = {}
+
+    # ---------- identifiants ----------
+    def entity_id(self, name):
+        i = self.snapshot.entity_index.get(name)
+        if i is None or i >= self.n_entities:
+            raise KeyError(f"Entité inconnue du modèle : {name}")
+        return i
+
+    def relation_id(self, name):
+        r = self.snapshot.relation_index.get(name)
+        if r is None or r >= len(self.r_re):
+            raise KeyError(f"Relation inconnue du modèle : {name}")
+        return r
+
+    def candidates(self, r, side):
+        # Contrainte de type : entités déjà vues à cette place pour la relation
+        key = (r, side)
+        if key not in self._candidates:
+            t = np.asarray(self.snapshot.triples)
+            col = t[t[:, 1] == r, 0 if side == "head" else 2]
+            self._candidates[key] = np.unique(col[col < self.n_entities])
+        return self._candidates[key]
+
+    def known(self, anchors, r, side):
+        # Triplets déjà présents, exclus des prédictions
+        t = np.asarray(self.snapshot.triples)
+        t = t[t[:, 1] == r]
+        a, b = (t[:, 2], t[:, 0]) if side == "head" else (t[:, 0], t[:, 2])
+        mask = np.isin(a, anchors)
+        return set(zip(a[mask].tolist(), b[mask].tolist()))
+
+    # ---------- scores ----------
+    def _anchor(self, ids, r, side):
+        # h∘r (on cherche la queue) ou t∘r̄ (on cherche la tête)
+        re, im = self.e_re[ids], self.e_im[ids]
+        rr, ri = self.r_re[r], self.r_im[r]
+        if side == "tail":
+            return re * rr - im * ri, re * ri + im * rr
+        return re * rr + im * ri, im * rr - re * ri
+
+    def score_matrix(self, anchors, r, side, candidates):
+        a_re, a_im = self._anchor(anchors, r, side)
+        c_re, c_im = self.e_re[candidates], self.e_im[candidates]
+        out = np.empty((len(anchors), len(candidates)), dtype=np.float32)
+        step = max(1, SCORE_BLOCK // max(1, len(candidates) * a_re.shape[1]))
+        for i in range(0, len(anchors), step):
+            d_re = a_re[i:i + step, None, :] - c_re[None]
+            d_im = a_im[i:i + step, None, :] - c_im[None]
+            out[i:i + step] = self.gamma - np.sqrt(d_re ** 2 + d_im ** 2).sum(-1)
+        return out
+
+    def score(self, head, relation, tail):
+        h, r, t = self.entity_id(head), self.relation_id(relation), self.entity_id(tail)
+        return float(self.score_matrix(np.array([h]), r, "tail", np.array([t]))[0, 0])
+
+    def predict(self, anchors, relation, side="tail", k=10, filter_known=True):
+        # [(ancre, candidat, score)] : top-k par ancre, triplets connus exclus
+        r = self.relation_id(relation)
+        ids = np.array([self.entity_id(a) for a in anchors], dtype=np.int64)
+        cands = self.candidates(r, side)
+        if not len(ids) or not len(cands):
+            return []
+        scores = self.score_matrix(ids, r, side, cands)
+        if filter_known:
+            pos = {c: j for j, c in enumerate(cands.tolist())}
+            for a, c in self.known(ids, r, side):
+                if c in pos:
+                    scores[np.flatnonzero(ids == a), pos[c]] = -np.inf
+        k = min(k, len(cands))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for i, a in enumerate(ids.tolist()):
+            row = top[i][np.argsort(-scores[i, top[i]])]
+            results.extend((self.snapshot.entities[a], self.snapshot.entities[cands[j]], float(scores[i, j]))
+                           for j in row if np.isfinite(scores[i, j]))
+        return results
+
+# ======================== MAIN ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", default=ROTATE_MODEL_DIR)
+    parser.add_argument("--snapshot", default=ROTATE_SNAPSHOT_DIR)
+    parser.add_argument("--relation", default="IS_VULNERABLE_TO")
+    parser.add_argument("--head", help="Entité « Label:clé » dont on cherche les queues")
+    parser.add_argument("--tail", help="Entité « Label:clé » dont on cherche les têtes")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--out", default=PREDICTIONS_PATH)
+    args = parser.parse_args()
+
+    predictor = RotatEPredictor(args.model_dir, TriplesSnapshot(args.snapshot))
+    if args.head or args.tail:
+        side = "tail" if args.head else "head"
+        for a, c, s in predictor.predict([args.head or args.tail], args.relation, side, k=args.top):
+            print(f"   • {c:<40} score {s:.3f}")
+    else:
+        # Toutes les têtes connues de la relation (ex. tous les hosts pour IS_VULNERABLE_TO)
+        r = predictor.relation_id(args.relation)
+        heads = [predictor.snapshot.entities[i] for i in predictor.candidates(r, "head")]
+        rows = predictor.predict(heads, args.relation, "tail", k=args.top)
+        os.makedirs(os.path.dirname(args.out), exist_ok=True)
+        with open(args.out, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["head", "relation", "tail", "score"])
+            writer.writerows((h, args.relation, t, f"{s:.4f}") for h, t, s in rows)
+        print(f"🔮 {len(rows)} prédictions {args.relation} pour {len(heads)} entités → {args.out}")
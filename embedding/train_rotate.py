@@ -1 +1,264 @@
-# Placeholder for embedding/train_rotate.py
+# ======================== ENTRAÎNEMENT RotatE (CPU) ========================
+# RotatE (Sun et al. 2019) sur le snapshot de triplets de kg_triples.py :
+#   - plongements « sparse » + SparseAdam : un lot ne met à jour que ses lignes ;
+#   - négatifs préparés par un pool de threads pendant le calcul, loss
+#     auto-adversariale ; une seule gather (B, K, 2d) par lot grâce à
+#     |h∘r - t| = |h - t∘r̄| (la rotation est unitaire) ;
+#   - checkpoint atomique régulier : un run interrompu (ou arrêté par --time-budget)
+#     reprend au lot où il s'était arrêté, sur les mêmes triplets et le même
+#     vocabulaire même si le snapshot a grandi entre-temps ;
+#   - quand le snapshot a de nouveaux triplets, le modèle terminé est agrandi
+#     (nouvelles entités / relations) et affiné sur ces triplets, mêlés à un
+#     échantillon des anciens, au lieu d'être réentraîné depuis zéro.
+# Les plongements finaux sont exportés en .npy pour predict_rotate.py (numpy seul).
+import argparse
+import json
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+from kg_triples import ROTATE_SAMPLER_WORKERS, ROTATE_SNAPSHOT_DIR, NegativeSampler, TriplesSnapshot, export_graph
+
+ROTATE_MODEL_DIR = os.getenv("ROTATE_MODEL_DIR", "data/models/rotate")
+ROTATE_THREADS = int(os.getenv("ROTATE_THREADS", str(os.cpu_count() or 1)))
+ROTATE_CHECKPOINT_EVERY = int(os.getenv("ROTATE_CHECKPOINT_EVERY", "300"))
+
+CONFIG = {
+    "dim": 200,
+    "gamma": 12.0,
+    "epsilon": 2.0,
+    "adversarial_temperature": 1.0,
+    "batch_size": 1024,
+    "num_negatives": 128,
+    "lr": 1e-3,
+    "epochs": 50,
+    "finetune_epochs": 5,
+    # Anciens triplets rejoués par triplet nouveau pendant l'affinage (limite l'oubli)
+    "replay_ratio": 1.0,
+    "seed": 42,
+}
+
+# ======================== 1. MODÈLE ========================
+class RotatE(nn.Module):
+    def __init__(self, n_entities, n_relations, dim, gamma, epsilon=2.0):
+        super().__init__()
+        self.dim = dim
+        self.gamma = gamma
+        self.embedding_range = (gamma + epsilon) / dim
+        self.entity = nn.Embedding(n_entities, 2 * dim, sparse=True)
+        self.relation = nn.Embedding(n_relations, dim, sparse=True)
+        nn.init.uniform_(self.entity.weight, -self.embedding_range, self.embedding_range)
+        nn.init.uniform_(self.relation.weight, -self.embedding_range, self.embedding_range)
+
+    def phase(self, r):
+        return self.relation(r) * (math.pi / self.embedding_range)
+
+    def forward(self, pos, neg, head_mode):
+        # pos (B, 3), neg (B, K) : entités candidates remplaçant la tête (head_mode) ou la queue
+        h_re, h_im = self.entity(pos[:, 0]).chunk(2, dim=-1)
+        t_re, t_im = self.entity(pos[:, 2]).chunk(2, dim=-1)
+        phase = self.phase(pos[:, 1])
+        r_re, r_im = torch.cos(phase), torch.sin(phase)
+
+        # h∘r (mode queue) et t∘r̄ (mode tête)
+        hr_re, hr_im = h_re * r_re - h_im * r_im, h_re * r_im + h_im * r_re
+        tr_re, tr_im = t_re * r_re + t_im * r_im, t_im * r_re - t_re * r_im
+        pos_dist = torch.sqrt((hr_re - t_re) ** 2 + (hr_im - t_im) ** 2 + 1e-12).sum(-1)
+
+        mode = head_mode.unsqueeze(-1)
+        a_re, a_im = torch.where(mode, tr_re, hr_re), torch.where(mode, tr_im, hr_im)
+        c_re, c_im = self.entity(neg).chunk(2, dim=-1)
+        neg_dist = torch.sqrt((a_re.unsqueeze(1) - c_re) ** 2 + (a_im.unsqueeze(1) - c_im) ** 2 + 1e-12).sum(-1)
+        return self.gamma - pos_dist, self.gamma - neg_dist
+
+    def grow(self, n_entities, n_relations):
+        # Nouvelles lignes initialisées comme à la création, anciennes conservées
+        for name, n in (("entity", n_entities), ("relation", n_relations)):
+            old = getattr(self, name)
+            if n <= old.num_embeddings:
+                continue
+            emb = nn.Embedding(n, old.embedding_dim, sparse=True)
+            nn.init.uniform_(emb.weight, -self.embedding_range, self.embedding_range)
+            with torch.no_grad():
+                emb.weight[:old.num_embeddings] = old.weight
+            setattr(self, name, emb)
+
+def adversarial_loss(pos_score, neg_score, temperature):
+    # Négatifs pondérés par leur propre score (sans gradient sur les poids)
+    weights = F.softmax(neg_score * temperature, dim=1).detach()
+    pos_loss = -F.logsigmoid(pos_score)
+    neg_loss = -(weights * F.logsigmoid(-neg_score)).sum(dim=1)
+    return ((pos_loss + neg_loss) / 2).mean()
+
+# ======================== 2. CHECKPOINTS ========================
+def checkpoint_path(model_dir):
+    return os.path.join(model_dir, "checkpoint.pt")
+
+def save_checkpoint(model_dir, model, optimizer, state):
+    os.makedirs(model_dir, exist_ok=True)
+    tmp = checkpoint_path(model_dir) + ".tmp"
+    torch.save({"model": model.state_dict(), "optimizer": optimizer.state_dict(),
+                "n_entities": model.entity.num_embeddings, "n_relations": model.relation.num_embeddings,
+                **state}, tmp)
+    os.replace(tmp, checkpoint_path(model_dir))
+
+def load_checkpoint(model_dir):
+    path = checkpoint_path(model_dir)
+    return torch.load(path, map_location="cpu") if os.path.exists(path) else None
+
+def export_embeddings(model_dir, model, state):
+    # Plongements lus par predict_rotate.py sans torch
+    with torch.no_grad():
+        np.save(os.path.join(model_dir, "entities.npy"), model.entity.weight.detach().numpy().astype(np.float32))
+        np.save(os.path.join(model_dir, "relations.npy"), model.phase(
+            torch.arange(model.relation.num_embeddings)).detach().numpy().astype(np.float32))
+    tmp = os.path.join(model_dir, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump({"dim": model.dim, "gamma": model.gamma, "generation": state["generation"],
+                   "n_entities": model.entity.num_embeddings, "n_relations": model.relation.num_embeddings,
+                   "trained_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+    os.replace(tmp, os.path.join(model_dir, "meta.json"))
+
+# ======================== 3. PLAN D'ENTRAÎNEMENT ========================
+def plan(snapshot, ckpt, config, fresh=False):
+    # Complet (pas de modèle), reprise (run inachevé) ou affinage (nouveaux triplets)
+    if ckpt is None or fresh:
+        return {"phase": "full", "generation": snapshot.generation, "base_generation": -1,
+                "epoch": 0, "batch": 0, "epochs": config["epochs"], "done": False, "n_train": None}
+    state = {k: ckpt[k] for k in ("phase", "generation", "base_generation", "epoch", "batch", "epochs", "done")}
+    state["n_train"] = ckpt.get("n_train")
+    if not state["done"] or snapshot.generation <= state["generation"]:
+        return state
+    return {"phase": "finetune", "generation": snapshot.generation, "base_generation": state["generation"],
+            "epoch": 0, "batch": 0, "epochs": config["finetune_epochs"], "done": False, "n_train": None}
+
+def training_indices(snapshot, state, config):
+    # Triplets de la phase : ceux des générations <= state["generation"], même si le
+    # snapshot a reçu un export depuis (ils seront vus par l'affinage suivant)
+    generations = np.asarray(snapshot.generations)
+    current = generations <= state["generation"]
+    if state["phase"] == "full":
+        return np.flatnonzero(current)
+    new = np.flatnonzero(current & (generations > state["base_generation"]))
+    old = np.flatnonzero(generations <= state["base_generation"])
+    # Échantillon de rejeu tiré une fois par génération : identique à la reprise
+    rng = np.random.default_rng((config["seed"], state["generation"]))
+    n_replay = min(len(old), int(len(new) * config["replay_ratio"]))
+    return np.concatenate([new, rng.choice(old, size=n_replay, replace=False)])
+
+# ======================== 4. ENTRAÎNEMENT ========================
+def train(snapshot_dir=ROTATE_SNAPSHOT_DIR, model_dir=ROTATE_MODEL_DIR, config=None, fresh=False,
+          time_budget=None, threads=ROTATE_THREADS, workers=ROTATE_SAMPLER_WORKERS,
+          checkpoint_every=ROTATE_CHECKPOINT_EVERY):
+    overrides = config or {}
+    config = {**CONFIG, **overrides}
+    torch.set_num_threads(max(1, threads))
+    torch.manual_seed(config["seed"])
+    snapshot = TriplesSnapshot(snapshot_dir)
+    if not len(snapshot):
+        raise RuntimeError(f"🚫 Snapshot vide : lancez l'export ({snapshot_dir})")
+
+    ckpt = None if fresh else load_checkpoint(model_dir)
+    if ckpt is not None:
+        # Hyperparamètres du modèle existant ; seules les durées peuvent changer
+        config = {**CONFIG, **ckpt["config"],
+                  **{k: v for k, v in overrides.items() if k in ("epochs", "finetune_epochs")}}
+    state = plan(snapshot, ckpt, config, fresh)
+    if state["done"]:
+        print(f"✅ Modèle RotatE à jour (génération {state['generation']}), rien à entraîner.")
+        return state
+
+    # Reprise d'une phase inachevée : vocabulaire du checkpoint (mêmes négatifs, pas d'agrandissement)
+    resume = ckpt is not None and state["phase"] == ckpt["phase"] and state["generation"] == ckpt["generation"]
+    n_entities = ckpt["n_entities"] if resume else snapshot.n_entities
+    n_relations = ckpt["n_relations"] if resume else snapshot.n_relations
+    model = RotatE(ckpt["n_entities"] if ckpt else n_entities, ckpt["n_relations"] if ckpt else n_relations,
+                   config["dim"], config["gamma"], config["epsilon"])
+    if ckpt is not None:
+        model.load_state_dict(ckpt["model"])
+    grown = model.entity.num_embeddings < n_entities or model.relation.num_embeddings < n_relations
+    model.grow(n_entities, n_relations)
+    optimizer = torch.optim.SparseAdam(list(model.parameters()), lr=config["lr"])
+    # L'état Adam n'est repris que si les matrices n'ont pas changé de taille
+    if resume and not grown:
+        optimizer.load_state_dict(ckpt["optimizer"])
+
+    indices = training_indices(snapshot, state, config)
+    if state["n_train"] is not None and state["n_train"] != len(indices):
+        # Des triplets de la phase ont été retirés du snapshot : l'ordre du lot ne correspond plus
+        print(f"⚠️ {state['n_train']} triplets au départ de la phase, {len(indices)} aujourd'hui : "
+              f"l'époque {state['epoch'] + 1} reprend au premier lot")
+        state["batch"] = 0
+    state["n_train"] = len(indices)
+    sampler = NegativeSampler(snapshot.triples, n_entities, n_relations,
+                              config["batch_size"], config["num_negatives"], indices=indices,
+                              workers=workers, seed=config["seed"] + state["generation"])
+    print(f"🧠 RotatE [{state['phase']}] : {state['n_train']} triplets, {n_entities} entités, "
+          f"{n_relations} relations, époque {state['epoch'] + 1}/{state['epochs']} "
+          f"(lot {state['batch']}/{len(sampler)}), {threads} threads torch, {workers} threads d'échantillonnage")
+
+    t0 = last_ckpt = time.time()
+    save = lambda: save_checkpoint(model_dir, model, optimizer, {**state, "config": config})
+    model.train()
+    while state["epoch"] < state["epochs"]:
+        total, seen = 0.0, 0
+        for b, pos, neg, head_mode in sampler.epoch(state["epoch"], start=state["batch"]):
+            pos_score, neg_score = model(torch.from_numpy(pos), torch.from_numpy(neg), torch.from_numpy(head_mode))
+            loss = adversarial_loss(pos_score, neg_score, config["adversarial_temperature"])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total, seen = total + loss.item() * len(pos), seen + len(pos)
+            state["batch"] = b + 1
+
+            now = time.time()
+            if now - last_ckpt > checkpoint_every:
+                save()
+                last_ckpt = now
+            if time_budget and now - t0 > time_budget:
+                save()
+                print(f"⏸️ Budget de {time_budget}s atteint : checkpoint à l'époque {state['epoch'] + 1}, "
+                      f"lot {state['batch']}/{len(sampler)} (reprise au prochain lancement)")
+                return state
+        state["epoch"], state["batch"] = state["epoch"] + 1, 0
+        print(f"   • Époque {state['epoch']}/{state['epochs']} : loss {total / max(seen, 1):.4f} "
+              f"({time.time() - t0:.0f}s)")
+        save()
+        last_ckpt = time.time()
+
+    state["done"] = True
+    save()
+    export_embeddings(model_dir, model, state)
+    print(f"✅ RotatE entraîné ({state['phase']}, génération {state['generation']}) en {time.time() - t0:.0f}s "
+          f"→ {model_dir}")
+    return state
+
+# ======================== 5. MAIN ========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--export", action="store_true", help="Exporte d'abord le graphe fusionné depuis Neo4j")
+    parser.add_argument("--snapshot", default=ROTATE_SNAPSHOT_DIR)
+    parser.add_argument("--model-dir", default=ROTATE_MODEL_DIR)
+    parser.add_argument("--fresh", action="store_true", help="Ignore le checkpoint et réentraîne depuis zéro")
+    parser.add_argument("--epochs", type=int, default=None)
+    parser.add_argument("--finetune-epochs", type=int, default=None)
+    parser.add_argument("--time-budget", type=float, default=None, help="Secondes max ; reprise au lancement suivant")
+    parser.add_argument("--threads", type=int, default=ROTATE_THREADS)
+    parser.add_argument("--workers", type=int, default=ROTATE_SAMPLER_WORKERS, help="Threads d'échantillonnage")
+    args = parser.parse_args()
+
+    if args.export:
+        from py2neo import Graph
+        uri = os.getenv("NEO4J_URI", "neo4j+s://8d5fbce8.databases.neo4j.io")
+        user = os.getenv("NEO4J_USER", "neo4j")
+        pwd = os.getenv("NEO4J_PASSWORD", "VpzGP3RDVB7AtQ1vfrQljYUgxw4VBzy0tUItWeRB9CM")
+        export_graph(Graph(uri, auth=(user, pwd)), TriplesSnapshot(args.snapshot))
+
+    overrides = {k: v for k, v in (("epochs", args.epochs), ("finetune_epochs", args.finetune_epochs)) if v is not None}
+    train(args.snapshot, args.model_dir, config=overrides, fresh=args.fresh, time_budget=args.time_budget,
+          threads=args.threads, workers=args.workers)
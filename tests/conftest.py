@@ -0,0 +1,8 @@
+# Les modules des pipelines s'importent par leur nom (exécutés comme scripts) :
+# cskg/ et digital_twin/ sont ajoutés au chemin d'import des tests.
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+for folder in ("cskg", "digital_twin", "embedding"):
+    sys.path.insert(0, str(ROOT / folder))
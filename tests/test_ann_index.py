@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ann_index import DEFAULT_NPROBE, IVFIndex, load_or_create
+from embed_search import normalize_rows
+
+def clustered(rng, n, dim=32, clusters=40):
+    # Embeddings regroupés par thème, comme les descriptions CVE
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + 0.35 * rng.normal(size=(n, dim))).astype(np.float32)
+
+def brute_force(keys, vectors, queries, k):
+    sims = normalize_rows(queries) @ normalize_rows(vectors).T
+    top = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    return [[keys[i] for i in row] for row in top], np.take_along_axis(sims, top, axis=1)
+
+@pytest.fixture
+def data():
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, 2000)
+    keys = [f"CVE-2024-{i:05d}" for i in range(len(vectors))]
+    queries = vectors[rng.choice(len(vectors), 100, replace=False)] + 0.1 * rng.normal(size=(100, 32))
+    return keys, vectors, queries.astype(np.float32)
+
+def build(keys, vectors):
+    index = IVFIndex(vectors.shape[1])
+    # Ajouts par lots : l'index s'entraîne puis se réentraîne en grossissant
+    for i in range(0, len(keys), 500):
+        index.add(keys[i:i + 500], vectors[i:i + 500])
+    return index
+
+def test_probing_every_list_equals_brute_force(data):
+    keys, vectors, queries = data
+    index = build(keys, vectors)
+    got_keys, got_scores = index.search(queries, k=10, nprobe=index.nlist)
+    exp_keys, exp_scores = brute_force(keys, vectors, queries, 10)
+    assert got_keys == exp_keys
+    np.testing.assert_allclose(np.array(got_scores), exp_scores, rtol=1e-5, atol=1e-6)
+
+def test_recall_at_default_nprobe(data):
+    keys, vectors, queries = data
+    index = build(keys, vectors)
+    assert index.nlist > DEFAULT_NPROBE
+    got_keys, _ = index.search(queries, k=10)
+    exp_keys, _ = brute_force(keys, vectors, queries, 10)
+    recall = np.mean([len(set(g) & set(e)) / 10 for g, e in zip(got_keys, exp_keys)])
+    assert recall >= 0.9
+
+def test_save_load_round_trip(data, tmp_path):
+    keys, vectors, queries = data
+    index = build(keys, vectors)
+    path = str(tmp_path / "ivf.npz")
+    index.save(path)
+    loaded = load_or_create(vectors.shape[1], path=path)
+    assert loaded.keys == index.keys and loaded.nlist == index.nlist
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    assert loaded.search(queries, k=10) == index.search(queries, k=10)
+    # Les ajouts après rechargement se comportent comme sur l'index d'origine
+    extra = clustered(np.random.default_rng(1), 50)
+    extra_keys = [f"CVE-2025-{i:05d}" for i in range(50)]
+    assert loaded.add(extra_keys, extra) == index.add(extra_keys, extra) == 50
+    assert loaded.search(queries, k=10) == index.search(queries, k=10)
+
+def test_add_replaces_vector_of_existing_key(data):
+    keys, vectors, _ = data
+    index = build(keys, vectors)
+    assert index.add([keys[0]], vectors[1:2]) == 0
+    assert len(index) == len(keys)
+    top_keys, top_scores = index.search(vectors[1], k=2, nprobe=index.nlist)
+    assert set(top_keys[0]) == {keys[0], keys[1]}
+    np.testing.assert_allclose(top_scores[0], [1.0, 1.0], rtol=1e-5)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from embed_search import normalize_rows, topk_cosine
+
+def brute_force(queries, base, k):
+    # Boucle d'origine : score décroissant, premier indice en cas d'égalité
+    sims = queries @ base.T
+    order = np.lexsort((np.broadcast_to(np.arange(len(base)), sims.shape), -sims), axis=1)[:, :k]
+    return order, np.take_along_axis(sims, order, axis=1)
+
+@pytest.mark.parametrize("block_size", [3, 7, 4096])
+@pytest.mark.parametrize("k", [1, 3, 10])
+def test_matches_brute_force_on_random_vectors(block_size, k):
+    rng = np.random.default_rng(k * 100 + block_size)
+    queries, base = rng.normal(size=(40, 16)), rng.normal(size=(50, 16))
+    idx, sim = topk_cosine(queries, base, k=k, block_size=block_size)
+    exp_idx, exp_sim = brute_force(normalize_rows(queries), normalize_rows(base), k)
+    np.testing.assert_array_equal(idx, exp_idx)
+    np.testing.assert_allclose(sim, exp_sim, rtol=1e-5)
+    np.testing.assert_array_equal(idx[:, 0], np.argmax(normalize_rows(queries) @ normalize_rows(base).T, axis=1))
+
+@pytest.mark.parametrize("block_size", [2, 5, 4096])
+@pytest.mark.parametrize("k", [1, 2, 4])
+def test_ties_keep_the_lowest_index(block_size, k):
+    # Petits entiers : produits scalaires exacts, beaucoup d'ex-aequo (dont des doublons)
+    rng = np.random.default_rng(block_size * 10 + k)
+    base = rng.integers(-1, 2, size=(30, 4)).astype(np.float32)
+    base[20:] = base[:10]
+    queries = rng.integers(-1, 2, size=(25, 4)).astype(np.float32)
+    idx, sim = topk_cosine(queries, base, k=k, block_size=block_size, normalized=True)
+    exp_idx, exp_sim = brute_force(queries, base, k)
+    np.testing.assert_array_equal(idx, exp_idx)
+    np.testing.assert_array_equal(sim, exp_sim)
+    np.testing.assert_array_equal(idx[:, 0], np.argmax(queries @ base.T, axis=1))
+
+def test_k_larger_than_base():
+    rng = np.random.default_rng(0)
+    queries, base = rng.normal(size=(6, 8)), rng.normal(size=(4, 8))
+    idx, sim = topk_cosine(queries, base, k=10, block_size=3)
+    assert idx.shape == sim.shape == (6, 4)
+    exp_idx, exp_sim = brute_force(normalize_rows(queries), normalize_rows(base), 4)
+    np.testing.assert_array_equal(idx, exp_idx)
+    np.testing.assert_allclose(sim, exp_sim, rtol=1e-5)
+
+def test_empty_inputs():
+    idx, sim = topk_cosine(np.ones((3, 4)), np.empty((0, 4)), k=5)
+    assert idx.shape == sim.shape == (3, 0)
+    idx, sim = topk_cosine(np.empty((0, 4)), np.ones((3, 4)), k=2)
+    assert idx.shape == sim.shape == (0, 2)
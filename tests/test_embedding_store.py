@@ -0,0 +1,72 @@
+import hashlib
+import os
+
+import numpy as np
+
+from embedding_store import EmbeddingStore, cve_text
+
+DIM = 8
+
+class FakeModel:
+    # SentenceTransformer déterministe : vecteur dérivé du texte, appels comptés
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=None, convert_to_numpy=True, show_progress_bar=False):
+        self.encoded.extend(texts)
+        seeds = [int(hashlib.sha256(t.encode()).hexdigest()[:8], 16) for t in texts]
+        return np.stack([np.random.default_rng(seed).normal(size=DIM) for seed in seeds])
+
+class NoModel:
+    def encode(self, texts, **kwargs):
+        raise AssertionError(f"ré-encodage inattendu de {len(texts)} texte(s)")
+
+def open_store(root, model_name="fake-model", model=None, **kwargs):
+    store = EmbeddingStore(model_name=model_name, root=str(root), **kwargs)
+    store._model = model if model is not None else FakeModel()
+    return store
+
+def texts(start, stop):
+    return [cve_text(f"CVE-2024-{i:05d}", f"description {i}") for i in range(start, stop)]
+
+def test_reopened_store_serves_cached_rows(tmp_path):
+    store = open_store(tmp_path)
+    first = store.get(texts(0, 50) + texts(0, 5), show_progress_bar=False)
+    assert len(store._model.encoded) == 50  # doublons encodés une seule fois
+    np.testing.assert_array_equal(first[50:], first[:5])
+
+    reopened = open_store(tmp_path, model=NoModel())
+    assert len(reopened) == 50 and texts(0, 1)[0] in reopened
+    np.testing.assert_array_equal(reopened.get(texts(0, 50) + texts(0, 5), show_progress_bar=False), first)
+
+def test_append_after_reopen_keeps_existing_rows(tmp_path):
+    store = open_store(tmp_path)
+    before = store.get(texts(0, 1000), show_progress_bar=False)
+
+    reopened = open_store(tmp_path)
+    # Dépasse la capacité initiale (1024) : le fichier mappé grossit
+    after = reopened.get(texts(900, 1500), show_progress_bar=False)
+    assert reopened._model.encoded == texts(1000, 1500)
+    assert len(reopened) == 1500 and reopened.capacity >= 1500
+
+    again = open_store(tmp_path, model=NoModel())
+    np.testing.assert_array_equal(again.get(texts(0, 1000), show_progress_bar=False), before)
+    np.testing.assert_array_equal(again.get(texts(900, 1500), show_progress_bar=False), after)
+
+def test_models_are_stored_apart(tmp_path):
+    mpnet = open_store(tmp_path, model_name="sentence-transformers/all-mpnet-base-v2")
+    mpnet.get(texts(0, 10), show_progress_bar=False)
+    minilm = open_store(tmp_path, model_name="all-MiniLM-L6-v2")
+    assert len(minilm) == 0 and minilm.dir != mpnet.dir
+    minilm.get(texts(0, 10), show_progress_bar=False)
+    assert minilm._model.encoded == texts(0, 10)
+    assert sorted(os.listdir(tmp_path)) == ["all-MiniLM-L6-v2", "sentence-transformers_all-mpnet-base-v2"]
+
+def test_stored_dtype_wins_on_reopen(tmp_path):
+    store = open_store(tmp_path, dtype="float16")
+    rows = store.get(texts(0, 10), show_progress_bar=False)
+    reopened = open_store(tmp_path, model=NoModel(), dtype="float32")
+    assert reopened.dtype == np.float16
+    got = reopened.get(texts(0, 10), show_progress_bar=False)
+    assert got.dtype == np.float32
+    np.testing.assert_array_equal(got, rows)
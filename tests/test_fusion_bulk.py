@@ -0,0 +1,57 @@
+import pytest
+
+from fusion_bulk import FusionCheckpoint, Q_PAIRS, fuse_pairs, iter_pair_batches
+
+PAIRS = [{"c1": f"CVE-2024-{i:04d}", "c2": f"N-{i:04d}"} for i in range(7)]
+
+class PairGraph:
+    # Rejoue Q_PAIRS (reprise après $after1 / $after2) et enregistre les lots fusionnés
+    class Result:
+        def data(self):
+            return [{"fused": 1, "edges": 0, "pruned": 0}]
+
+    class Tx:
+        def __init__(self, graph):
+            self.graph = graph
+
+        def run(self, query, pairs, **params):
+            if self.graph.fail_on in [p["c1"] for p in pairs]:
+                raise ConnectionError("transaction en échec")
+            self.graph.fused.extend(pairs)
+            return PairGraph.Result()
+
+        def commit(self):
+            pass
+
+    def __init__(self, fail_on=None):
+        self.reads = 0
+        self.fused = []
+        self.fail_on = fail_on
+
+    def run(self, query, **params):
+        assert query == Q_PAIRS
+        self.reads += 1
+        after = (params["after1"], params["after2"])
+        return iter([p for p in PAIRS if after[0] is None or (p["c1"], p["c2"]) > after])
+
+    def begin(self):
+        return self.Tx(self)
+
+def test_pairs_are_read_with_one_query():
+    graph = PairGraph()
+    batches = list(iter_pair_batches(graph, batch_size=3))
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert [p for b in batches for p in b] == PAIRS
+    assert graph.reads == 1
+
+def test_fusion_resumes_after_the_last_committed_batch(tmp_path):
+    path = tmp_path / "checkpoint.json"
+    graph = PairGraph(fail_on="CVE-2024-0004")
+    with pytest.raises(ConnectionError):
+        fuse_pairs(graph, batch_size=2, checkpoint=FusionCheckpoint(path))
+    assert FusionCheckpoint(path).last == ("CVE-2024-0003", "N-0003")
+    graph.fail_on = None
+    counts = fuse_pairs(graph, batch_size=2, checkpoint=FusionCheckpoint(path))
+    assert graph.fused == PAIRS
+    assert counts["pairs"] == len(PAIRS)
+    assert not path.exists()
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+from fuzzywuzzy import fuzz
+
+from fuzzy_index import FuzzyIndex, best_matches
+
+def brute_force(names, query, threshold):
+    # Boucle d'origine : premier meilleur score dans l'ordre KG1
+    best_score, best_name = 0, None
+    for name in names:
+        score = fuzz.ratio(name, query)
+        if score > best_score:
+            best_score, best_name = score, name
+    return (best_name, best_score) if best_score >= threshold else None
+
+def random_cves(rng, n):
+    return [f"CVE-{rng.randint(1999, 2025)}-{rng.randint(1, 99999):0{rng.choice([4, 5])}d}" for _ in range(n)]
+
+def mutate(rng, name):
+    chars = list(name)
+    for _ in range(rng.randint(1, 2)):
+        i = rng.randrange(len(chars))
+        op = rng.choice("sid")
+        if op == "s":
+            chars[i] = rng.choice("0123456789")
+        elif op == "i":
+            chars.insert(i, rng.choice("0123456789"))
+        elif len(chars) > 1:
+            del chars[i]
+    return "".join(chars)
+
+@pytest.mark.parametrize("threshold", [80, 90, 95])
+def test_index_finds_every_match_above_threshold(threshold):
+    rng = random.Random(threshold)
+    names = random_cves(rng, 400)
+    queries = [mutate(rng, rng.choice(names)) for _ in range(300)] + random_cves(rng, 100)
+    index = FuzzyIndex(names, threshold)
+    for query in queries:
+        expected = brute_force(names, query, threshold)
+        name, score = index.best_match(query)
+        if expected is None:
+            assert name is None or score < threshold
+        else:
+            assert (name, score) == expected
+
+def test_short_names_fall_back_to_full_block():
+    names = ["A1", "B2", "AB"]
+    index = FuzzyIndex(names, 50)
+    assert index.best_match("A2") == brute_force(names, "A2", 50)
+
+def test_best_matches_keeps_query_order():
+    names = ["CVE-2021-44228", "CVE-2017-0144"]
+    out = best_matches(names, ["CVE-2017-0145", "CVE-2021-44228", "XXX"], threshold=90, workers=1)
+    assert out[0][0] == "CVE-2017-0144"
+    assert out[1] == ("CVE-2021-44228", 100)
+    assert out[2][1] < 90
+
+def test_saved_index_grows_like_a_fresh_one(tmp_path):
+    rng = random.Random(7)
+    names = random_cves(rng, 300)
+    path = str(tmp_path / "kg1_fuzzy.npz")
+    FuzzyIndex(names[:200], 90).save(path)
+    index = FuzzyIndex.load(path, threshold=90)
+    assert index.add(names[200:] + names[:10]) == len(set(names[200:]) - set(names[:200]))
+    fresh = FuzzyIndex(names, 90)
+    assert index.names == fresh.names
+    for query in [mutate(rng, rng.choice(names)) for _ in range(200)]:
+        assert index.best_match(query) == fresh.best_match(query)
+    assert names[250] in index and "CVE-0000-0000" not in index
+
+def test_raw_names_survive_save_and_add(tmp_path):
+    path = str(tmp_path / "kg1_fuzzy.npz")
+    FuzzyIndex(["CVE-2021-44228"], 90, raw={"CVE-2021-44228": " cve-2021-44228"}).save(path)
+    index = FuzzyIndex.load(path, threshold=90)
+    assert index.raw == {"CVE-2021-44228": " cve-2021-44228"}
+    # Nom en base mis à jour pour une CVE déjà indexée, ajouté pour une nouvelle
+    assert index.add(["CVE-2021-44228", "CVE-2017-0144"],
+                     raw={"CVE-2021-44228": "CVE-2021-44228", "CVE-2017-0144": "cve-2017-0144"}) == 1
+    index.save(path)
+    reloaded = FuzzyIndex.load(path, threshold=90)
+    assert reloaded.raw == {"CVE-2021-44228": "CVE-2021-44228", "CVE-2017-0144": "cve-2017-0144"}
+    assert "CVE-2022-0001" not in reloaded.raw
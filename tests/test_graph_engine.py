@@ -0,0 +1,235 @@
+from graph_engine import GraphEngine
+
+def fusion_graph():
+    g = GraphEngine()
+    c1 = g.add_node(("CVE",), {"name": "CVE-2024-0001", "source": "NVD", "cvss_score": 9.8})
+    c2 = g.add_node(("CVE",), {"name": "CVE-2024-0001-N", "source": "NESSUS"})
+    h = g.add_node(("Host",), {"name": "h1"})
+    w = g.add_node(("CWE",), {"name": "CWE-79"})
+    g.table("SAME_AS").add(c1, c2, {"method": "exact", "score": 100.0})
+    g.table("IS_VULNERABLE_TO").add(h, c2, {"last_seen": "t1", "changed_at": "t1"})
+    g.table("ASSOCIATED_WITH").add(c1, w)
+    return g, c1, c2, h, w
+
+def unified_edges(g, rel_type):
+    u = g.find("CVE_UNIFIED", "CVE-2024-0001")[0]
+    t = g.table(rel_type)
+    return u, [t.properties(i) for i in t.in_edges(u) + t.out_edges(u)]
+
+def test_fusion_is_idempotent():
+    g, *_ = fusion_graph()
+    assert g.fuse_pairs()["fused"] == 1
+    assert g.fuse_pairs()["fused"] == 0
+    _, edges = unified_edges(g, "IS_VULNERABLE_TO")
+    assert edges == [{"last_seen": "t1", "changed_at": "t1"}]
+
+def test_resolved_finding_changes_signature_and_reaches_unified():
+    g, c1, c2, h, _ = fusion_graph()
+    g.fuse_pairs()
+    t = g.table("IS_VULNERABLE_TO")
+    i = t.between(h, c2)[0]
+    t.set(i, "resolved_at", "t2")
+    t.set(i, "changed_at", "t2")
+    assert g.fuse_pairs()["fused"] == 1
+    _, edges = unified_edges(g, "IS_VULNERABLE_TO")
+    assert edges == [{"last_seen": "t1", "changed_at": "t2", "resolved_at": "t2"}]
+    # Réouverture : resolved_at effacé à la source, effacé sur u
+    t.set(i, "resolved_at", None)
+    t.set(i, "changed_at", "t3")
+    assert g.fuse_pairs()["fused"] == 1
+    _, edges = unified_edges(g, "IS_VULNERABLE_TO")
+    assert edges == [{"last_seen": "t1", "changed_at": "t3"}]
+
+def test_edges_pruned_from_sources_are_removed_from_unified():
+    g, c1, _, _, w = fusion_graph()
+    g.fuse_pairs()
+    t = g.table("ASSOCIATED_WITH")
+    t.delete(t.between(c1, w)[0])
+    g.set(c1, "updated_at", "t2")  # écrit par le prune delta de nvd_bulk
+    counts = g.fuse_pairs()
+    assert counts["pruned"] == 1
+    _, edges = unified_edges(g, "ASSOCIATED_WITH")
+    assert edges == []
+    _, edges = unified_edges(g, "IS_VULNERABLE_TO")
+    assert len(edges) == 1
+
+def impacts_graph(seed):
+    # Petit graphe aléatoire Host / Plugin / CVE (NVD + Nessus) / Service
+    import random
+    rng = random.Random(seed)
+    g = GraphEngine()
+    hosts = [g.add_node(("Host",), {"name": f"h{k}"}) for k in range(4)]
+    plugins = [g.add_node(("Plugin",), {"plugin_id": str(k)}) for k in range(5)]
+    nessus = [g.add_node(("CVE",), {"name": f"N{k}", "source": "NESSUS"}) for k in range(5)]
+    nvd = [g.add_node(("CVE",), {"name": f"C{k}", "source": "NVD",
+                                 **({"cvss_score": rng.choice([5.0, 7.5, 9.8])} if k % 3 else {})})
+           for k in range(5)]
+    services = [g.add_node(("Service",), {"name": f"s{k}"}) for k in range(3)]
+    for h in hosts:
+        for p in rng.sample(plugins, 2):
+            g.table("HAS_PLUGIN").add(h, p, {"resolved_at": "t0"} if rng.random() < 0.2 else {})
+    for p in plugins:
+        for c in rng.sample(nessus, 2):
+            g.table("DETECTS").add(p, c)
+    for k in range(5):
+        g.table("SAME_AS").add(nvd[k], nessus[k], {"method": "exact"})
+    for s in services:
+        for c in rng.sample(nvd, 2):
+            g.table("IMPACTS").add(s, c)
+    return g, hosts, services
+
+def cypher_impacts(g):
+    # Énumération littérale du motif de impacts.Q_RECOMPUTE, chemin par chemin
+    hp, det, same, imp = (g.table(t) for t in ("HAS_PLUGIN", "DETECTS", "SAME_AS", "IMPACTS"))
+    out = {}
+    for i in hp.arrays()[2].tolist():
+        if hp.get(i, "resolved_at") is not None:
+            continue
+        h = int(hp.src[i])
+        for j in det.out_edges(hp.dst[i]):
+            c = det.dst[j]
+            for k in same.out_edges(c) + same.in_edges(c):
+                c2 = same.dst[k] if same.src[k] == c else same.src[k]
+                for m in imp.in_edges(c2):
+                    s = int(imp.src[m])
+                    if g.has_label(s, "Service"):
+                        w, n = out.get((h, s), (0.0, 0))
+                        out[(h, s)] = (w + (g.get(c2, "cvss_score") or 0.0), n + 1)
+    return out
+
+def host_impacts(g):
+    t = g.table("IMPACTS")
+    return {(int(a), int(b)): (t.get(i, "weight"), t.get(i, "paths"))
+            for a, b, i in zip(*t.arrays()) if g.has_label(int(a), "Host")}
+
+def test_propagate_impacts_matches_cypher_path_semantics():
+    for seed in range(5):
+        g, *_ = impacts_graph(seed)
+        g.propagate_impacts()
+        assert host_impacts(g) == cypher_impacts(g)
+        # Résolution d'un finding puis recalcul : toujours identique au motif
+        hp = g.table("HAS_PLUGIN")
+        hp.set(0, "resolved_at", "t1")
+        g.propagate_impacts()
+        assert host_impacts(g) == cypher_impacts(g)
+
+def test_propagate_impacts_keeps_manual_edges():
+    g, hosts, services = impacts_graph(0)
+    manual = g.table("IMPACTS").add(hosts[0], services[0], {"source": "manual"})
+    for i in g.table("HAS_PLUGIN").arrays()[2].tolist():
+        g.table("HAS_PLUGIN").set(i, "resolved_at", "t1")
+    counts = g.propagate_impacts()
+    assert host_impacts(g) == {(hosts[0], services[0]): (None, None)}
+    assert g.table("IMPACTS").alive[manual]
+    assert counts["removed"] == 0
+
+def test_snapshot_roundtrip_keeps_typed_columns(tmp_path):
+    g, c1, c2, h, w = fusion_graph()
+    g.set(h, "ports", [22, 443])
+    g.set(c2, "cvss_score", 5)          # int puis float : colonne float
+    g.set(w, "cvss_score", "n/a")       # type mélangé : colonne JSON
+    g.fuse_pairs()
+    path = str(tmp_path / "snap.npz")
+    g.save(path)
+    loaded = GraphEngine.load(path)
+    assert g.node_props.cols["name"].kind == "s"
+    assert loaded.node_props.cols["cvss_score"].kind == "j"
+    for i in range(g.n_nodes):
+        assert loaded.properties(i) == g.properties(i)
+        assert loaded.labels(i) == g.labels(i)
+    for rel_type, t in g.edges.items():
+        lt = loaded.table(rel_type)
+        assert lt.src.tolist() == t.src.tolist() and lt.alive.tolist() == t.alive.tolist()
+        assert [lt.properties(i) for i in range(len(t))] == [t.properties(i) for i in range(len(t))]
+        assert lt.dirty == t.dirty
+    assert loaded.find("CVE_UNIFIED", "CVE-2024-0001") == g.find("CVE_UNIFIED", "CVE-2024-0001")
+    assert loaded.fuse_pairs()["fused"] == 0
+
+class PagedGraph:
+    # Neo4j réduit : un nœud apparaît entre la lecture des nœuds et celle des arêtes
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def data(self):
+            return self.rows
+
+    def run(self, query, after, limit):
+        if "MATCH (n)" in query:
+            nodes = [{"id": 1, "labels": ["Host"], "props": {"name": "h1"}},
+                     {"id": 2, "labels": ["Service"], "props": {"name": "s1"}}]
+            return self.Result([r for r in nodes if r["id"] > after][:limit])
+        edges = [{"id": 10, "type": "RUNS_SERVICE", "a": 1, "b": 2, "props": {}},
+                 {"id": 11, "type": "RUNS_SERVICE", "a": 1, "b": 3, "props": {}}]
+        return self.Result([r for r in edges if r["id"] > after][:limit])
+
+def test_from_neo4j_skips_edges_to_unread_nodes():
+    g = GraphEngine.from_neo4j(PagedGraph(), batch_size=1)
+    assert g.n_nodes == 2
+    assert g.table("RUNS_SERVICE").rid.tolist() == [10]
+
+class StoreGraph:
+    # Neo4j réduit aux requêtes de sync_to_neo4j : nœuds et arêtes par identifiant
+    class Result:
+        def __init__(self, rows=()):
+            self.rows = list(rows)
+
+        def data(self):
+            return self.rows
+
+    def __init__(self):
+        self.nodes, self.rels, self.next_id = {}, {}, 100
+
+    def begin(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id
+
+    def run(self, query, rows):
+        out = []
+        for row in rows:
+            if "DELETE r" in query:
+                self.rels.pop(row)
+            elif "MERGE (n:" in query:
+                i = self._new_id()
+                self.nodes[i] = dict(row["props"])
+                out.append({"i": row["i"], "id": i})
+            elif "MERGE (a)-[r:" in query:
+                i = self._new_id()
+                self.rels[i] = dict(row["props"])
+                out.append({"i": row["i"], "id": i})
+            else:
+                target = self.rels if "()-[r]->()" in query else self.nodes
+                assert "SET n = row.props" in query or "SET r = row.props" in query
+                target[row["id"]] = dict(row["props"])
+        return self.Result(out)
+
+def test_sync_removes_properties_cleared_locally():
+    g, c1, c2, h, _ = fusion_graph()
+    store = StoreGraph()
+    g.sync_to_neo4j(store)
+    g.fuse_pairs()
+    g.sync_to_neo4j(store)
+    t = g.table("IS_VULNERABLE_TO")
+    i = t.between(h, c2)[0]
+    t.set(i, "resolved_at", "t2")
+    g.sync_to_neo4j(store)
+    assert store.rels[int(t.rid[i])]["resolved_at"] == "t2"
+
+    # Effacements locaux : set(..., None) sur un nœud, _replace_props via la fusion sur u
+    t.set(i, "resolved_at", None)
+    t.set(i, "changed_at", "t3")
+    g.set(c1, "cvss_score", None)
+    g.fuse_pairs()
+    g.sync_to_neo4j(store)
+    assert "resolved_at" not in store.rels[int(t.rid[i])]
+    assert "cvss_score" not in store.nodes[int(g.eid[c1])]
+    u = g.find("CVE_UNIFIED", "CVE-2024-0001")[0]
+    j = t.in_edges(u)[0]
+    assert store.rels[int(t.rid[j])] == t.properties(j) == {"last_seen": "t1", "changed_at": "t3"}
+    assert store.nodes[int(g.eid[u])] == g.properties(u)
@@ -0,0 +1,137 @@
+import copy
+import random
+from datetime import datetime
+
+import impacts
+from impacts import propagate_impacts
+
+class ImpactsGraph:
+    # Modèle en mémoire rejouant les requêtes de impacts.py (id(c) = nom de la CVE)
+    class Result:
+        def __init__(self, rows=()):
+            self.rows = list(rows)
+
+        def data(self):
+            return self.rows
+
+    def __init__(self):
+        self.hosts, self.cves = set(), {}
+        self.has_plugin, self.detects, self.same_as = {}, {}, {}
+        self.service_impacts = set()   # (service, cve)
+        self.host_impacts = {}         # (host, service) -> propriétés
+
+    def begin(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def twins(self, c):
+        return {b if a == c else a for a, b in self.same_as if c in (a, b)}
+
+    def run(self, query, **p):
+        if query == impacts.Q_ALL_HOSTS:
+            return self.Result({"host": h} for h in sorted(self.hosts) if h > p["after"])
+        if query == impacts.Q_CHANGED_FINDINGS:
+            return self.Result({"host": h} for h in {h for (h, _), r in self.has_plugin.items()
+                                                     if r.get("changed_at", "") > p["since"]})
+        if query == impacts.Q_CHANGED_CVES:
+            ids = {c for c, props in self.cves.items()
+                   if props.get("updated_at", "") > p["since"] or props.get("same_as_changed_at", "") > p["since"]}
+            ids |= {c for pair, r in self.same_as.items() if r["created_at"] > p["since"] for c in pair}
+            ids |= {c for (_, c), r in self.detects.items() if r.get("changed_at", "") > p["since"]}
+            return self.Result({"id": c} for c in ids)
+        if query == impacts.Q_HOSTS_OF_CVES:
+            c0s = {c0 for c in p["ids"] for c0 in {c} | self.twins(c)}
+            return self.Result({"host": h} for h in {h for (h, pl) in self.has_plugin
+                                                     for (pl2, c) in self.detects if pl2 == pl and c in c0s})
+        if query == impacts.Q_RECOMPUTE:
+            return self.Result([self.recompute(p["hosts"], p["now"])])
+        raise AssertionError(f"requête inattendue : {query}")
+
+    def recompute(self, hosts, now):
+        removed = written = 0
+        for h in hosts:
+            targets = {}
+            for (h2, pl), r in self.has_plugin.items():
+                if h2 != h or r.get("resolved_at") is not None:
+                    continue
+                for (pl2, c) in self.detects:
+                    if pl2 != pl:
+                        continue
+                    for c2 in self.twins(c):
+                        for s, c3 in self.service_impacts:
+                            if c3 == c2:
+                                w, n = targets.get(s, (0.0, 0))
+                                targets[s] = (w + (self.cves[c2].get("cvss_score") or 0.0), n + 1)
+            for (h2, s), r in list(self.host_impacts.items()):
+                if h2 == h and s not in targets and r.get("inferred") is True:
+                    del self.host_impacts[(h2, s)]
+                    removed += 1
+            for s, (w, n) in targets.items():
+                r = self.host_impacts.setdefault((h, s), {"inferred": True})
+                r.update(weight=w, paths=n, updated_at=now)
+                written += 1
+        return {"removed": removed, "written": written}
+
+def random_graph(rng):
+    g = ImpactsGraph()
+    g.hosts = {f"h{k}" for k in range(6)}
+    for k in range(6):
+        g.cves[f"C{k}"] = {"cvss_score": rng.choice([None, 5.0, 9.8])}
+        g.cves[f"N{k}"] = {}
+        g.same_as[(f"C{k}", f"N{k}")] = {"created_at": ""}
+    for h in g.hosts:
+        for k in rng.sample(range(5), 2):
+            g.has_plugin[(h, f"p{k}")] = {}
+    for k in range(5):
+        for c in rng.sample(range(6), 2):
+            g.detects[(f"p{k}", f"N{c}")] = {}
+    for s in ("www", "ssh", "db"):
+        for c in rng.sample(range(6), 2):
+            g.service_impacts.add((s, f"C{c}"))
+    return g
+
+def mutate(g, rng):
+    # Chaque écriture pose le marqueur de changement que posent les pipelines
+    now = datetime.utcnow().isoformat()
+    op = rng.choice(["resolve", "open", "cvss", "same_as", "drop_same_as", "detects"])
+    if op == "resolve":
+        key = rng.choice(sorted(g.has_plugin))
+        g.has_plugin[key].update(resolved_at=now, changed_at=now)
+    elif op == "open":
+        g.has_plugin[(rng.choice(sorted(g.hosts)), f"p{rng.randrange(5)}")] = {"changed_at": now}
+    elif op == "cvss":
+        g.cves[f"C{rng.randrange(6)}"].update(cvss_score=rng.choice([1.0, 7.5]), updated_at=now)
+    elif op == "same_as":
+        g.same_as[(f"C{rng.randrange(6)}", f"N{rng.randrange(6)}")] = {"created_at": now}
+    elif op == "drop_same_as" and g.same_as:
+        a, b = rng.choice(sorted(g.same_as))
+        del g.same_as[(a, b)]
+        g.cves[a]["same_as_changed_at"] = g.cves[b]["same_as_changed_at"] = now
+    elif op == "detects":
+        g.detects[(f"p{rng.randrange(5)}", f"N{rng.randrange(6)}")] = {"changed_at": now}
+
+def aggregates(g):
+    return {k: (r["weight"], r["paths"]) for k, r in g.host_impacts.items() if r.get("inferred")}
+
+def test_incremental_matches_full_recompute(tmp_path):
+    state = str(tmp_path / "impacts_state.json")
+    for seed in range(10):
+        rng = random.Random(seed)
+        g = random_graph(rng)
+        propagate_impacts(g, state_path=state, full=True)
+        for _ in range(3):
+            for _ in range(rng.randint(1, 4)):
+                mutate(g, rng)
+            incremental = propagate_impacts(g, state_path=state)
+            full = copy.deepcopy(g)
+            propagate_impacts(full, state_path=str(tmp_path / "full.json"), full=True)
+            assert aggregates(g) == aggregates(full), seed
+            assert incremental["hosts"] <= len(g.hosts)
+
+def test_recompute_keeps_manual_impacts(tmp_path):
+    g = random_graph(random.Random(0))
+    g.host_impacts[("h0", "backup")] = {"source": "manual"}
+    propagate_impacts(g, state_path=str(tmp_path / "state.json"), full=True)
+    assert g.host_impacts[("h0", "backup")] == {"source": "manual"}
@@ -0,0 +1,144 @@
+import functools
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import monitor
+from monitor import MonitorContext, iter_windows, poll_windows, run_monitoring
+from nvd_fetcher import NVDFetcher, SlidingWindowLimiter, make_session
+
+PAGE = 100
+
+class StandIn(BaseHTTPRequestHandler):
+    # API NVD réduite : filtre lastModStartDate / lastModEndDate (120 jours max), pagination
+    cves = []
+    pages = []
+
+    @classmethod
+    def windows(cls):
+        return sorted({start for start, _ in cls.pages})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        parse = lambda k: datetime.fromisoformat(query[k][0].rstrip("Z"))
+        start, end = parse("lastModStartDate"), parse("lastModEndDate")
+        if end - start > timedelta(days=120):
+            self.send_error(404, "date range exceeds 120 days")
+            return
+        first = int(query["startIndex"][0])
+        per_page = int(query["resultsPerPage"][0])
+        StandIn.pages.append((start, first))
+        hits = [c for c in StandIn.cves if start <= c[1] <= end]
+        body = json.dumps({
+            "totalResults": len(hits), "startIndex": first, "resultsPerPage": per_page,
+            "vulnerabilities": [{"cve": {"id": cve_id, "lastModified": t.isoformat()}}
+                                for cve_id, t in hits[first:first + per_page]],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def nvd(monkeypatch, tmp_path):
+    StandIn.cves, StandIn.pages = [], []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0"
+    # Pages de 100 CVE au lieu de 2000 : une fenêtre de 260 CVE tient sur 3 pages
+    monkeypatch.setattr(monitor, "NVDFetcher", functools.partial(NVDFetcher, base_url=url, per_page=PAGE))
+    monkeypatch.setattr(monitor, "LAST_CHECK_FILE", tmp_path / "last_check.txt")
+    yield StandIn
+    server.shutdown()
+    server.server_close()
+
+class Stage:
+    def __init__(self, fail_at=None):
+        self.calls, self.fail_at = 0, fail_at
+
+    def flush(self, strict=False):
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise RuntimeError("NER en échec pour 1 CVE")
+
+class StandInContext(MonitorContext):
+    # Contexte sans Neo4j ni modèle : ingest enregistre, checkpoint est celui du monitor
+    def __init__(self, fail_on=(), stage=None):
+        self.session = make_session(retries=0)
+        self.limiter = SlidingWindowLimiter(1000, 1)
+        self.fast_lane = None
+        self.stage = stage or Stage()
+        self.totals = {}
+        self.fail_on = set(fail_on)
+        self.seen = []
+
+    def ingest(self, vulns):
+        ids = [v["cve"]["id"] for v in vulns]
+        if self.fail_on & set(ids):
+            raise ConnectionError("écriture Neo4j en échec")
+        self.seen.extend(ids)
+        return {}
+
+    def close(self):
+        pass
+
+def last_check():
+    return monitor.get_last_check_time()
+
+def test_large_window_is_fully_paged(nvd):
+    now = datetime.utcnow()
+    nvd.cves = [(f"CVE-2024-{k:05d}", now - timedelta(hours=2, seconds=k)) for k in range(260)]
+    monitor.update_last_check_time(now - timedelta(days=1))
+    ctx = StandInContext()
+    run_monitoring(ctx)
+    assert sorted(ctx.seen) == sorted(c[0] for c in nvd.cves)
+    assert sorted(first for _, first in nvd.pages) == [0, PAGE, 2 * PAGE]
+    assert last_check() > now
+
+def test_long_gap_is_split_into_nvd_windows(nvd):
+    now = datetime.utcnow()
+    nvd.cves = [(f"CVE-2024-{d:05d}", now - timedelta(days=d, hours=1)) for d in range(1, 300, 7)]
+    monitor.update_last_check_time(now - timedelta(days=300))
+    ctx = StandInContext()
+    run_monitoring(ctx)
+    # Une fenêtre de plus de 120 jours aurait reçu un 404 et fait échouer le cycle
+    assert len(nvd.windows()) == 3
+    assert sorted(ctx.seen) == sorted(c[0] for c in nvd.cves)
+
+def three_windows(nvd):
+    end = datetime.utcnow()
+    start = end - timedelta(days=300)
+    windows = list(iter_windows(start, end))
+    nvd.cves = [("CVE-W0", start + timedelta(days=50)), ("CVE-W1", start + timedelta(days=200)),
+                ("CVE-W2", start + timedelta(days=280))]
+    monitor.update_last_check_time(start)
+    return windows
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_write_failure_keeps_last_check_behind_the_window(nvd, workers):
+    windows = three_windows(nvd)
+    ctx = StandInContext(fail_on={"CVE-W1"})
+    with pytest.raises(ConnectionError):
+        poll_windows(windows, ctx.ingest, on_checkpoint=ctx.checkpoint, session=ctx.session,
+                     limiter=ctx.limiter, window_workers=workers)
+    if workers == 1:
+        assert last_check() == windows[0][1]
+    else:
+        # Fenêtres en parallèle : jamais au-delà de la fenêtre précédant l'échec
+        assert last_check() <= windows[0][1]
+
+def test_ner_failure_keeps_last_check_behind_the_window(nvd):
+    windows = three_windows(nvd)
+    ctx = StandInContext(stage=Stage(fail_at=2))
+    with pytest.raises(RuntimeError, match="NER"):
+        poll_windows(windows, ctx.ingest, on_checkpoint=ctx.checkpoint, session=ctx.session,
+                     limiter=ctx.limiter, window_workers=1)
+    assert last_check() == windows[0][1]
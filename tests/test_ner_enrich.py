@@ -0,0 +1,65 @@
+import pytest
+
+from ner_enrich import EnrichmentStage, NEREnricher
+
+MAX_CHARS = 40
+
+def fake_pipeline(descriptions, batch_size=None):
+    # Comme le modèle sans troncature : une entrée trop longue fait échouer l'appel entier
+    if any(len(d) > MAX_CHARS for d in descriptions):
+        raise RuntimeError("sequence longer than 512 tokens")
+    return [[{"word": w, "entity_group": "MISC", "score": 0.9} for w in d.split() if w.istitle()]
+            for d in descriptions]
+
+def enricher():
+    e = NEREnricher(cache_path=None)
+    e._pipeline = fake_pipeline
+    return e
+
+class RecordingGraph:
+    class Result:
+        def data(self):
+            return []
+
+    class Tx:
+        def __init__(self, graph):
+            self.graph = graph
+
+        def run(self, query, **params):
+            self.graph.writes.append((query, params))
+            return RecordingGraph.Result()
+
+        def commit(self):
+            pass
+
+    def __init__(self):
+        self.writes, self.resets = [], []
+
+    def run(self, query, **params):
+        self.resets.append(params["names"])
+        return self.Result()
+
+    def begin(self):
+        return self.Tx(self)
+
+def test_failed_batch_is_retried_item_by_item():
+    long_desc = "Overflow " + "x" * MAX_CHARS
+    out = enricher().entities_for(["Apache httpd", long_desc, "Openssl bug"])
+    assert out[0] == [{"name": "Apache", "type": "MISC", "score": 0.9}]
+    assert out[1] is None
+    assert [e["name"] for e in out[2]] == ["Openssl"]
+
+def test_stage_only_fails_and_resets_the_bad_cve():
+    graph = RecordingGraph()
+    stage = EnrichmentStage(graph, enricher()).start()
+    stage.submit([("CVE-1", "Apache httpd"), ("CVE-2", "Long " + "y" * MAX_CHARS), ("CVE-3", "Nginx")],
+                 prune=["CVE-1", "CVE-2"])
+    with pytest.raises(RuntimeError, match="1 CVE"):
+        stage.flush(strict=True)
+    stage.close()
+    assert graph.resets == [["CVE-2"]]
+    rows = [p for _, params in graph.writes for p in params["rows"]]
+    assert {r["cve"] for r in rows if "type" in r} == {"CVE-1", "CVE-3"}
+    # Les MENTIONS de la CVE en échec ne sont pas élaguées
+    assert {r["cve"] for r in rows if "names" in r} == {"CVE-1"}
+    assert stage.written == 2
@@ -0,0 +1,88 @@
+import pytest
+
+from nessus_diff import RESOLVE_QUERIES, TOUCH_QUERIES, diff_scans, empty_findings, parse_scan, scan_scope, write_delta
+
+@pytest.mark.parametrize("path, scope", [
+    ("scans/dmz_2024-05-01.csv", "dmz"),
+    ("scans/dmz-20240502T0300.nessus", "dmz"),
+    ("scans/dmz.20240502T030000.csv", "dmz"),
+    ("scans/dmz.csv", "dmz"),
+])
+def test_scan_scope_strips_date_suffix(path, scope):
+    assert scan_scope(path) == scope
+
+@pytest.mark.parametrize("path, scope", [
+    ("web01.csv", "web01"),
+    ("web02_2024-05-01.csv", "web02"),
+    ("vlan10_2024-05-01.csv", "vlan10"),
+    ("vlan20_2024-05-01.csv", "vlan20"),
+    ("site2.nessus", "site2"),
+])
+def test_scan_scope_keeps_numbered_scopes_apart(path, scope):
+    assert scan_scope(path) == scope
+
+def test_scan_scope_date_only_name_is_kept():
+    assert scan_scope("2024-05-01.csv") == "2024-05-01"
+
+def test_diff_scans_new_resolved_persisting():
+    previous = {"findings": {"has_plugin": {("h1", "1"), ("h1", "2")}}}
+    current = {"findings": {"has_plugin": {("h1", "2"), ("h2", "1")}}}
+    diff = diff_scans(previous, current)["has_plugin"]
+    assert diff == {"new": {("h2", "1")}, "resolved": {("h1", "1")}, "persisting": {("h1", "2")}}
+
+def test_diff_scans_first_scan_is_all_new():
+    current = {"findings": {"has_plugin": {("h1", "1")}}}
+    assert diff_scans(None, current)["has_plugin"]["new"] == {("h1", "1")}
+
+class RecordingGraph:
+    def __init__(self):
+        self.runs = []
+
+    def begin(self):
+        return self
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+
+    def commit(self):
+        pass
+
+def test_write_delta_touches_last_seen_of_persisting_edges():
+    previous = {"findings": empty_findings()}
+    current = {"findings": empty_findings(), "plugins": {}}
+    for scan in (previous, current):
+        scan["findings"]["has_plugin"].add(("h1", "1"))
+        scan["findings"]["vulnerable"].add(("h1", "CVE-1"))
+    current["findings"]["vulnerable"].add(("h1", "CVE-2"))
+    graph = RecordingGraph()
+    counts = write_delta(graph, diff_scans(previous, current), current, "t2")
+    touched = {q: p["rows"] for q, p in graph.runs if q in TOUCH_QUERIES.values()}
+    assert touched == {TOUCH_QUERIES["has_plugin"]: [{"host": "h1", "plugin_id": "1"}],
+                       TOUCH_QUERIES["vulnerable"]: [{"host": "h1", "cve": "CVE-1"}]}
+    assert counts["vulnerable_persisting"] == 1 and counts["vulnerable"] == 1
+
+SCAN_CSV = """Plugin ID,CVE,Host,Port,Name,Plugin Output
+10,CVE-2024-0001,h1,443,Apache,"Installed: cpe:/a:apache:http_server:2.4.62 (from banner)"
+20,,h1,0,OS,"cpe:2.3:o:debian:debian_linux:12:*:*:*:*:*:*:*"
+20,,h2,0,OS,No CPE here
+"""
+
+def test_plugin_output_cpes_become_has_cpe_edges(tmp_path):
+    path = tmp_path / "dmz.csv"
+    path.write_text(SCAN_CSV)
+    scan = parse_scan(str(path))
+    assert scan["findings"]["has_cpe"] == {("h1", "cpe:/a:apache:http_server:2.4.62"),
+                                           ("h1", "cpe:2.3:o:debian:debian_linux:12:*:*:*:*:*:*:*")}
+    graph = RecordingGraph()
+    write_delta(graph, diff_scans(None, scan), scan, "t1")
+    merged = [r["cpe"] for q, p in graph.runs if "MERGE (:CPE" in q for r in p["rows"]]
+    assert merged == sorted(cpe for _, cpe in scan["findings"]["has_cpe"])
+    assert [len(p["rows"]) for q, p in graph.runs if "MERGE (h)-[r:HAS_CPE]" in q] == [2]
+
+    # Produit désinstallé : l'arête HAS_CPE est résolue au scan suivant
+    path.write_text(SCAN_CSV.replace("Installed: cpe:/a:apache:http_server:2.4.62", "gone"))
+    later = parse_scan(str(path))
+    graph = RecordingGraph()
+    write_delta(graph, diff_scans(scan, later), later, "t2")
+    resolved = [p["rows"] for q, p in graph.runs if q == RESOLVE_QUERIES["has_cpe"]]
+    assert resolved == [[{"host": "h1", "cpe": "cpe:/a:apache:http_server:2.4.62"}]]
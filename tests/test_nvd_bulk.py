@@ -0,0 +1,107 @@
+import nvd_bulk
+from nvd_bulk import ingest_cves
+
+class MemoryGraph:
+    # Backend local au contrat de nvd_bulk : begin() -> tx, tx.run(query, **params), tx.commit().
+    # Les requêtes sont rejouées sur un dict de nœuds CVE et un ensemble d'arêtes ;
+    # rien n'est visible avant le commit.
+    class Result:
+        def __init__(self, rows=()):
+            self.rows = list(rows)
+
+        def data(self):
+            return self.rows
+
+    class Tx:
+        def __init__(self, graph):
+            self.graph = graph
+            self.ops = []
+
+        def run(self, query, **params):
+            self.ops.append((query, params))
+            return MemoryGraph.Result()
+
+        def commit(self):
+            self.graph.commits += 1
+            for query, params in self.ops:
+                self.graph.apply(query, params)
+
+    def __init__(self):
+        self.cves = {}
+        self.edges = set()
+        self.commits = 0
+
+    def begin(self):
+        return self.Tx(self)
+
+    def run(self, query, **params):
+        assert query == nvd_bulk.Q_FINGERPRINTS
+        return self.Result({"name": n, "fingerprint": self.cves[n].get("fingerprint"),
+                            "last_modified": self.cves[n].get("last_modified")}
+                           for n in params["names"] if n in self.cves)
+
+    def apply(self, query, params):
+        rows = params["rows"]
+        if query == nvd_bulk.Q_CVE:
+            for r in rows:
+                node = self.cves.setdefault(r["name"], {})
+                node.update(r["props"])
+                for k in [k for k, v in node.items() if v is None]:
+                    del node[k]
+                node["updated_at"] = params["now"]
+        elif query in (nvd_bulk.Q_CWE % "ASSOCIATED_WITH", nvd_bulk.Q_CPE):
+            rel, key = ("AFFECTS", "cpe") if query == nvd_bulk.Q_CPE else ("ASSOCIATED_WITH", "cwe")
+            self.edges.update((r["cve"], rel, r[key]) for r in rows if r["cve"] in self.cves)
+        elif query in (nvd_bulk.Q_CWE_PRUNE % "ASSOCIATED_WITH", nvd_bulk.Q_CPE_PRUNE):
+            rel, key = ("AFFECTS", "cpes") if query == nvd_bulk.Q_CPE_PRUNE else ("ASSOCIATED_WITH", "cwes")
+            keep = {r["name"]: set(r[key]) for r in rows}
+            self.edges = {e for e in self.edges if e[1] != rel or e[0] not in keep or e[2] in keep[e[0]]}
+        else:
+            raise AssertionError(f"requête inattendue : {query}")
+
+    def out(self, cve, rel):
+        return {e[2] for e in self.edges if e[0] == cve and e[1] == rel}
+
+def item(cve_id, score=7.5, cwes=("CWE-79",), cpes=("cpe:2.3:a:x:y:1",), modified="2024-01-01T00:00:00"):
+    metrics = {"cvssMetricV31": [{"cvssData": {"baseScore": score, "baseSeverity": "HIGH"}}]} if score else {}
+    return {"cve": {
+        "id": cve_id, "lastModified": modified, "descriptions": [{"value": f"Bug in {cve_id}"}],
+        "metrics": metrics,
+        "weaknesses": [{"description": [{"value": w} for w in cwes]}],
+        "configurations": [{"nodes": [{"cpeMatch": [{"criteria": c} for c in cpes]}]}],
+    }}
+
+def test_ingest_writes_batches_through_the_transaction_contract():
+    graph = MemoryGraph()
+    totals = ingest_cves(graph, (item(f"CVE-2024-{k}") for k in range(5)), batch_size=2)
+    assert graph.commits == 3
+    assert totals["cve"] == 5 and totals["cwe"] == 5 and totals["cpe"] == 5
+    assert graph.cves["CVE-2024-3"]["cvss_score"] == 7.5
+    assert graph.out("CVE-2024-3", "ASSOCIATED_WITH") == {"CWE-79"}
+
+def test_delta_skips_unchanged_and_prunes_changed():
+    graph = MemoryGraph()
+    ingest_cves(graph, [item("CVE-1", cwes=("CWE-79", "CWE-89"), cpes=("cpe:a", "cpe:b")), item("CVE-2")],
+                delta=True)
+    first = dict(graph.cves["CVE-2"])
+
+    # CVE-2 identique (ordre des CWE/CPE indifférent) ; CVE-1 perd une CWE, un CPE et son CVSS
+    totals = ingest_cves(graph, [item("CVE-1", score=None, cwes=("CWE-89",), cpes=("cpe:b", "cpe:c"),
+                                      modified="2024-02-01T00:00:00"), item("CVE-2")], delta=True)
+    assert totals["skipped"] == 1 and totals["changed"] == 1
+    assert graph.cves["CVE-2"] == first
+    assert graph.out("CVE-1", "ASSOCIATED_WITH") == {"CWE-89"}
+    assert graph.out("CVE-1", "AFFECTS") == {"cpe:b", "cpe:c"}
+    assert "cvss_score" not in graph.cves["CVE-1"] and "severity" not in graph.cves["CVE-1"]
+
+def test_delta_ignores_an_older_feed():
+    graph = MemoryGraph()
+    ingest_cves(graph, [item("CVE-1", score=9.8, modified="2024-03-01T00:00:00")], delta=True)
+    totals = ingest_cves(graph, [item("CVE-1", score=5.0, modified="2024-01-01T00:00:00")], delta=True)
+    assert totals["skipped"] == 1
+    assert graph.cves["CVE-1"]["cvss_score"] == 9.8
+
+def test_fingerprint_ignores_list_order_and_last_modified():
+    a = nvd_bulk.parse_cve_item(item("CVE-1", cwes=("CWE-1", "CWE-2"), modified="2024-01-01T00:00:00"))
+    b = nvd_bulk.parse_cve_item(item("CVE-1", cwes=("CWE-2", "CWE-1"), modified="2024-05-01T00:00:00"))
+    assert a["props"]["fingerprint"] == b["props"]["fingerprint"]
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from nvd_fetcher import NVDFetcher, PageCursor, SlidingWindowLimiter, backfill, make_session
+
+TOTAL = 23
+
+class StandIn(BaseHTTPRequestHandler):
+    # API NVD 2.0 réduite : pagination startIndex / resultsPerPage sur TOTAL CVE
+    requests = []
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        start, per_page = int(query["startIndex"][0]), int(query["resultsPerPage"][0])
+        StandIn.requests.append(start)
+        body = json.dumps({
+            "totalResults": TOTAL, "startIndex": start, "resultsPerPage": per_page,
+            "vulnerabilities": [{"cve": {"id": f"CVE-2024-{i:04d}"}}
+                                for i in range(start, min(start + per_page, TOTAL))],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def nvd_url():
+    StandIn.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/rest/json/cves/2.0"
+    server.shutdown()
+    server.server_close()
+
+def fetcher(url, cursor, per_page=5):
+    return NVDFetcher(base_url=url, per_page=per_page, workers=3, session=make_session(retries=0),
+                      limiter=SlidingWindowLimiter(1000, 1), cursor=cursor)
+
+def test_backfill_ingests_every_cve_once(nvd_url, tmp_path):
+    seen = []
+    cursor = PageCursor(tmp_path / "cursor.json")
+    assert backfill(seen.extend, fetcher(nvd_url, cursor)) == TOTAL
+    assert sorted(v["cve"]["id"] for v in seen) == [f"CVE-2024-{i:04d}" for i in range(TOTAL)]
+    assert cursor.next_start >= TOTAL
+
+def test_backfill_resumes_at_the_failed_page(nvd_url, tmp_path):
+    path = tmp_path / "cursor.json"
+    seen = []
+
+    def consume(vulns):
+        if vulns and vulns[0]["cve"]["id"] == "CVE-2024-0010":
+            raise ConnectionError("écriture en échec")
+        seen.extend(vulns)
+
+    with pytest.raises(ConnectionError):
+        backfill(consume, fetcher(nvd_url, PageCursor(path)))
+    cursor = PageCursor(path)
+    assert cursor.next_start <= 10 and not cursor.is_done(10)
+    backfill(seen.extend, fetcher(nvd_url, cursor))
+    assert {v["cve"]["id"] for v in seen} == {f"CVE-2024-{i:04d}" for i in range(TOTAL)}
+
+def test_cursor_refuses_another_page_size(nvd_url, tmp_path):
+    path = tmp_path / "cursor.json"
+    backfill(lambda vulns: None, fetcher(nvd_url, PageCursor(path)), max_pages=2)
+    with pytest.raises(ValueError, match="5 CVE par page"):
+        fetcher(nvd_url, PageCursor(path), per_page=7)
+    fetcher(nvd_url, PageCursor(path), per_page=5)
+
+def test_limiter_never_exceeds_capacity_per_window():
+    limiter = SlidingWindowLimiter(3, 0.3)
+    times = []
+
+    def worker():
+        for _ in range(3):
+            limiter.acquire()
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    times.sort()
+    assert len(times) == 9
+    # Démarrage compris : jamais plus de 3 requêtes sur 0,3 s
+    for i in range(len(times) - 3):
+        assert times[i + 3] - times[i] >= 0.3 - 1e-3
@@ -0,0 +1,49 @@
+import gzip
+import json
+
+import pytest
+
+from nvd_stream import iter_vulnerabilities, write_vulnerabilities
+
+def nvd_item(i):
+    return {"cve": {
+        "id": f"CVE-2024-{1000 + i}",
+        "published": "2024-03-01T12:00:00.000",
+        "descriptions": [{"lang": "en", "value": f"Débordement de tampon n°{i} dans \"libfoo\" ✓"}],
+        "metrics": {"cvssMetricV31": [{"cvssData": {
+            "baseScore": 9.8 - i / 10, "baseSeverity": "CRITICAL",
+            "attackVector": "NETWORK", "exploitabilityScore": 3.9e0}}]},
+        "weaknesses": [{"description": [{"lang": "en", "value": "CWE-787"}]}],
+        "configurations": [{"nodes": [{"negate": False, "cpeMatch": [
+            {"vulnerable": True, "criteria": "cpe:2.3:a:foo:libfoo:1.2.5:*:*:*:*:*:*:*"}]}]}],
+        "vendorComments": None,
+    }}
+
+@pytest.fixture
+def feed(tmp_path):
+    # Forme d'une réponse NVD 2.0 : métadonnées numériques au premier niveau,
+    # avant et après le tableau (dont un flottant coupé facilement : 1.25)
+    doc = {
+        "resultsPerPage": 12, "startIndex": 0, "ratio": 1.25, "format": "NVD_CVE",
+        "version": "2.0", "timestamp": "2024-03-02T00:00:00.000",
+        "vulnerabilities": [nvd_item(i) for i in range(12)],
+        "totalResults": 12345, "score": -0.5e-3,
+    }
+    path = tmp_path / "feed.json"
+    path.write_text(json.dumps(doc, indent=1, ensure_ascii=False), encoding="utf-8")
+    return path
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 1 << 16])
+def test_stream_matches_json_load(feed, chunk_size):
+    with open(feed, encoding="utf-8") as f:
+        expected = json.load(f)["vulnerabilities"]
+    assert list(iter_vulnerabilities(feed, chunk_size=chunk_size)) == expected
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5])
+def test_stream_gzip_round_trip(tmp_path, chunk_size):
+    items = [nvd_item(i) for i in range(5)]
+    path = tmp_path / "feed.json.gz"
+    assert write_vulnerabilities(path, items) == 5
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert json.load(f)["vulnerabilities"] == items
+    assert list(iter_vulnerabilities(path, chunk_size=chunk_size)) == items
@@ -0,0 +1,89 @@
+import pytest
+
+from priority import AssetIndex, CPETrie, FastLane, in_range, parse_cpe, version_key
+
+def test_version_key_orders_numerically():
+    assert version_key("2.4.62") < version_key("2.4.100")
+    assert version_key("1.26.0") < version_key("1.26.0-3")
+    assert version_key("9") < version_key("10")
+
+@pytest.mark.parametrize("version, match, expected", [
+    ("2.4.50", {"versionStartIncluding": "2.4.0", "versionEndExcluding": "2.4.51"}, True),
+    ("2.4.51", {"versionStartIncluding": "2.4.0", "versionEndExcluding": "2.4.51"}, False),
+    ("2.4.51", {"versionEndIncluding": "2.4.51"}, True),
+    ("2.4.0", {"versionStartExcluding": "2.4.0"}, False),
+    ("2.4.10", {"versionStartExcluding": "2.4.9"}, True),
+    ("1.0", {}, True),
+])
+def test_in_range_bounds(version, match, expected):
+    assert in_range(version, match) is expected
+
+def test_parse_cpe_22_and_23():
+    assert parse_cpe("cpe:/a:apache:http_server:2.4.62") == ("a", "apache", "http_server", "2.4.62")
+    assert parse_cpe("cpe:2.3:a:Apache:HTTP_Server:2.4.62:*:*:*:*:*:*:*") == ("a", "apache", "http_server", "2.4.62")
+    assert parse_cpe("cpe:/a:apache") is None
+    assert parse_cpe("not-a-cpe") is None
+
+def test_trie_matches_exact_range_and_unknown_versions():
+    trie = CPETrie()
+    trie.add("cpe:/a:apache:http_server:2.4.50", "h1")
+    trie.add("cpe:/a:apache:http_server:2.4.62", "h2")
+    trie.add("cpe:/a:apache:http_server", "h3")
+    exact = {"criteria": "cpe:2.3:a:apache:http_server:2.4.50:*:*:*:*:*:*:*"}
+    ranged = {"criteria": "cpe:2.3:a:apache:http_server:*:*:*:*:*:*:*:*", "versionEndExcluding": "2.4.60"}
+    assert trie.match(exact) == {"h1", "h3"}
+    assert trie.match(ranged) == {"h1", "h3"}
+    assert trie.match({"criteria": "cpe:2.3:a:nginx:nginx:*:*:*:*:*:*:*:*"}) == set()
+
+class CVEWriteFailingGraph:
+    # Lectures vides ; seule l'écriture des nœuds CVE (nvd_bulk.Q_CVE) échoue
+    class Result:
+        def data(self):
+            return []
+
+    class Tx:
+        def run(self, query, **params):
+            if "MERGE (c:CVE" in query:
+                raise ConnectionError("neo4j indisponible")
+            return CVEWriteFailingGraph.Result()
+
+        def commit(self):
+            pass
+
+    def run(self, query, **params):
+        return self.Result()
+
+    def begin(self):
+        return self.Tx()
+
+class StaticIndex:
+    def hosts_for(self, item):
+        return {"h1"}
+
+def test_fast_lane_write_failure_blocks_flush():
+    lane = FastLane(CVEWriteFailingGraph(), StaticIndex()).start()
+    item = {"cve": {"id": "CVE-2024-0001", "descriptions": [{"value": "x"}]}}
+    assert lane.route([item]) == []
+    with pytest.raises(RuntimeError, match="CVE-2024-0001"):
+        lane.flush()
+    lane.close()
+
+class AssetGraph:
+    # Q_ASSET_CPES : plateformes HAS_CPE et CPE des CVE détectées, par host
+    def __init__(self, rows):
+        self.rows = rows
+
+    def run(self, query):
+        assert "HAS_CPE" in query
+        return self
+
+    def data(self):
+        return self.rows
+
+def test_asset_index_is_built_from_the_graph():
+    # Produit sans aucune CVE détectée : seule l'arête HAS_CPE le fait connaître
+    index = AssetIndex(AssetGraph([{"cpe": "cpe:/a:nginx:nginx:1.24.0", "hosts": ["h1", "h2"]}])).build()
+    item = {"cve": {"id": "CVE-2024-9999", "configurations": [{"nodes": [{"cpeMatch": [
+        {"vulnerable": True, "criteria": "cpe:2.3:a:nginx:nginx:*:*:*:*:*:*:*:*",
+         "versionEndExcluding": "1.25.0"}]}]}]}}
+    assert index.hosts_for(item) == {"h1", "h2"}
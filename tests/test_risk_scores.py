@@ -0,0 +1,90 @@
+import random
+
+import numpy as np
+import pytest
+
+from risk_scores import RiskStore
+
+HOSTS = ["h1", "h2", "h3"]
+SERVICES = ["www", "ssh"]
+PLUGINS = ["10", "20", "30", "40"]
+CVES = ["CVE-A", "CVE-B", "CVE-C", "CVE-D"]
+
+def recompute(plugins, cvss, open_findings):
+    # Store neuf construit directement depuis l'état final
+    store = RiskStore(path=None)
+    for pid, (vpr, epss, cves) in plugins.items():
+        store.set_plugin(pid, vpr=vpr, epss=epss, cves=cves)
+    for name, score in cvss.items():
+        store.rescore_cve(name, score)
+    for host, pid, service in sorted(open_findings):
+        store.open_finding(host, pid, service)
+    return store
+
+def assert_same(a, b):
+    for kind in ("hosts", "services", "cves"):
+        agg_a, agg_b = getattr(a, kind), getattr(b, kind)
+        for name in set(agg_a.names) | set(agg_b.names):
+            ra, rb = agg_a.get(name), agg_b.get(name)
+            if ra is None or rb is None:
+                assert (ra or rb)["open"] == 0, (kind, name)
+                continue
+            assert ra["open"] == rb["open"], (kind, name)
+            assert ra["risk"] == pytest.approx(rb["risk"]), (kind, name)
+            assert ra["expected_exploits"] == pytest.approx(rb["expected_exploits"]), (kind, name)
+            assert {s: ra[s] for s in ("low", "medium", "high", "critical")} == \
+                   {s: rb[s] for s in ("low", "medium", "high", "critical")}, (kind, name)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_deltas_match_full_recompute(seed):
+    rng = random.Random(seed)
+    store = RiskStore(path=None)
+    plugins, cvss, open_findings = {}, {}, set()
+    for _ in range(300):
+        op = rng.choice(["plugin", "open", "open", "resolve", "rescore"])
+        if op == "plugin":
+            pid = rng.choice(PLUGINS)
+            plugins[pid] = (round(rng.uniform(0, 10), 1), round(rng.random(), 2),
+                            tuple(rng.sample(CVES, rng.randint(0, 3))))
+            store.set_plugin(pid, vpr=plugins[pid][0], epss=plugins[pid][1], cves=plugins[pid][2])
+        elif op == "open":
+            key = (rng.choice(HOSTS), rng.choice(PLUGINS), rng.choice(SERVICES))
+            open_findings.add(key)
+            store.open_finding(*key)
+        elif op == "resolve" and open_findings:
+            key = rng.choice(sorted(open_findings))
+            open_findings.discard(key)
+            store.resolve_finding(*key)
+        elif op == "rescore":
+            name = rng.choice(CVES)
+            if name in store.cves.index:
+                cvss[name] = rng.choice([None, round(rng.uniform(0, 10), 1)])
+                store.rescore_cve(name, cvss[name])
+    plugins.update({p: (None, None, ()) for p in PLUGINS if p not in plugins})
+    # Une CVE jamais vue d'un plugin n'est pas connue du store : on ne garde que les CVSS reçus
+    cvss = {c: v for c, v in cvss.items() if v is not None}
+    assert_same(store, recompute(plugins, cvss, open_findings))
+
+def test_set_plugin_replaces_its_cve_list():
+    store = RiskStore(path=None)
+    store.set_plugin("10", vpr=7.5, cves=["CVE-A", "CVE-B"])
+    store.open_finding("h1", "10", "www")
+    store.set_plugin("10", vpr=7.5, cves=["CVE-B"])
+    assert store.cve("CVE-A")["open"] == 0
+    assert store.cve("CVE-B")["open"] == 1
+    # Le CVSS d'une CVE retirée ne touche plus le plugin
+    assert store.rescore_cve("CVE-A", 9.8) == 0
+    assert store.host("h1")["risk"] == pytest.approx(7.5)
+
+def test_save_load_roundtrip(tmp_path):
+    store = RiskStore(path=None)
+    store.set_plugin("10", vpr=5.0, epss=0.5, cves=["CVE-A"])
+    store.open_finding("h1", "10", "www")
+    store.rescore_cve("CVE-A", 9.0)
+    path = str(tmp_path / "risk.npz")
+    store.save(path)
+    loaded = RiskStore.load(path)
+    assert loaded.host("h1") == store.host("h1")
+    assert loaded.resolve_finding("h1", "10", "www")
+    assert loaded.host("h1")["open"] == 0
+    assert np.isclose(loaded.cve("CVE-A")["risk"], 0.0)
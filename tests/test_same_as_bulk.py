@@ -0,0 +1,112 @@
+from same_as_bulk import Q_SAME_AS, Q_SAME_AS_DROP, Q_SAME_AS_STATS, drop_same_as, same_as_stats, write_same_as
+
+class SameAsGraph:
+    # Rejoue les trois requêtes de same_as_bulk sur des CVE en mémoire ;
+    # les relations SAME_AS sont orientées (a, b) mais recherchées dans les deux sens
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def data(self):
+            return self.rows
+
+    class Tx:
+        def __init__(self, graph):
+            self.graph = graph
+
+        def run(self, query, rows, now):
+            return SameAsGraph.Result(self.graph.apply(query, rows, now))
+
+        def commit(self):
+            self.graph.commits += 1
+
+    def __init__(self, nvd=(), nessus=()):
+        self.source = {**{n: "NVD" for n in nvd}, **{n: "NESSUS" for n in nessus}}
+        self.node_id = {n: i for i, n in enumerate(self.source)}
+        self.rels = []
+        self.changed = set()
+        self.commits = 0
+
+    def begin(self):
+        return self.Tx(self)
+
+    def between(self, a, b):
+        return [r for r in self.rels if {r["a"], r["b"]} == {a, b}]
+
+    def apply(self, query, rows, now):
+        out = []
+        for row in rows:
+            if self.source.get(row["kg1"]) != "NVD" or self.source.get(row["kg2"]) != "NESSUS":
+                continue
+            existing = self.between(row["kg1"], row["kg2"])
+            if query == Q_SAME_AS:
+                if not existing:
+                    existing = [{"a": row["kg1"], "b": row["kg2"], "method": row["method"],
+                                 "score": row["score"], "created_at": now}]
+                    self.rels.extend(existing)
+                out.extend({"kg2": row["kg2"], "created": r.get("created_at") == now} for r in existing)
+            else:
+                assert query == Q_SAME_AS_DROP
+                dropped = [r for r in existing if r.get("method") is not None]
+                if dropped:
+                    self.changed.update({row["kg1"], row["kg2"]})
+                self.rels = [r for r in self.rels if not any(r is d for d in dropped)]
+                out.append({"dropped": len(dropped)})
+        return out
+
+    def run(self, query):
+        # MATCH (a)-[r]-(b) WHERE id(a) < id(b) : une ligne par relation ; puis une par paire
+        assert query == Q_SAME_AS_STATS
+        pairs = {}
+        for r in self.rels:
+            a, b = sorted((r["a"], r["b"]), key=self.node_id.get)
+            methods = pairs.setdefault((a, b), [])
+            if r.get("method") is not None:
+                methods.append(r["method"])
+        totals = {}
+        for methods in pairs.values():
+            method = methods[0] if methods else None
+            totals[method] = totals.get(method, 0) + 1
+        return self.Result([{"method": m, "total": t} for m, t in totals.items()])
+
+NVD = [f"CVE-2024-{i:04d}" for i in range(5)]
+NESSUS = [f"cve-2024-{i:04d}" for i in range(5)]
+MATCHES = [{"kg1": NVD[i], "kg2": NESSUS[i], "method": m, "score": s}
+           for i, (m, s) in enumerate([("exact", 100.0), ("fuzzy", 95.0), ("embedding", 88.1)])]
+
+def test_write_same_as_is_idempotent():
+    graph = SameAsGraph(NVD, NESSUS)
+    rows = MATCHES + [{"kg1": "CVE-1999-0001", "kg2": NESSUS[4], "method": "fuzzy", "score": 91.0}]
+    counts, created = write_same_as(graph, rows, batch_size=2)
+    assert counts == {"created": 3, "existing": 0, "missing": 1}
+    assert created == MATCHES
+    assert graph.commits == 2
+
+    counts, created = write_same_as(graph, rows, batch_size=2)
+    assert counts == {"created": 0, "existing": 3, "missing": 1}
+    assert created == [] and len(graph.rels) == 3
+
+def test_existing_reverse_relation_is_kept():
+    graph = SameAsGraph(NVD, NESSUS)
+    graph.rels.append({"a": NESSUS[0], "b": NVD[0]})  # relation manuelle, sens inverse
+    counts, created = write_same_as(graph, MATCHES[:1])
+    assert counts["existing"] == 1 and created == []
+    assert graph.rels == [{"a": NESSUS[0], "b": NVD[0]}]
+
+def test_drop_same_as_is_idempotent_and_spares_manual_links():
+    graph = SameAsGraph(NVD, NESSUS)
+    write_same_as(graph, MATCHES)
+    graph.rels.append({"a": NVD[3], "b": NESSUS[3]})  # sans method : hors alignement
+    pairs = [{"kg1": m["kg1"], "kg2": m["kg2"]} for m in MATCHES[:2]] + [{"kg1": NVD[3], "kg2": NESSUS[3]}]
+    assert drop_same_as(graph, pairs) == 2
+    assert graph.changed == {NVD[0], NESSUS[0], NVD[1], NESSUS[1]}
+    assert drop_same_as(graph, pairs) == 0
+    assert [(r["a"], r["b"]) for r in graph.rels] == [(NVD[2], NESSUS[2]), (NVD[3], NESSUS[3])]
+
+def test_stats_count_each_pair_once():
+    graph = SameAsGraph(NVD, NESSUS)
+    write_same_as(graph, MATCHES)
+    # Même paire reliée aussi dans l'autre sens (import antérieur à l'alignement)
+    graph.rels.append({"a": NESSUS[1], "b": NVD[1], "method": "fuzzy"})
+    graph.rels.append({"a": NESSUS[4], "b": NVD[4]})
+    assert same_as_stats(graph) == (4, {"exact": 1, "fuzzy": 1, "embedding": 1, None: 1})
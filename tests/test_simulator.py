@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from graph_engine import GraphEngine
+from simulator import Scenario, SimState, add_risk_reduction, evaluate_many
+
+def small_graph(resolved=()):
+    # A : CVE-1 (réseau, CVSS 9) + CVE-2 (CVSS 5) ; B : CVE-2 vue par deux plugins ; C : finding résolu.
+    # A et B partagent le service www, B et C le port 22 ; le port 0 est un hub ignoré.
+    g = GraphEngine()
+    hosts = {h: g.add_node(("Host",), {"name": h}) for h in "ABC"}
+    plugins = {p: g.add_node(("Plugin",), {"plugin_id": p}) for p in ("10", "20", "30")}
+    c1 = g.add_node(("CVE",), {"name": "CVE-1", "cvss_score": 9.0, "attackVector": "NETWORK"})
+    c2 = g.add_node(("CVE",), {"name": "CVE-2", "cvss_score": 5.0, "attackVector": "LOCAL"})
+    for p, c in (("10", c1), ("20", c2), ("30", c2)):
+        g.table("DETECTS").add(plugins[p], c)
+    for h, p in (("A", "10"), ("A", "20"), ("B", "20"), ("B", "30"), ("C", "10")):
+        props = {"resolved_at": "t0"} if h == "C" or (h, p) in resolved else {}
+        g.table("HAS_PLUGIN").add(hosts[h], plugins[p], props)
+    www = g.add_node(("Service",), {"name": "www"})
+    ssh, hub = g.add_node(("Port",), {"port": "22"}), g.add_node(("Port",), {"port": "0"})
+    for h in "AB":
+        g.table("RUNS_SERVICE").add(hosts[h], www)
+        g.table("CONNECTED_TO").add(hosts[h], hub)
+    for h in "BC":
+        g.table("CONNECTED_TO").add(hosts[h], ssh)
+    return g
+
+def test_base_state_is_hand_computed():
+    state = SimState.from_engine(small_graph())
+    p_host, entry = state.apply(Scenario())
+    # p(CVE-1) = 0.9, p(CVE-2) = 0.5 ; A : 1 - 0.1 * 0.5
+    assert p_host == pytest.approx([0.95, 0.5, 0.0])
+    assert entry.tolist() == [True, False, False]
+    level, parent = state.reachability(p_host, entry)
+    assert level.tolist() == [0, 1, -1]
+    assert state.attack_path(parent, "B") == ["A", "B"]
+
+@pytest.mark.parametrize("patch", [["10"], ["20"], ["30"], ["20", "30"], ["10", "20", "30"]])
+def test_apply_delta_equals_rebuild(patch):
+    base = SimState.from_engine(small_graph())
+    resolved = {(h, p) for h in "AB" for p in patch}
+    rebuilt = SimState.from_engine(small_graph(resolved))
+    p_delta, entry_delta = base.apply(Scenario("patch", patch=patch))
+    p_full, entry_full = rebuilt.apply(Scenario())
+    assert p_delta == pytest.approx(p_full)
+    assert np.array_equal(entry_delta, entry_full)
+
+def test_patch_and_isolate_hand_computed():
+    state = SimState.from_engine(small_graph())
+    # B reste exposé à CVE-2 par le plugin 30
+    p_host, _ = state.apply(Scenario(patch=["20"]))
+    assert p_host == pytest.approx([0.9, 0.5, 0.0])
+    p_host, entry = state.apply(Scenario(isolate=["B"]))
+    assert p_host == pytest.approx([0.95, 0.0, 0.0])
+    assert state.reachability(p_host, entry)[0].tolist() == [0, -1, -1]
+
+def test_no_op_scenario_has_no_risk_reduction():
+    state = SimState.from_engine(small_graph())
+    baseline, *results = evaluate_many(state, [Scenario(), Scenario("noop", patch=["999"], isolate=["Z"]),
+                                               Scenario("patch", patch=["10"])], trials=200, workers=1, seed=7)
+    add_risk_reduction(baseline, results)
+    assert results[0]["risk_reduction"] == 0
+    assert results[1]["risk_reduction"] > 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+from kg_triples import NegativeSampler, TriplesSnapshot
+from train_rotate import CONFIG, plan, training_indices
+
+def export(snapshot, triples):
+    heads, rels, tails = zip(*triples)
+    return snapshot.update([snapshot.encode(heads, rels, tails)])
+
+def first_triples(n):
+    return [(f"h{k}", f"r{k % 2}", f"t{k}") for k in range(n)]
+
+def test_interrupted_full_run_resumes_on_its_own_triples(tmp_path):
+    snapshot = TriplesSnapshot(str(tmp_path))
+    export(snapshot, first_triples(20))
+    state = plan(snapshot, None, CONFIG)
+    before = training_indices(snapshot, state, CONFIG)
+    order = NegativeSampler(snapshot.triples, snapshot.n_entities, snapshot.n_relations, 4, 2,
+                            indices=before, seed=1)._order(0)
+    state.update(batch=3, n_train=len(before))
+
+    # Export pendant l'interruption : nouveaux triplets, nouvelles entités
+    export(snapshot, first_triples(20) + [("x", "r9", "y"), ("h1", "r0", "y")])
+    ckpt = {**state, "n_entities": 40, "n_relations": 2}
+    resumed = plan(snapshot, ckpt, CONFIG)
+    assert resumed == state
+    after = training_indices(snapshot, resumed, CONFIG)
+    assert len(after) == resumed["n_train"]
+    again = NegativeSampler(snapshot.triples, 40, 2, 4, 2, indices=after, seed=1)._order(0)
+    assert np.array_equal(np.asarray(snapshot.triples)[again], np.asarray(snapshot.triples)[order])
+
+def test_finetune_after_done_covers_triples_added_during_the_full_run(tmp_path):
+    snapshot = TriplesSnapshot(str(tmp_path))
+    export(snapshot, first_triples(20))
+    state = {**plan(snapshot, None, CONFIG), "done": True, "n_train": 20}
+    export(snapshot, first_triples(25))
+    finetune = plan(snapshot, {**state, "n_entities": 40, "n_relations": 2}, CONFIG)
+    assert finetune["phase"] == "finetune" and finetune["n_train"] is None
+    indices = training_indices(snapshot, finetune, CONFIG)
+    assert set(snapshot.since(state["generation"]).tolist()) <= set(indices.tolist())